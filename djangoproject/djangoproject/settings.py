@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +39,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # Achtergrondtaken (exports, e-mails)
+    "django_q",
     # Local apps
     "time_reg_web",
 
@@ -45,10 +49,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    # Telt de queries per request (zie time_reg_web.query_budget); staat aan met
+    # QUERY_BUDGET_ENABLED
+    "time_reg_web.query_budget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Zet request.tenant (zie time_reg_web.middleware)
+    "time_reg_web.middleware.TenantMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -89,6 +98,53 @@ DATABASES = {
         "PORT": "5432",
     }
 }
+# Connection pool (psycopg_pool): verbindingen worden hergebruikt in plaats van per
+# request geopend. Enkel dan voert time_reg_web.concurrency de laders gelijktijdig uit;
+# een paginalading leent zo tot vier verbindingen tegelijk. Standaard aan; zet
+# DATABASE_POOL=False achter een externe pooler in transaction mode (bv. PgBouncer).
+if os.environ.get("DATABASE_POOL", "True").lower() == "true":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": 2,
+            "max_size": int(os.environ.get("DATABASE_POOL_MAX_SIZE", "10")),
+        }
+    }
+
+
+# Cache (zie time_reg_web.caching), te kiezen met CACHE_BACKEND:
+# - db:     tabel CACHE_LOCATION in PostgreSQL (standaard, aangemaakt door migratie
+#           0025); voor meerdere processen of hosts
+# - file:   bestanden in CACHE_LOCATION (standaard op het gedeelde media-volume);
+#           voor meerdere processen op dezelfde host
+# - locmem: in het geheugen van het proces; enkel met DEBUG (één proces, lokaal)
+# De web- en de worker-container moeten dezelfde cache zien: de generaties van
+# `caching` leven in de cache, dus met locmem ziet een proces de wijzigingen van de
+# andere niet.
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "db": "django.core.cache.backends.db.DatabaseCache",
+}
+CACHE_DEFAULT_LOCATIONS = {
+    "locmem": "eventaflow",
+    "file": str(BASE_DIR / "media" / "cache"),
+    "db": "django_cache",
+}
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "db")
+if CACHE_BACKEND == "locmem" and not DEBUG:
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND=locmem is niet gedeeld tussen de processen; gebruik db of file"
+    )
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION", CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND])
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": CACHE_LOCATION,
+        "TIMEOUT": 3600,
+        "KEY_PREFIX": "eventaflow",
+    }
+}
 
 
 # Password validation
@@ -132,6 +188,10 @@ STATICFILES_DIRS = [
     BASE_DIR / "time_reg_web" / "static",
 ]
 
+# Gegenereerde bestanden (o.a. exports van achtergrondtaken)
+MEDIA_URL = "/media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
 # Authentication settings
 LOGIN_REDIRECT_URL = "eventaflow:select_company"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
@@ -164,6 +224,63 @@ USE_X_FORWARDED_PORT = True
 # Set this in your deployment environment as APP_API_KEY
 APP_API_KEY = os.environ.get("APP_API_KEY", "")
 
+# django-q cluster voor achtergrondtaken (start met: python manage.py qcluster)
+# De database doet dienst als broker, zodat er geen extra service nodig is.
+Q_CLUSTER = {
+    "name": "eventaflow",
+    "orm": "default",
+    "workers": int(os.environ.get("Q_WORKERS", "2")),
+    "timeout": 3600,
+    "retry": 3700,
+    "max_attempts": 1,
+    "catch_up": False,
+}
+
+# Hoe lang een afgewerkte export beschikbaar blijft voor download
+EXPORT_JOB_TTL_HOURS = int(os.environ.get("EXPORT_JOB_TTL_HOURS", "24"))
+
+# Gecachte exportbestanden (zie time_reg_web.export_cache); niet publiek geserveerd
+EXPORT_CACHE_DIR = os.environ.get("EXPORT_CACHE_DIR", str(MEDIA_ROOT / "export_cache"))
+EXPORT_CACHE_TTL_HOURS = int(os.environ.get("EXPORT_CACHE_TTL_HOURS", "24"))
+
+# Hoe lang (in seconden) een samenvatting van de uren gecachet blijft
+SUMMARY_CACHE_TIMEOUT = int(os.environ.get("SUMMARY_CACHE_TIMEOUT", "3600"))
+
+# Hoe lang (in seconden) de burn-down van een project gecachet blijft; ze wordt bij
+# elke wijziging bijgewerkt, de timeout begrenst enkel hoe lang een fout kan blijven
+BURNDOWN_CACHE_TIMEOUT = int(os.environ.get("BURNDOWN_CACHE_TIMEOUT", "86400"))
+
+# Aantal maanden waarvoor de partities van de tijdregistraties vooraf bestaan
+TIMEREGISTRY_PARTITION_MONTHS_AHEAD = int(
+    os.environ.get("TIMEREGISTRY_PARTITION_MONTHS_AHEAD", "3")
+)
+
+# Wijzigingsfeed van de tijdregistraties (zie time_reg_web.changes): hoe lang
+# verwijderingen gemeld worden, en hoeveel seconden de feed achter de klok blijft
+# zodat wijzigingen van nog lopende transacties niet overgeslagen worden
+TIME_ENTRY_TOMBSTONE_DAYS = int(os.environ.get("TIME_ENTRY_TOMBSTONE_DAYS", "90"))
+TIME_ENTRY_CHANGES_LAG_SECONDS = int(os.environ.get("TIME_ENTRY_CHANGES_LAG_SECONDS", "60"))
+
+# Live-updates via server-sent events (zie time_reg_web.live), te kiezen met
+# LIVE_EVENTS_BACKEND: memory (één proces) of postgres (LISTEN/NOTIFY, voor meerdere
+# workers of nodes)
+LIVE_EVENTS_BACKENDS = {
+    "memory": "time_reg_web.live.InProcessBroker",
+    "postgres": "time_reg_web.live.PostgresBroker",
+}
+LIVE_EVENTS_BACKEND = os.environ.get("LIVE_EVENTS_BACKEND", "memory")
+# Om de hoeveel seconden een stilstaande stream een keepalive stuurt
+LIVE_EVENTS_HEARTBEAT_SECONDS = int(os.environ.get("LIVE_EVENTS_HEARTBEAT_SECONDS", "25"))
+
+# Querybudget per view (zie time_reg_web.query_budget): standaard enkel met DEBUG.
+# QUERY_BUDGET_RAISE laat een request boven het budget falen (voor tests en CI).
+QUERY_BUDGET_ENABLED = os.environ.get("QUERY_BUDGET_ENABLED", str(DEBUG)).lower() == "true"
+QUERY_BUDGET_RAISE = os.environ.get("QUERY_BUDGET_RAISE", "False").lower() == "true"
+# Budget van een view zonder eigen budget
+QUERY_BUDGET_DEFAULT = int(os.environ.get("QUERY_BUDGET_DEFAULT", "20"))
+# Vanaf hoeveel keer dezelfde query in één request als N+1 gemeld wordt
+QUERY_BUDGET_REPEAT_LIMIT = int(os.environ.get("QUERY_BUDGET_REPEAT_LIMIT", "5"))
+
 # Initialize structured logging (Loguru)
 try:
     # Preferred: absolute package import
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Benchmark: facturatieregels toepassen op een groot aantal registraties.
+
+Vergelijkt de gevectoriseerde evaluatie (NumPy) met een gewone Python-lus per
+registratie, op willekeurige duurtijden, klanten, gebruikers en dagen:
+
+- afronding en minimum (`billing.PolicySet.round`);
+- de daglimiet per dag, gebruiker en klant (`billing.apply_caps`).
+
+Er is geen database nodig: de regels worden rechtstreeks opgebouwd.
+
+Usage:
+  python3 scripts/benchmark_billing.py
+  python3 scripts/benchmark_billing.py --entries 1000000 --customers 200 --repeat 5
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangoproject.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+import numpy as np  # noqa: E402
+
+from time_reg_web.billing import DEFAULT_POLICY, Policy, PolicySet, apply_caps  # noqa: E402
+from time_reg_web.models import BillingPolicy  # noqa: E402
+
+
+def build_policies(customers, rng, daily_cap=0):
+    """Eén op vier klanten krijgt een eigen regel (naar boven, 15 min, minimum 30 min)."""
+    special = rng.choice(customers, size=customers // 4, replace=False) + 1
+    default = DEFAULT_POLICY._replace(daily_cap=daily_cap)
+    special_policy = Policy(BillingPolicy.ROUND_UP, 900, 1800, daily_cap)
+    return PolicySet(default, {int(c): special_policy for c in special})
+
+
+def round_loop(policies, seconds, customer_ids):
+    """Referentie: dezelfde regels, één registratie per keer."""
+    result = []
+    for value, customer_id in zip(seconds, customer_ids):
+        policy = policies.policy(customer_id)
+        steps = value / policy.increment
+        if policy.rounding == BillingPolicy.ROUND_UP:
+            steps = math.ceil(steps)
+        elif policy.rounding == BillingPolicy.ROUND_DOWN:
+            steps = math.floor(steps)
+        else:
+            steps = math.floor(steps + 0.5)
+        rounded = max(steps * policy.increment, policy.minimum) if value > 0 else 0
+        result.append(int(rounded))
+    return result
+
+
+def caps_loop(policies, rounded, days, user_ids, customer_ids):
+    """Referentie: totaal per (dag, gebruiker, klant) in een dict, dan per registratie."""
+    keys = list(zip(days, user_ids, customer_ids))
+    totals = {}
+    for key, value in zip(keys, rounded):
+        totals[key] = totals.get(key, 0) + value
+    result = []
+    for key, value in zip(keys, rounded):
+        cap, total = policies.policy(key[2]).daily_cap, totals[key]
+        factor = cap / total if cap and total > cap else 1.0
+        result.append(math.floor(value * factor + 0.5))
+    return result
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare(label, vectorized, loop, repeat):
+    vectorized_time, result = timed(vectorized, repeat)
+    loop_time, expected = timed(loop, 1)
+    if result.tolist() != expected:
+        print(f"{label}: resultaten verschillen tussen NumPy en de Python-lus!", file=sys.stderr)
+        sys.exit(1)
+    print(f"{label}")
+    print(f"  NumPy:       {vectorized_time * 1000:9.1f} ms")
+    print(f"  Python-lus:  {loop_time * 1000:9.1f} ms")
+    print(f"  Versnelling: {loop_time / vectorized_time:9.1f}x")
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark van de facturatieregels")
+    p.add_argument("--entries", type=int, default=1_000_000, help="Aantal registraties")
+    p.add_argument("--customers", type=int, default=200, help="Aantal klanten")
+    p.add_argument("--users", type=int, default=50, help="Aantal gebruikers")
+    p.add_argument("--days", type=int, default=365, help="Aantal dagen")
+    p.add_argument("--daily-cap", type=float, default=8, help="Daglimiet in uren")
+    p.add_argument("--repeat", type=int, default=3, help="Aantal herhalingen (beste telt)")
+    p.add_argument("--seed", type=int, default=42, help="Seed voor de willekeurige data")
+    args = p.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    seconds = rng.integers(0, 8 * 3600, size=args.entries)
+    customer_ids = rng.integers(1, args.customers + 1, size=args.entries)
+    user_ids = rng.integers(1, args.users + 1, size=args.entries)
+    days = rng.integers(0, args.days, size=args.entries) + date(2025, 1, 1).toordinal()
+    policies = build_policies(args.customers, rng, daily_cap=int(args.daily_cap * 3600))
+    seconds_list, customers_list = seconds.tolist(), customer_ids.tolist()
+
+    print(
+        f"{args.entries:,} registraties, {args.customers} klanten, {args.users} gebruikers, "
+        f"{args.days} dagen"
+    )
+    rounded = compare(
+        "Afronding en minimum",
+        lambda: policies.round(seconds, customer_ids),
+        lambda: round_loop(policies, seconds_list, customers_list),
+        args.repeat,
+    )
+    rounded_list, days_list, users_list = rounded.tolist(), days.tolist(), user_ids.tolist()
+    compare(
+        f"Daglimiet ({args.daily_cap:g} uur)",
+        lambda: apply_caps(policies, rounded, days, user_ids, customer_ids),
+        lambda: caps_loop(policies, rounded_list, days_list, users_list, customers_list),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,25 @@
 
 from django.contrib import admin
 
-from .models import Company, Customer, Project, TimeRegistry, UserProfile
+from .models import BillingPolicy, Company, Customer, Project, TimeRegistry, UserProfile
+
+
+class UnscopedModelAdmin(admin.ModelAdmin):
+    """Admin die de rijen en keuzelijsten van alle bedrijven toont (zie `managers`)."""
+
+    def get_queryset(self, request):
+        manager = getattr(self.model, "unscoped", self.model._default_manager)
+        queryset = manager.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Ook de keuzelijsten (klant, project, ...) over alle bedrijven heen
+        if "queryset" not in kwargs and hasattr(db_field.related_model, "unscoped"):
+            kwargs["queryset"] = db_field.related_model.unscoped.all()
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(Company)
@@ -17,31 +35,51 @@ class CompanyAdmin(admin.ModelAdmin):
 class UserProfileAdmin(admin.ModelAdmin):
     """Admin interface for UserProfile model."""
 
+    list_select_related = ("user", "company")
     list_display = ("user", "company", "is_company_admin")
     list_filter = ("company", "is_company_admin")
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(UnscopedModelAdmin):
     """Admin interface for Customer model."""
 
+    list_select_related = ("company",)
     list_display = ("customer_name", "company")
     list_filter = ("company",)
     search_fields = ("name",)
 
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(UnscopedModelAdmin):
     """Admin interface for Project model."""
 
+    list_select_related = ("customer", "company")
     list_display = ("project_name", "customer", "company")
     list_filter = ("company", "customer")
     search_fields = ("name",)
 
 
 @admin.register(TimeRegistry)
-class TimeRegistryAdmin(admin.ModelAdmin):
+class TimeRegistryAdmin(UnscopedModelAdmin):
     """Admin interface for TimeRegistry model."""
 
+    list_select_related = ("user", "project", "company")
     list_display = ("user", "project", "start_time", "end_time", "company")
     list_filter = ("company", "user", "start_time")
+
+
+@admin.register(BillingPolicy)
+class BillingPolicyAdmin(UnscopedModelAdmin):
+    """Admin interface for BillingPolicy model."""
+
+    list_select_related = ("company", "customer")
+    list_display = (
+        "company",
+        "customer",
+        "rounding",
+        "increment_minutes",
+        "minimum_minutes",
+        "daily_cap_hours",
+    )
+    list_filter = ("company", "rounding")
@@ -5,3 +5,19 @@ from django.apps import AppConfig
 
 class TimeRegWebConfig(AppConfig):
     name = "time_reg_web"
+
+    def ready(self):
+        # Signalen die de dagtotalen (DailyTimeRollup) bijwerken
+        from . import rollups  # noqa: F401
+
+        # Signalen die de cache-generaties per bedrijf verhogen (samenvattingen, exports)
+        from . import caching  # noqa: F401
+
+        # Signalen die de gecachte keuzelijsten ongeldig maken bij een wijziging van de leden
+        from . import reference  # noqa: F401
+
+        # Signalen die verwijderde registraties bijhouden voor de wijzigingsfeed
+        from . import changes  # noqa: F401
+
+        # Signalen die timer- en taakwijzigingen live publiceren
+        from . import live  # noqa: F401
@@ -0,0 +1,303 @@
+"""Facturatieregels: afronding, minimumblok en daglimiet, over hele reeksen tegelijk.
+
+De regels (`BillingPolicy`) gelden per bedrijf, met uitzonderingen per klant:
+
+- rounding: naar dichtstbijzijnde, naar boven of naar beneden, op een veelvoud van
+  `increment_minutes` (standaard: dichtstbijzijnde 5 minuten);
+- minimum_minutes: elke registratie met een duur telt minstens zoveel minuten;
+- daily_cap_hours: per gebruiker, dag en klant wordt nooit meer gefactureerd. Boven
+  de limiet worden alle registraties van die groep evenredig verlaagd, zodat het
+  resultaat niet afhangt van de volgorde of van hoe er later gegroepeerd wordt.
+
+Afronding en minimum gelden per registratie: `PolicySet.round` berekent ze met NumPy
+voor een volledige reeks duurtijden in één keer, nooit rij per rij. De daglimiet
+hangt af van een hele dag en wordt in de dagtotalen bijgehouden: `rounded_seconds`
+is de som van de afgeronde registraties, `billed_seconds` die na de daglimiet (zie
+`apply_daily_caps`). Samenvattingen en projecttotalen sommeren `billed_seconds`;
+exports en de API rekenen per registratie met `BillingEngine`.
+"""
+
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ROUNDING_SECONDS, BillingPolicy, DailyTimeRollup
+
+ROUNDING_CODES = {
+    BillingPolicy.ROUND_NEAREST: 0,
+    BillingPolicy.ROUND_UP: 1,
+    BillingPolicy.ROUND_DOWN: 2,
+}
+
+# Alle waarden in seconden; een daglimiet van 0 betekent geen limiet
+Policy = namedtuple("Policy", ["rounding", "increment", "minimum", "daily_cap"])
+
+DEFAULT_POLICY = Policy(BillingPolicy.ROUND_NEAREST, ROUNDING_SECONDS, 0, 0)
+
+
+def policy_from_model(policy):
+    return Policy(
+        policy.rounding,
+        policy.increment_minutes * 60,
+        policy.minimum_minutes * 60,
+        int(policy.daily_cap_hours * 3600) if policy.daily_cap_hours else 0,
+    )
+
+
+class PolicySet:
+    """De regels van één bedrijf als arrays, geïndexeerd per klant.
+
+    Index 0 is de regel van het bedrijf; klanten met een eigen regel krijgen een
+    eigen index. Zo wordt voor elke registratie de juiste regel opgezocht met één
+    `searchsorted` over de hele reeks.
+    """
+
+    def __init__(self, default=DEFAULT_POLICY, by_customer=None):
+        self.default = default
+        self.by_customer = by_customer or {}
+        customer_ids = sorted(self.by_customer)
+        policies = [default] + [self.by_customer[customer_id] for customer_id in customer_ids]
+
+        self.customer_ids = np.array(customer_ids, dtype=np.int64)
+        self._modes = np.array([ROUNDING_CODES[p.rounding] for p in policies], dtype=np.int8)
+        self._increments = np.array([p.increment for p in policies], dtype=np.float64)
+        self._minimums = np.array([p.minimum for p in policies], dtype=np.float64)
+        self._caps = np.array([p.daily_cap for p in policies], dtype=np.float64)
+
+    @classmethod
+    def for_company(cls, company_id):
+        default, by_customer = DEFAULT_POLICY, {}
+        for policy in BillingPolicy.objects.filter(company_id=company_id):
+            if policy.customer_id is None:
+                default = policy_from_model(policy)
+            else:
+                by_customer[policy.customer_id] = policy_from_model(policy)
+        return cls(default, by_customer)
+
+    def policy(self, customer_id):
+        """De regel (`Policy`) die voor een klant geldt."""
+        return self.by_customer.get(customer_id, self.default)
+
+    @property
+    def has_caps(self):
+        return bool(self._caps.any())
+
+    def _index(self, customer_ids):
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        if not len(self.customer_ids):
+            return np.zeros(len(customer_ids), dtype=np.intp)
+        positions = np.minimum(
+            np.searchsorted(self.customer_ids, customer_ids), len(self.customer_ids) - 1
+        )
+        return np.where(self.customer_ids[positions] == customer_ids, positions + 1, 0)
+
+    def round(self, seconds, customer_ids):
+        """Afgeronde duur per registratie (afronding en minimum) als int64-array.
+
+        `seconds` zijn hele seconden; 0 (of een lopende timer) blijft 0.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        index = self._index(customer_ids)
+        increment = self._increments[index]
+        mode = self._modes[index]
+
+        steps = seconds / increment
+        steps = np.where(
+            mode == 1, np.ceil(steps), np.where(mode == 2, np.floor(steps), np.floor(steps + 0.5))
+        )
+        rounded = np.maximum(steps * increment, self._minimums[index])
+        return np.where(seconds > 0, rounded, 0).astype(np.int64)
+
+    def caps(self, customer_ids):
+        """Daglimiet in seconden per element van `customer_ids` (0 = geen limiet)."""
+        return self._caps[self._index(customer_ids)]
+
+
+def cap_factors(totals, caps):
+    """Verhouding gefactureerd/afgerond: 1, of limiet/totaal als de groep erboven zit."""
+    totals = np.asarray(totals, dtype=np.float64)
+    caps = np.asarray(caps, dtype=np.float64)
+    over = (caps > 0) & (totals > caps)
+    return np.where(over, caps / np.where(over, totals, 1.0), 1.0)
+
+
+def group_keys(*columns):
+    """De verschillende combinaties van de (gehele) kolommen en het groepsnummer per rij.
+
+    Geeft (sleutels, groep): `sleutels[groep[i]]` is de combinatie van rij i.
+    """
+    columns = [np.asarray(column, dtype=np.int64) for column in columns]
+    # Kolom per kolom samenvoegen tot één groepsnummer; na elke stap hernummerd, zodat
+    # het getal nooit groter wordt dan (aantal rijen)²
+    group = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        values, codes = np.unique(column, return_inverse=True)
+        _, first, group = np.unique(
+            group * len(values) + codes.reshape(-1), return_index=True, return_inverse=True
+        )
+        group = group.reshape(-1)
+    keys = np.stack([column[first] for column in columns], axis=1)
+    return keys, group
+
+
+def group_index(*columns):
+    """Groepsnummer per rij voor de combinatie van de (gehele) kolommen."""
+    return group_keys(*columns)[1]
+
+
+def apply_caps(policies, rounded, days, user_ids, customer_ids):
+    """Gefactureerde seconden per registratie of dagtotaal na de daglimiet (int64-array).
+
+    `rounded` zijn de afgeronde seconden, `days` dagnummers (`date.toordinal`); de
+    limiet geldt per groep (dag, gebruiker, klant).
+    """
+    rounded = np.asarray(rounded, dtype=np.float64)
+    group = group_index(days, user_ids, customer_ids)
+    totals = np.bincount(group, weights=rounded)[group]
+    billed = np.floor(rounded * cap_factors(totals, policies.caps(customer_ids)) + 0.5)
+    return billed.astype(np.int64)
+
+
+def apply_daily_caps(
+    company_id, policies=None, days=None, user_ids=None, start_date=None, end_date=None
+):
+    """Herberekent `billed_seconds` van de dagtotalen van een bedrijf.
+
+    Beperk met `days` en `user_ids` (na een wijziging) of met een periode (na een
+    herberekening); een groep (dag, gebruiker, klant) wordt altijd volledig geladen.
+    Geeft het aantal bijgewerkte rijen terug.
+    """
+    if policies is None:
+        policies = PolicySet.for_company(company_id)
+
+    rollups = DailyTimeRollup.objects.filter(company_id=company_id)
+    if days is not None:
+        rollups = rollups.filter(day__in=days)
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+    if start_date:
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(day__lte=end_date)
+
+    if not policies.has_caps:
+        return rollups.exclude(billed_seconds=F("rounded_seconds")).update(
+            billed_seconds=F("rounded_seconds")
+        )
+
+    rows = list(
+        rollups.values_list(
+            "id", "day", "user_id", "project__customer_id", "rounded_seconds", "billed_seconds"
+        )
+    )
+    if not rows:
+        return 0
+    ids, days, users, customers, rounded, billed = zip(*rows)
+    new_billed = apply_caps(policies, rounded, [day.toordinal() for day in days], users, customers)
+
+    changed = np.flatnonzero(new_billed != np.array(billed, dtype=np.int64))
+    DailyTimeRollup.objects.bulk_update(
+        [DailyTimeRollup(id=ids[i], billed_seconds=int(new_billed[i])) for i in changed],
+        ["billed_seconds"],
+        batch_size=1000,
+    )
+    return len(changed)
+
+
+class BillingEngine:
+    """Gefactureerde duur van afzonderlijke registraties (exports, API, lijsten).
+
+    Houdt de regels per bedrijf en de daglimiet-verhoudingen per (dag, gebruiker,
+    klant) bij, zodat een export in brokken niet per brok opnieuw moet opzoeken.
+    De verhoudingen komen uit de dagtotalen, die de volledige dag kennen, ook als
+    de registraties zelf gefilterd zijn (bv. op één project).
+    """
+
+    def __init__(self):
+        self._policies = {}
+        self._factors = {}
+        self._loaded_days = set()
+
+    def policies(self, company_id):
+        if company_id not in self._policies:
+            self._policies[company_id] = PolicySet.for_company(company_id)
+        return self._policies[company_id]
+
+    def _load_factors(self, company_id, days):
+        missing = {day for day in days if (company_id, day) not in self._loaded_days}
+        if not missing:
+            return
+        groups = (
+            DailyTimeRollup.objects.filter(company_id=company_id, day__in=missing)
+            .values("day", "user_id", "project__customer_id")
+            .annotate(rounded=Sum("rounded_seconds"), billed=Sum("billed_seconds"))
+            .order_by()
+        )
+        for group in groups:
+            if group["rounded"] and group["billed"] != group["rounded"]:
+                key = (
+                    company_id,
+                    group["day"].toordinal(),
+                    group["user_id"],
+                    group["project__customer_id"],
+                )
+                self._factors[key] = group["billed"] / group["rounded"]
+        self._loaded_days.update((company_id, day) for day in missing)
+
+    def billed_seconds(self, company_ids, customer_ids, user_ids, days, seconds):
+        """Gefactureerde seconden per registratie als float-array.
+
+        Alle argumenten zijn even lange reeksen; `days` zijn lokale datums en een
+        duur van None (lopende timer) telt als 0.
+        """
+        company_ids = np.asarray(company_ids, dtype=np.int64)
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        seconds = np.array([value or 0 for value in seconds], dtype=np.float64)
+        billed = np.zeros(len(seconds), dtype=np.float64)
+
+        for company_id in np.unique(company_ids).tolist():
+            mask = company_ids == company_id
+            policies = self.policies(company_id)
+            rounded = policies.round(seconds[mask], customer_ids[mask]).astype(np.float64)
+            if policies.has_caps:
+                rounded *= self._cap_factors(company_id, days, user_ids, customer_ids, mask)
+            billed[mask] = rounded
+        return billed
+
+    def _cap_factors(self, company_id, days, user_ids, customer_ids, mask):
+        """Daglimiet-verhouding per registratie: één opzoeking per (dag, gebruiker, klant)."""
+        positions = np.flatnonzero(mask)
+        ordinals = np.array([days[i].toordinal() for i in positions], dtype=np.int64)
+        users = np.asarray(user_ids, dtype=np.int64)[mask]
+        keys, group = group_keys(ordinals, users, customer_ids[mask])
+
+        group_days = {date.fromordinal(day) for day in np.unique(keys[:, 0]).tolist()}
+        self._load_factors(company_id, group_days)
+        factors = np.array(
+            [self._factors.get((company_id, *key), 1.0) for key in keys.tolist()],
+            dtype=np.float64,
+        )
+        return factors[group]
+
+    def annotate(self, entries):
+        """Zet `billed_hours` op een lijst TimeRegistry-objecten (met project geladen)."""
+        entries = list(entries)
+        if not entries:
+            return entries
+        seconds = [
+            int((entry.end_time - entry.start_time).total_seconds()) if entry.end_time else None
+            for entry in entries
+        ]
+        billed = self.billed_seconds(
+            [entry.company_id for entry in entries],
+            [entry.project.customer_id for entry in entries],
+            [entry.user_id for entry in entries],
+            [timezone.localdate(entry.start_time) for entry in entries],
+            seconds,
+        )
+        for entry, value in zip(entries, billed.tolist()):
+            entry.billed_hours = round(value / 3600, 2)
+        return entries
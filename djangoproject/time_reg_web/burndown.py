@@ -0,0 +1,109 @@
+"""Budget en burn-down van projecten: cumulatief gefactureerde uren per dag.
+
+De reeks komt uit de dagtotalen (DailyTimeRollup), niet uit de registraties, met
+een window-functie in SQL:
+
+    SUM(billed_seconds) OVER (ORDER BY day)
+
+Ze wordt per project gecachet. Wijzigen de dagtotalen van een project (een
+registratie wordt afgesloten, gewijzigd of verwijderd), dan wordt enkel het stuk
+vanaf de vroegste gewijzigde dag opnieuw berekend en achter het ongewijzigde begin
+van de gecachte reeks geplakt (`refresh_burndown`, na de commit). Na een volledige
+herberekening van de dagtotalen vervalt de reeks (`invalidate_burndown`).
+
+Het budget zelf zit niet in de cache: de resterende uren worden bij het opvragen
+berekend, zodat een gewijzigd budget meteen zichtbaar is.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum, Window
+
+from .models import DailyTimeRollup
+
+CACHE_NAMESPACE = "burndown"
+
+
+def _cache_key(project_id):
+    return f"{CACHE_NAMESPACE}:{project_id}"
+
+
+def _compute(project_id, since=None, offset=0):
+    """[dag (iso), seconden, cumulatief] per dag met uren, vanaf `since`."""
+    rollups = DailyTimeRollup.objects.filter(project_id=project_id)
+    if since:
+        rollups = rollups.filter(day__gte=since)
+    points = (
+        rollups.annotate(
+            day_seconds=Window(Sum("billed_seconds"), partition_by=F("day")),
+            cumulative=Window(Sum("billed_seconds"), order_by=F("day").asc()),
+        )
+        .values_list("day", "day_seconds", "cumulative")
+        .distinct()
+        .order_by("day")
+    )
+    return [[day.isoformat(), seconds, offset + cumulative] for day, seconds, cumulative in points]
+
+
+def burndown_series(project_id):
+    """De gecachte reeks van een project; bij een cache-miss één query."""
+    key = _cache_key(project_id)
+    series = cache.get(key)
+    if series is None:
+        series = _compute(project_id)
+        cache.set(key, series, timeout=settings.BURNDOWN_CACHE_TIMEOUT)
+    return series
+
+
+def refresh_burndown(project_id, since):
+    """Berekent de gecachte reeks opnieuw vanaf dag `since`; het begin blijft staan.
+
+    Zonder gecachte reeks gebeurt er niets: de volgende aanvraag berekent ze volledig.
+    """
+    key = _cache_key(project_id)
+    series = cache.get(key)
+    if series is None:
+        return
+    since = since.isoformat()
+    prefix = [point for point in series if point[0] < since]
+    offset = prefix[-1][2] if prefix else 0
+    cache.set(
+        key, prefix + _compute(project_id, since, offset), timeout=settings.BURNDOWN_CACHE_TIMEOUT
+    )
+
+
+def invalidate_burndown(project_ids):
+    cache.delete_many([_cache_key(project_id) for project_id in project_ids])
+
+
+def _hours(seconds):
+    return round(seconds / 3600, 2)
+
+
+def project_burn(project):
+    """Budget, verbruikte en resterende uren van een project, met de reeks per dag.
+
+    Zonder budget zijn de resterende uren en het percentage None.
+    """
+    series = burndown_series(project.pk)
+    budget = float(project.budget_hours) if project.budget_hours is not None else None
+    burned = _hours(series[-1][2]) if series else 0.0
+
+    def remaining(hours):
+        return round(budget - hours, 2) if budget is not None else None
+
+    return {
+        "budget_hours": budget,
+        "burned_hours": burned,
+        "remaining_hours": remaining(burned),
+        "burned_percent": round(burned / budget * 100, 1) if budget else None,
+        "series": [
+            {
+                "day": day,
+                "hours": _hours(seconds),
+                "burned_hours": _hours(cumulative),
+                "remaining_hours": remaining(_hours(cumulative)),
+            }
+            for day, seconds, cumulative in series
+        ],
+    }
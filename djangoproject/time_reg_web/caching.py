@@ -0,0 +1,136 @@
+"""Cache per bedrijf, ongeldig gemaakt via generatietellers per model.
+
+Elk bedrijf heeft per model een generatieteller in de cache. post_save en
+post_delete van de modellen in `GENERATION_MODELS` verhogen na de commit de teller
+van het bedrijf van de instantie. Een gecacht resultaat vermeldt van welke modellen
+het afhangt; de sleutel bevat de huidige generaties daarvan. Wijzigt er iets, dan
+verandert de sleutel en wordt het oude resultaat nooit meer gelezen; het verloopt
+vanzelf uit de cache. Een view kan dus cachen zonder eigen invalidatie:
+
+    projects = cached_for_tenant(
+        company.pk, "dashboard-projects", [Project, Customer], lambda: list(...)
+    )
+
+bulk_create, bulk_update en QuerySet.update() versturen geen signalen; wie die
+gebruikt, verhoogt de generatie zelf met `bump_generation` (zie imports, timesheets
+en rollups, dat ook de generatie van DailyTimeRollup bijhoudt).
+
+De cache is de `default` uit CACHES (settings: CACHE_BACKEND). Draait de app in meer
+dan één proces (gunicorn-workers, de django-q worker), dan moet dat een gedeelde
+cache zijn (file of db): anders ziet een proces de verhoogde generaties van een
+ander proces niet.
+"""
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import BillingPolicy, Customer, Divisies, Milstones, Project, TimeRegistry, Todo
+
+# Modellen waarvan de signalen de generatie van het bedrijf verhogen
+GENERATION_MODELS = (
+    Customer,
+    Project,
+    Divisies,
+    Todo,
+    Milstones,
+    TimeRegistry,
+    BillingPolicy,
+)
+
+_MISSING = object()
+
+
+def _generation_key(company_id, model):
+    return f"tenant:{company_id}:generation:{model._meta.label_lower}"
+
+
+def _new_generation():
+    # Tijdsgebaseerd, zodat een uit de cache verdwenen teller nooit een oude terugbrengt
+    return time.time_ns()
+
+
+def get_generations(company_id, models):
+    """De huidige generatie van elk model voor een bedrijf, in dezelfde volgorde."""
+    keys = [_generation_key(company_id, model) for model in models]
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # add() zodat een gelijktijdig verhoogde teller niet overschreven wordt
+        for key in missing:
+            cache.add(key, _new_generation(), timeout=None)
+        generations.update(cache.get_many(missing))
+    return [generations.get(key) for key in keys]
+
+
+def bump_generation(company_id, model):
+    """Maakt alle gecachte resultaten van een bedrijf die van `model` afhangen ongeldig."""
+    key = _generation_key(company_id, model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Teller bestaat (nog) niet: een nieuwe generatie verschilt sowieso van de vorige
+        cache.add(key, _new_generation(), timeout=None)
+
+
+def bump_generation_on_commit(company_id, model):
+    """Zelfde als `bump_generation`, maar pas na de commit van de huidige transactie.
+
+    Anders kan een gelijktijdige request nog de oude gegevens onder de nieuwe
+    generatie cachen.
+    """
+    transaction.on_commit(lambda: bump_generation(company_id, model))
+
+
+def params_digest(params):
+    """Vingerafdruk van een dict met parameters, onafhankelijk van de volgorde."""
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def generation_tag(company_id, models):
+    """Korte vingerafdruk van de generaties van `models`, bv. voor bestandsnamen."""
+    generations = ":".join(str(generation) for generation in get_generations(company_id, models))
+    return hashlib.sha256(generations.encode("utf-8")).hexdigest()[:16]
+
+
+def tenant_cache_key(company_id, name, depends_on, params=None):
+    """Cache-sleutel voor resultaat `name` van een bedrijf, met de gegeven parameters."""
+    tag = generation_tag(company_id, depends_on)
+    return f"tenant:{company_id}:{name}:{tag}:{params_digest(params or {})}"
+
+
+def cached_for_tenant(company_id, name, depends_on, compute, params=None, timeout=DEFAULT_TIMEOUT):
+    """Het gecachte resultaat van `compute()`, of `compute()` en het resultaat cachen.
+
+    `depends_on` zijn de modellen waarvan het resultaat afhangt: zodra er daarvan
+    één wijzigt voor dit bedrijf, wordt het opnieuw berekend.
+    """
+    key = tenant_cache_key(company_id, name, depends_on, params)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        cache.set(key, value, timeout=timeout)
+    return value
+
+
+# --- SIGNALS ---
+def _bump_instance_generation(sender, instance, **kwargs):
+    bump_generation_on_commit(instance.company_id, sender)
+
+
+for _model in GENERATION_MODELS:
+    post_save.connect(
+        _bump_instance_generation, sender=_model, dispatch_uid=f"generation-save-{_model.__name__}"
+    )
+    post_delete.connect(
+        _bump_instance_generation,
+        sender=_model,
+        dispatch_uid=f"generation-delete-{_model.__name__}",
+    )
@@ -0,0 +1,194 @@
+"""Wijzigingsfeed van de tijdregistraties van een project, voor synchronisatie.
+
+Een koppeling (bv. de boekhouding) hoeft niet telkens een volledige periode te
+exporteren, maar haalt enkel op wat sinds de vorige keer veranderde:
+
+- nieuwe of gewijzigde registraties, in volgorde van (updated_at, id);
+- verwijderde registraties, in volgorde van (deleted_at, id) van hun grafsteen
+  (TimeRegistryTombstone). Ook een registratie die naar een ander project verhuist,
+  is voor het oude project verwijderd.
+
+De cursor onthoudt de positie in beide reeksen en is ondertekend, net als die van
+`pagination`. Zonder cursor begint de feed bij de eerste registratie (volledige
+synchronisatie).
+
+updated_at wordt gezet bij het opslaan, niet bij de commit: een transactie die nog
+loopt kan later een wijziging vastleggen met een tijdstip vóór de cursor. De feed
+levert daarom enkel wijzigingen die minstens `TIME_ENTRY_CHANGES_LAG_SECONDS` oud
+zijn. Grafstenen blijven `TIME_ENTRY_TOMBSTONE_DAYS` bewaard; met een oudere cursor
+kunnen verwijderingen gemist zijn (`CursorExpired`) en is een volledige
+synchronisatie nodig. Registraties van een losgekoppelde partitie (archief) worden
+niet als verwijderd gemeld.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import TimeRegistry, TimeRegistryTombstone
+from .pagination import DEFAULT_PAGE_SIZE, InvalidCursor
+
+CURSOR_SALT = "time_reg_web.changes.cursor"
+
+# Positie in de feed: laatste gewijzigde registratie, laatste grafsteen, en de
+# bovengrens (tijdstip) van de pagina waarmee de cursor gemaakt werd
+Position = namedtuple(
+    "Position", ["updated_at", "entry_id", "deleted_at", "tombstone_id", "synced_until"]
+)
+
+START = Position(None, 0, None, 0, None)
+
+ChangesPage = namedtuple("ChangesPage", ["changed", "deleted", "next_cursor", "has_more"])
+
+
+class CursorExpired(InvalidCursor):
+    """De cursor is ouder dan de bewaartermijn van de grafstenen."""
+
+
+def _isoformat(moment):
+    return moment.isoformat() if moment else None
+
+
+def encode_cursor(position):
+    """Ondoorzichtige cursor voor een `Position`."""
+    return signing.dumps(
+        [
+            _isoformat(position.updated_at),
+            position.entry_id,
+            _isoformat(position.deleted_at),
+            position.tombstone_id,
+            _isoformat(position.synced_until),
+        ],
+        salt=CURSOR_SALT,
+    )
+
+
+def decode_cursor(cursor):
+    """Geeft de `Position` van een cursor uit `encode_cursor` terug."""
+    try:
+        updated_at, entry_id, deleted_at, tombstone_id, synced_until = signing.loads(
+            cursor, salt=CURSOR_SALT
+        )
+        moments = [
+            parse_datetime(value) if value else None
+            for value in (updated_at, deleted_at, synced_until)
+        ]
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor("Ongeldige cursor")
+    if not isinstance(entry_id, int) or not isinstance(tombstone_id, int) or not moments[2]:
+        raise InvalidCursor("Ongeldige cursor")
+    return Position(moments[0], entry_id, moments[1], tombstone_id, moments[2])
+
+
+def _after(rows, field, moment, pk):
+    """Rijen na (moment, pk) in de volgorde (field, id)."""
+    rows = rows.order_by(field, "id")
+    if moment is None:
+        return rows
+    # De extra __gte laat de database de index op (project, field) gebruiken
+    return rows.filter(**{f"{field}__gte": moment}).filter(
+        Q(**{f"{field}__gt": moment}) | Q(**{field: moment, "id__gt": pk})
+    )
+
+
+def changes_page(project, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Eén pagina wijzigingen van een project na de positie van `cursor`.
+
+    Geeft een `ChangesPage` terug met de gewijzigde registraties (user en project
+    geladen), de verwijderde ids, de cursor voor de volgende aanvraag en of er nog
+    meer klaarstaat. De cursor is er altijd: ook zonder nieuwe wijzigingen bewaart
+    de koppeling hem voor de volgende synchronisatie.
+    """
+    now = timezone.now()
+    until = now - timedelta(seconds=settings.TIME_ENTRY_CHANGES_LAG_SECONDS)
+    if cursor:
+        position = decode_cursor(cursor)
+        if position.synced_until < now - timedelta(days=settings.TIME_ENTRY_TOMBSTONE_DAYS):
+            raise CursorExpired("Cursor verlopen; volledige synchronisatie nodig")
+    else:
+        # Een volledige synchronisatie hoeft de eerdere verwijderingen niet te kennen
+        position = START._replace(deleted_at=until)
+
+    changed = list(
+        _after(
+            TimeRegistry.objects.filter(project=project, updated_at__lte=until),
+            "updated_at",
+            position.updated_at,
+            position.entry_id,
+        ).select_related("user", "project")[: page_size + 1]
+    )
+    tombstones = list(
+        _after(
+            TimeRegistryTombstone.objects.filter(project_id=project.pk, deleted_at__lte=until),
+            "deleted_at",
+            position.deleted_at,
+            position.tombstone_id,
+        )[: page_size + 1]
+    )
+    has_more = len(changed) > page_size or len(tombstones) > page_size
+    changed, tombstones = changed[:page_size], tombstones[:page_size]
+
+    next_position = Position(
+        changed[-1].updated_at if changed else position.updated_at,
+        changed[-1].pk if changed else position.entry_id,
+        tombstones[-1].deleted_at if tombstones else position.deleted_at,
+        tombstones[-1].pk if tombstones else position.tombstone_id,
+        until,
+    )
+    return ChangesPage(
+        changed, _deleted_ids(project, tombstones), encode_cursor(next_position), has_more
+    )
+
+
+def _deleted_ids(project, tombstones):
+    """De ids van de grafstenen, zonder registraties die sindsdien terug in het project zitten.
+
+    Een registratie die naar een ander project en terug verhuist, heeft een grafsteen
+    én staat (later gewijzigd) in de feed; ze mag dan niet als verwijderd gelden.
+    """
+    if not tombstones:
+        return []
+    present = dict(
+        TimeRegistry.objects.filter(
+            project=project, pk__in=[tombstone.entry_id for tombstone in tombstones]
+        ).values_list("id", "updated_at")
+    )
+    return [
+        tombstone.entry_id
+        for tombstone in tombstones
+        if tombstone.entry_id not in present or present[tombstone.entry_id] <= tombstone.deleted_at
+    ]
+
+
+def purge_tombstones():
+    """Verwijdert grafstenen ouder dan de bewaartermijn; geeft het aantal terug."""
+    oldest = timezone.now() - timedelta(days=settings.TIME_ENTRY_TOMBSTONE_DAYS)
+    deleted, _ = TimeRegistryTombstone.objects.filter(deleted_at__lt=oldest).delete()
+    return deleted
+
+
+# --- SIGNALS ---
+# QuerySet.delete() en cascades versturen ook post_delete, per registratie
+@receiver(post_delete, sender=TimeRegistry)
+def record_deleted_entry(sender, instance, **kwargs):
+    TimeRegistryTombstone.objects.create(
+        entry_id=instance.pk, company_id=instance.company_id, project_id=instance.project_id
+    )
+
+
+@receiver(post_save, sender=TimeRegistry)
+def record_moved_entry(sender, instance, raw=False, **kwargs):
+    """Een registratie die naar een ander project verhuist, verdwijnt uit het oude project."""
+    previous = instance.previous_state()
+    if raw or not previous or previous["project_id"] == instance.project_id:
+        return
+    TimeRegistryTombstone.objects.create(
+        entry_id=instance.pk, company_id=previous["company_id"], project_id=previous["project_id"]
+    )
@@ -0,0 +1,125 @@
+"""Cache van gegenereerde exportbestanden op schijf.
+
+Dezelfde export (zelfde bedrijf, filters en formaat) wordt vaak meerdere keren per
+dag opnieuw gevraagd. Het bestand wordt de eerste keer bewaard in
+`EXPORT_CACHE_DIR/<bedrijf>/<generaties>_<vingerafdruk>.<extensie>` en daarna
+rechtstreeks van schijf geserveerd, zonder query of opbouw van het werkboek.
+
+<generaties> is een vingerafdruk van de generaties (zie `caching`) van de modellen
+in `DEPENDS_ON` voor dat bedrijf; die verandert zodra een registratie, project, klant
+of facturatieregel van het bedrijf wijzigt. Een bestand met een oude vingerafdruk
+wordt dus nooit meer geserveerd; `purge_export_cache` ruimt die bestanden (en
+bestanden ouder dan `EXPORT_CACHE_TTL_HOURS`) op.
+
+Een bestand wordt eerst naar een tijdelijke naam in dezelfde map geschreven en pas
+hernoemd als het volledig is, zodat een gelijktijdige download nooit een half
+bestand krijgt. CSV en NDJSON worden tijdens het streamen mee weggeschreven.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from .caching import generation_tag, params_digest
+from .exports import (
+    EXPORT_FORMATS,
+    ExportRows,
+    export_entries_for_params,
+    iter_csv,
+    iter_ndjson,
+    normalize_export_params,
+    write_export,
+)
+from .models import BillingPolicy, Customer, DailyTimeRollup, Project, TimeRegistry
+from .streaming import file_response, streaming_response
+
+logger = logging.getLogger(__name__)
+
+# De gefactureerde uren hangen via de daglimiet ook af van de dagtotalen
+DEPENDS_ON = (TimeRegistry, DailyTimeRollup, BillingPolicy, Customer, Project)
+
+
+def cache_path(company_id, params):
+    """Pad van het gecachte bestand voor deze filters en de huidige generaties."""
+    tag = generation_tag(company_id, DEPENDS_ON)
+    extension = EXPORT_FORMATS[params["format"]].extension
+    digest = params_digest(normalize_export_params(params))
+    return Path(settings.EXPORT_CACHE_DIR) / str(company_id) / f"{tag}_{digest}.{extension}"
+
+
+@contextmanager
+def cache_writer(path):
+    """Binair bestand dat pas op `path` verschijnt als het blok zonder fout eindigt."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fileobj:
+            yield fileobj
+        os.replace(tmp_name, path)
+    except BaseException:
+        # Ook bij een afgebroken download (GeneratorExit) geen half bestand achterlaten
+        os.unlink(tmp_name)
+        raise
+
+
+def _stream_and_store(lines, path):
+    with cache_writer(path) as fileobj:
+        for line in lines:
+            data = line.encode("utf-8")
+            fileobj.write(data)
+            yield data
+
+
+def cached_export_response(request, company, params, filename):
+    """Download-response voor een export, uit de cache of nieuw gegenereerd en bewaard."""
+    export_format = EXPORT_FORMATS[params["format"]]
+    path = cache_path(company.pk, params)
+
+    try:
+        cached = open(path, "rb")
+    except FileNotFoundError:
+        cached = None
+    if cached is not None:
+        logger.info(f"[EXPORT] Cache hit voor bedrijf {company.pk}: {path.name}")
+        return file_response(request, cached, filename, export_format.content_type)
+
+    rows = ExportRows(export_entries_for_params(company, params))
+    if export_format.key in ("csv", "ndjson"):
+        lines = iter_csv(rows) if export_format.key == "csv" else iter_ndjson(rows)
+        return streaming_response(
+            request, _stream_and_store(lines, path), export_format.content_type, filename
+        )
+
+    with cache_writer(path) as fileobj:
+        write_export(export_format, rows, fileobj)
+    return file_response(request, open(path, "rb"), filename, export_format.content_type)
+
+
+def purge_export_cache():
+    """Verwijdert bestanden met oude generaties of ouder dan de TTL; geeft het aantal."""
+    root = Path(settings.EXPORT_CACHE_DIR)
+    if not root.is_dir():
+        return 0
+
+    oldest = time.time() - settings.EXPORT_CACHE_TTL_HOURS * 3600
+    purged = 0
+    for company_dir in root.iterdir():
+        if not company_dir.is_dir() or not company_dir.name.isdigit():
+            continue
+        current = generation_tag(int(company_dir.name), DEPENDS_ON)
+        for path in company_dir.iterdir():
+            # Een .tmp-bestand wordt misschien nog geschreven; enkel weg als het te oud is
+            stale = path.suffix != ".tmp" and path.name.split("_", 1)[0] != current
+            try:
+                if stale or path.stat().st_mtime < oldest:
+                    path.unlink()
+                    purged += 1
+            except FileNotFoundError:
+                # Intussen al vervangen of door een andere worker opgeruimd
+                continue
+    return purged
@@ -0,0 +1,351 @@
+"""Export van tijdregistraties met constant geheugengebruik.
+
+De rijen worden via een `values()`-iterator in brokken uit de database gelezen (op
+PostgreSQL is dat een server-side cursor), per brok in één keer volgens de
+facturatieregels afgerond (zie `billing`), en door één gedeelde rij-producent
+(`ExportRows`) geleverd. De writers per
+formaat (Excel, CSV, NDJSON en Parquet) verbruiken die rijen één voor één, zodat het
+geheugengebruik vlak blijft, ongeacht het aantal rijen, en het aantal queries constant
+blijft.
+"""
+
+import csv
+import json
+from collections import namedtuple
+from datetime import date
+from itertools import islice
+
+import openpyxl
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .billing import BillingEngine
+from .models import TimeRegistry
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Aantal rijen dat per keer uit de (server-side) cursor gehaald wordt
+EXPORT_CHUNK_SIZE = 2000
+
+# Aantal rijen per row group in een Parquet-bestand
+PARQUET_ROW_GROUP_SIZE = 50_000
+
+# De filtervelden van het exportformulier (dashboard/export.html)
+EXPORT_FILTER_FIELDS = ("start_date", "end_date", "customer", "project")
+
+EXPORT_HEADERS = [
+    "Datum",
+    "Klant",
+    "Project",
+    "Gebruiker",
+    "Start",
+    "Eind",
+    "Duur (u)",
+    "Omschrijving",
+]
+
+# Eén rij van de export, met getypeerde waarden; de writers bepalen de weergave
+ExportRow = namedtuple(
+    "ExportRow",
+    ["date", "customer", "project", "user", "start_time", "end_time", "duration", "description"],
+)
+
+ExportFormat = namedtuple("ExportFormat", ["key", "label", "extension", "content_type"])
+
+EXPORT_FORMATS = {
+    "xlsx": ExportFormat("xlsx", "Excel (.xlsx)", "xlsx", XLSX_CONTENT_TYPE),
+    "csv": ExportFormat("csv", "CSV (.csv)", "csv", "text/csv; charset=utf-8"),
+    "ndjson": ExportFormat("ndjson", "NDJSON (.ndjson)", "ndjson", "application/x-ndjson"),
+    "parquet": ExportFormat(
+        "parquet", "Parquet (.parquet)", "parquet", "application/vnd.apache.parquet"
+    ),
+}
+DEFAULT_EXPORT_FORMAT = "xlsx"
+
+
+def filter_export_entries(
+    company, start_date=None, end_date=None, customer_id=None, project_id=None
+):
+    """Bouwt de queryset voor een export op basis van de filters uit het exportformulier."""
+    entries = (
+        TimeRegistry.objects.filter(company=company)
+        .in_period(_parse_date(start_date), _parse_date(end_date))
+        .order_by("start_time")
+    )
+    if customer_id:
+        entries = entries.filter(project__customer_id=customer_id)
+    if project_id:
+        entries = entries.filter(project_id=project_id)
+    return entries
+
+
+def _parse_date(value):
+    """Datum uit het formulier ('YYYY-MM-DD'); een ongeldige waarde filtert niet."""
+    if not value or isinstance(value, date):
+        return value or None
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def export_params(data):
+    """Haalt de exportfilters en het gekozen formaat uit POST-data (of een dict) op."""
+    params = {field: data.get(field) or "" for field in EXPORT_FILTER_FIELDS}
+    export_format = data.get("format") or DEFAULT_EXPORT_FORMAT
+    params["format"] = export_format if export_format in EXPORT_FORMATS else DEFAULT_EXPORT_FORMAT
+    return params
+
+
+def normalize_export_params(params):
+    """De filters van `export_params` in een vaste vorm, bv. als sleutel voor een cache.
+
+    Datums worden ISO-datums en ongeldige datums vallen weg, net zoals ze bij het
+    filteren genegeerd worden.
+    """
+    start_date = _parse_date(params.get("start_date"))
+    end_date = _parse_date(params.get("end_date"))
+    return {
+        "start_date": start_date.isoformat() if start_date else "",
+        "end_date": end_date.isoformat() if end_date else "",
+        "customer": str(params.get("customer") or "").strip(),
+        "project": str(params.get("project") or "").strip(),
+        "format": params["format"],
+    }
+
+
+def export_entries_for_params(company, params):
+    """Zelfde als `filter_export_entries`, maar op basis van de dict van `export_params`."""
+    return filter_export_entries(
+        company,
+        start_date=params.get("start_date"),
+        end_date=params.get("end_date"),
+        customer_id=params.get("customer"),
+        project_id=params.get("project"),
+    )
+
+
+def export_filename(export_format, timestamp):
+    """Bestandsnaam voor de download, bv. urenexport_20260302_0915.csv."""
+    return f"urenexport_{timestamp.strftime('%Y%m%d_%H%M')}.{export_format.extension}"
+
+
+class ExportRows:
+    """Levert de export-rijen één voor één, met de gefactureerde duur en het totaal.
+
+    De duur wordt per brok voor alle rijen tegelijk berekend met de facturatieregels
+    van het bedrijf (`billing.BillingEngine`); het totaal is de som van de getoonde
+    rijen en wordt tijdens het itereren bijgehouden, zodat alle exportformaten
+    dezelfde cijfers tonen zonder model-instanties te laden. Klant, project en
+    gebruiker worden in dezelfde query mee opgehaald (JOIN via `values()`), zodat er
+    per rij geen extra queries nodig zijn.
+    """
+
+    fields = (
+        "start_time",
+        "end_time",
+        "description",
+        "project__project_name",
+        "project__customer__customer_name",
+        "user__username",
+        "company_id",
+        "user_id",
+        "project__customer_id",
+        "duration_seconds",
+    )
+
+    def __init__(self, entries, chunk_size=EXPORT_CHUNK_SIZE, on_progress=None):
+        self.entries = entries
+        self.chunk_size = chunk_size
+        # Optionele callback die na elk brok wordt aangeroepen met het aantal verwerkte rijen
+        self.on_progress = on_progress
+        self.row_count = 0
+        self.engine = BillingEngine()
+        self._total = None
+
+    def _chunks(self):
+        """(rijen, uren) per brok; de uren zijn de gefactureerde duur per rij."""
+        values = (
+            self.entries.with_durations().values(*self.fields).iterator(chunk_size=self.chunk_size)
+        )
+        while True:
+            chunk = list(islice(values, self.chunk_size))
+            if not chunk:
+                return
+            billed = self.engine.billed_seconds(
+                [entry["company_id"] for entry in chunk],
+                [entry["project__customer_id"] for entry in chunk],
+                [entry["user_id"] for entry in chunk],
+                [timezone.localdate(entry["start_time"]) for entry in chunk],
+                [entry["duration_seconds"] for entry in chunk],
+            )
+            yield chunk, [round(seconds / 3600, 2) for seconds in billed.tolist()]
+
+    def __iter__(self):
+        self.row_count = 0
+        total = 0
+        for chunk, hours in self._chunks():
+            for entry, duration in zip(chunk, hours):
+                # In de lokale tijd, zoals de import ze terug inleest
+                start_time = entry["start_time"] and timezone.localtime(entry["start_time"])
+                end_time = entry["end_time"] and timezone.localtime(entry["end_time"])
+                yield ExportRow(
+                    start_time.date() if start_time else None,
+                    entry["project__customer__customer_name"],
+                    entry["project__project_name"],
+                    entry["user__username"],
+                    start_time,
+                    end_time,
+                    duration,
+                    entry["description"],
+                )
+            total += sum(hours)
+            self.row_count += len(chunk)
+            if self.on_progress and len(chunk) == self.chunk_size:
+                self.on_progress(self.row_count)
+
+        self._total = round(total, 2)
+        if self.on_progress:
+            self.on_progress(self.row_count)
+
+    @property
+    def total(self):
+        """Totaal van de gefactureerde uren; na het itereren zonder extra query."""
+        if self._total is None:
+            self._total = round(sum(sum(hours) for _, hours in self._chunks()), 2)
+        return self._total
+
+    def total_row(self):
+        """De totaalregel: 'TOTAAL' in de kolom van de eindtijd, de som in de duur-kolom."""
+        return ["", "", "", "", "", "TOTAAL:", self.total, ""]
+
+
+def display_row(row):
+    """Weergave van een rij zoals in de Excel export (datum, uur en 'Lopend')."""
+    return [
+        row.start_time.strftime("%d-%m-%Y") if row.start_time else "",
+        row.customer,
+        row.project,
+        row.user,
+        row.start_time.strftime("%H:%M") if row.start_time else "",
+        row.end_time.strftime("%H:%M") if row.end_time else "Lopend",
+        row.duration,
+        row.description,
+    ]
+
+
+def record_row(row):
+    """Weergave van een rij als JSON-object voor machinale verwerking."""
+    return {
+        "date": row.date.isoformat() if row.date else None,
+        "customer": row.customer,
+        "project": row.project,
+        "user": row.user,
+        "start_time": row.start_time.isoformat() if row.start_time else None,
+        "end_time": row.end_time.isoformat() if row.end_time else None,
+        "duration_hours": row.duration,
+        "description": row.description,
+    }
+
+
+def write_xlsx(rows, fileobj):
+    """Schrijft de rijen naar een write-only werkboek in `fileobj`.
+
+    In write-only modus houdt openpyxl de rijen niet in het geheugen maar schrijft
+    ze meteen weg naar een tijdelijk bestand.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title="Uren Export")
+    ws.append(EXPORT_HEADERS)
+
+    for row in rows:
+        ws.append(display_row(row))
+
+    # Voeg een lege regel en de totaalregel toe
+    ws.append([])
+    ws.append(rows.total_row())
+
+    wb.save(fileobj)
+
+
+class _LineBuffer:
+    """Pseudo-bestand voor csv.writer dat de geschreven regel gewoon teruggeeft."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Genereert de CSV regel per regel, met dezelfde kolommen en totaalregel als Excel."""
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(EXPORT_HEADERS)
+    for row in rows:
+        yield writer.writerow(display_row(row))
+    yield writer.writerow([])
+    yield writer.writerow(rows.total_row())
+
+
+def iter_ndjson(rows):
+    """Genereert één JSON-object per regel; de laatste regel bevat het totaal."""
+    for row in rows:
+        yield json.dumps(record_row(row), ensure_ascii=False) + "\n"
+    yield json.dumps({"total_hours": rows.total}) + "\n"
+
+
+def write_parquet(rows, fileobj, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """Schrijft de rijen kolomsgewijs naar Parquet, één row group per `row_group_size` rijen.
+
+    Het totaal wordt als metadata (`total_hours`) in het bestand opgenomen.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("date", pa.date32()),
+            ("customer", pa.string()),
+            ("project", pa.string()),
+            ("user", pa.string()),
+            ("start_time", pa.timestamp("us", tz="UTC")),
+            ("end_time", pa.timestamp("us", tz="UTC")),
+            ("duration_hours", pa.float64()),
+            ("description", pa.string()),
+        ]
+    )
+
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        columns = [[] for _ in ExportRow._fields]
+
+        def flush():
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            for column in columns:
+                column.clear()
+
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(columns[0]) >= row_group_size:
+                flush()
+        if columns[0]:
+            flush()
+
+        writer.add_key_value_metadata({"total_hours": str(rows.total)})
+
+
+def _write_lines(lines, fileobj):
+    for line in lines:
+        fileobj.write(line.encode("utf-8"))
+
+
+def write_export(export_format, rows, fileobj):
+    """Schrijft de export in het gevraagde formaat naar een (binair) bestand."""
+    if export_format.key == "xlsx":
+        write_xlsx(rows, fileobj)
+    elif export_format.key == "parquet":
+        write_parquet(rows, fileobj)
+    elif export_format.key == "csv":
+        _write_lines(iter_csv(rows), fileobj)
+    elif export_format.key == "ndjson":
+        _write_lines(iter_ndjson(rows), fileobj)
+    else:
+        raise ValueError(f"Onbekend exportformaat: {export_format.key}")
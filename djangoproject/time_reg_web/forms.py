@@ -5,6 +5,21 @@ from django.contrib.auth.forms import PasswordResetForm
 from .models import Divisies, Milstones, Todo
 
 
+class TenantModelForm(forms.ModelForm):
+    """ModelForm waarvan de keuzelijsten per formulier uit `objects` komen (zie `managers`).
+
+    Django bouwt de queryset van een keuzelijst één keer, bij het laden van de klasse,
+    en dus in de tenant-context (of het ontbreken ervan) van dat moment. Hier wordt ze
+    per formulier opnieuw opgehaald, in de context van de request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field, forms.ModelChoiceField):
+                field.queryset = field.queryset.model._default_manager.all()
+
+
 # 1. Het Formulier
 # 1. Het Formulier met wachtwoordherhaling
 class RegistrationForm(forms.Form):
@@ -47,7 +62,7 @@ class TailwindPasswordResetForm(PasswordResetForm):
     )
 
 
-class TodoForm(forms.ModelForm):
+class TodoForm(TenantModelForm):
     """Formulier voor aanmaken en bewerken van taken."""
 
     class Meta:
@@ -132,7 +147,7 @@ class TodoForm(forms.ModelForm):
         }
 
 
-class DivisieForm(forms.ModelForm):
+class DivisieForm(TenantModelForm):
     """Formulier voor aanmaken van divisies."""
 
     class Meta:
@@ -149,7 +164,7 @@ class DivisieForm(forms.ModelForm):
         }
 
 
-class MilestoneForm(forms.ModelForm):
+class MilestoneForm(TenantModelForm):
     """Formulier voor aanmaken en bewerken van taken."""
 
     class Meta:
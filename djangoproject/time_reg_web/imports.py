@@ -0,0 +1,361 @@
+"""Bulk-import van tijdregistraties uit CSV of Excel.
+
+Het bestand heeft dezelfde kolommen als de export (zie `exports.EXPORT_HEADERS`):
+Datum, Klant, Project, Gebruiker, Start, Eind, Duur (u), Omschrijving. De kolom
+Duur wordt genegeerd; de duur volgt uit Start en Eind. Lege regels en de
+totaalregel van een export worden overgeslagen.
+
+Klanten, projecten en gebruikers worden één keer per import in het geheugen
+opgezocht. De rijen worden regel per regel gelezen en gevalideerd, en per brok van
+`IMPORT_CHUNK_SIZE` geldige rijen in één transactie weggeschreven met `bulk_create`.
+Per brok worden de rijen op overlap gecontroleerd, onderling en met de bestaande
+registraties van dezelfde gebruikers (één indexquery per gebruiker, zie `overlaps`).
+Omdat `bulk_create` geen signalen verstuurt, worden de dagtotalen en de caches van
+de samenvattingen en exports hier zelf bijgewerkt.
+"""
+
+import csv
+import io
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import openpyxl
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .caching import bump_generation
+from .exports import EXPORT_HEADERS
+from .models import Customer, Project, TimeRegistry
+from .overlaps import find_overlapping_pairs, is_overlap_violation
+from .rollups import RollupDeltas
+
+# Aantal geldige rijen per transactie
+IMPORT_CHUNK_SIZE = 5000
+
+# Zoveel foutmeldingen worden bewaard om te tonen; de rest wordt enkel geteld
+MAX_REPORTED_ERRORS = 500
+
+IMPORT_EXTENSIONS = (".csv", ".xlsx")
+
+ImportRowError = namedtuple("ImportRowError", ["row", "message"])
+
+
+class ImportResult:
+    """Verloop van een import: aantallen en de (eerste) foutmeldingen per rij."""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(ImportRowError(row, message))
+
+
+class RowError(ValueError):
+    """Een rij die niet geïmporteerd kan worden."""
+
+
+# Waarde in de opzoektabellen voor een naam die bij meer dan één rij hoort
+_AMBIGUOUS = object()
+
+
+def _index(pairs):
+    """{naam: pk} uit (naam, pk) paren; een naam die meermaals voorkomt wordt _AMBIGUOUS."""
+    index = {}
+    for key, pk in pairs:
+        index[key] = _AMBIGUOUS if key in index else pk
+    return index
+
+
+class ImportLookups:
+    """Klanten, projecten en gebruikers van een bedrijf, één keer opgehaald.
+
+    Namen worden zonder hoofdletters vergeleken. Een rij met een naam die bij meer dan
+    één klant, project of gebruiker past, wordt geweigerd in plaats van er willekeurig
+    één te kiezen.
+    """
+
+    def __init__(self, company, allowed_user=None):
+        self.customers = _index(
+            (name.strip().lower(), pk)
+            for pk, name in Customer.objects.filter(company=company).values_list(
+                "id", "customer_name"
+            )
+        )
+        self.projects = _index(
+            ((customer_id, name.strip().lower()), pk)
+            for pk, customer_id, name in Project.objects.filter(company=company).values_list(
+                "id", "customer_id", "project_name"
+            )
+        )
+        users = company.members.all()
+        if allowed_user is not None:
+            # Gewone gebruikers mogen enkel hun eigen uren importeren
+            users = users.filter(pk=allowed_user.pk)
+        self.users = _index(
+            (username.lower(), pk) for pk, username in users.values_list("id", "username")
+        )
+
+    def customer_id(self, name):
+        pk = self.customers.get(name.lower())
+        if pk is None:
+            raise RowError(f"Onbekende klant '{name}'")
+        if pk is _AMBIGUOUS:
+            raise RowError(f"Meerdere klanten heten '{name}'")
+        return pk
+
+    def project_id(self, customer_id, name, customer_name):
+        pk = self.projects.get((customer_id, name.lower()))
+        if pk is None:
+            raise RowError(f"Onbekend project '{name}' voor klant '{customer_name}'")
+        if pk is _AMBIGUOUS:
+            raise RowError(f"Meerdere projecten van klant '{customer_name}' heten '{name}'")
+        return pk
+
+    def user_id(self, username):
+        pk = self.users.get(username.lower())
+        if pk is None:
+            raise RowError(f"Onbekende of niet toegelaten gebruiker '{username}'")
+        if pk is _AMBIGUOUS:
+            raise RowError(f"Meerdere gebruikers heten '{username}'")
+        return pk
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+# Datums en uren komen in een import heel vaak terug; het parsen wordt gecachet
+@lru_cache(maxsize=4096)
+def _parse_day_text(value):
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f"Ongeldige datum '{value}' (verwacht DD-MM-JJJJ)")
+
+
+@lru_cache(maxsize=4096)
+def _parse_time_text(value, column):
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+    raise RowError(f"Ongeldig uur '{value}' in kolom {column} (verwacht UU:MM)")
+
+
+@lru_cache(maxsize=65536)
+def _aware(day, moment, tz):
+    return timezone.make_aware(datetime.combine(day, moment), tz)
+
+
+def _parse_day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return _parse_day_text(_text(value))
+
+
+def _parse_time(value, column):
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time):
+        return value
+    return _parse_time_text(_text(value), column)
+
+
+def _read_csv(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def _read_xlsx(fileobj):
+    # read_only: het werkboek wordt rij per rij gelezen in plaats van volledig geladen
+    wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_rows(fileobj, filename):
+    """Leest de rijen van een CSV- of Excel-bestand als tuples (met de kopregel)."""
+    if filename.lower().endswith(".xlsx"):
+        return _read_xlsx(fileobj)
+    if filename.lower().endswith(".csv"):
+        return _read_csv(fileobj)
+    raise ValueError("Enkel .csv en .xlsx bestanden kunnen geïmporteerd worden.")
+
+
+def _is_header(row):
+    return [_text(value).lower() for value in row[: len(EXPORT_HEADERS)]] == [
+        header.lower() for header in EXPORT_HEADERS
+    ]
+
+
+def _is_skipped(row):
+    values = [_text(value) for value in row]
+    # Lege regel of de totaalregel van de export ("TOTAAL:" in de kolom Eind)
+    return not any(values) or (len(values) > 5 and values[5].upper() == "TOTAAL:")
+
+
+def build_entry(row, company, lookups, tz):
+    """Zet één rij om naar een (niet opgeslagen) TimeRegistry; RowError bij fouten."""
+    row = list(row) + [None] * (len(EXPORT_HEADERS) - len(row))
+    day_value, customer, project, username, start, end, _duration, description = row[:8]
+
+    customer, project, username = _text(customer), _text(project), _text(username)
+    if not customer or not project or not username:
+        raise RowError("Klant, Project en Gebruiker zijn verplicht")
+    if _text(end).lower() == "lopend":
+        raise RowError("Lopende timers kunnen niet geïmporteerd worden")
+
+    day = _parse_day(day_value)
+    start, end = _parse_time(start, "Start"), _parse_time(end, "Eind")
+    if start == end:
+        raise RowError("Start en Eind zijn gelijk")
+    # Een eind vóór de start is een registratie over middernacht
+    end_day = day + timedelta(days=1) if end < start else day
+    start_time = _aware(day, start, tz)
+    end_time = _aware(end_day, end, tz)
+
+    customer_id = lookups.customer_id(customer)
+    return TimeRegistry(
+        company=company,
+        user_id=lookups.user_id(username),
+        project_id=lookups.project_id(customer_id, project, customer),
+        start_time=start_time,
+        end_time=end_time,
+        description=_text(description),
+    )
+
+
+def _reject_overlaps(chunk, result):
+    """Houdt de rijen van een brok over die met niets overlappen.
+
+    `chunk` is een lijst van (rijnummer, registratie), net als het resultaat.
+    Overlappende rijen worden als fout gemeld; bij twee rijen uit het bestand wordt de
+    latere geweigerd.
+    """
+    row_numbers = {id(entry): row_number for row_number, entry in chunk}
+    existing = []
+    by_user = {}
+    for _, entry in chunk:
+        first, last = by_user.get(entry.user_id, (entry.start_time, entry.end_time))
+        by_user[entry.user_id] = (min(first, entry.start_time), max(last, entry.end_time))
+    for user_id, (first, last) in by_user.items():
+        # Zoals de overlap-constraint: per gebruiker, over de bedrijven heen
+        existing.extend(TimeRegistry.unscoped.overlapping(user_id, first, last))
+
+    rejected = set()
+    for earlier, later in find_overlapping_pairs([entry for _, entry in chunk] + existing):
+        entry, other = (later, earlier) if id(later) in row_numbers else (earlier, later)
+        if id(entry) not in row_numbers or id(entry) in rejected:
+            continue
+        rejected.add(id(entry))
+        if id(other) in row_numbers:
+            message = f"Overlapt met rij {row_numbers[id(other)]}"
+        else:
+            start = timezone.localtime(other.start_time)
+            message = f"Overlapt met een bestaande registratie van {start:%d-%m-%Y %H:%M}"
+        result.add_error(row_numbers[id(entry)], message)
+
+    return [(row_number, entry) for row_number, entry in chunk if id(entry) not in rejected]
+
+
+def _save_entries(entries):
+    with transaction.atomic():
+        TimeRegistry.objects.bulk_create(entries, batch_size=1000)
+        deltas = RollupDeltas()
+        for entry in entries:
+            deltas.add_entry(entry)
+        deltas.apply()
+
+
+def _save_chunk(chunk, result):
+    """Schrijft een brok weg; geeft het aantal opgeslagen rijen terug.
+
+    Faalt het brok op een constraint, bv. een registratie die sinds de controle in
+    `_reject_overlaps` aangemaakt werd, dan wordt elke rij apart opgeslagen en krijgen
+    enkel de rijen die falen een foutmelding.
+    """
+    try:
+        _save_entries([entry for _, entry in chunk])
+        return len(chunk)
+    except IntegrityError:
+        pass
+
+    saved = 0
+    for row_number, entry in chunk:
+        # De teruggedraaide bulk_create kan al een id gezet hebben
+        entry.pk = None
+        try:
+            _save_entries([entry])
+        except IntegrityError as e:
+            if is_overlap_violation(e):
+                result.add_error(row_number, "Overlapt met een bestaande registratie")
+            else:
+                result.add_error(row_number, f"Kon niet opgeslagen worden: {e}")
+            continue
+        saved += 1
+    return saved
+
+
+def _import_chunk(chunk, result, dry_run):
+    chunk = _reject_overlaps(chunk, result)
+    if not chunk:
+        return
+    result.imported += len(chunk) if dry_run else _save_chunk(chunk, result)
+
+
+def import_time_entries(company, rows, allowed_user=None, dry_run=False):
+    """Importeert de rijen (zoals uit `read_rows`) voor een bedrijf.
+
+    Geldige rijen worden per brok weggeschreven, ook als andere rijen fouten
+    bevatten. Met `dry_run` worden de rijen enkel gevalideerd. Geeft een
+    ImportResult terug; rijnummers zijn die van het bestand (de kopregel is 1).
+    """
+    lookups = ImportLookups(company, allowed_user=allowed_user)
+    tz = timezone.get_current_timezone()
+    result = ImportResult()
+    chunk = []
+
+    for row_number, row in enumerate(rows, start=1):
+        if row_number == 1 and _is_header(row):
+            continue
+        if _is_skipped(row):
+            result.skipped += 1
+            continue
+        try:
+            chunk.append((row_number, build_entry(row, company, lookups, tz)))
+        except RowError as e:
+            result.add_error(row_number, str(e))
+            continue
+
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            _import_chunk(chunk, result, dry_run)
+            chunk = []
+
+    if chunk:
+        _import_chunk(chunk, result, dry_run)
+
+    if result.imported and not dry_run:
+        # bulk_create verstuurt geen post_save
+        bump_generation(company.pk, TimeRegistry)
+    return result
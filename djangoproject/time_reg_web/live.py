@@ -0,0 +1,241 @@
+"""Live-updates voor de schermen via server-sent events (SSE).
+
+Een timer die start of stopt en een taak die wijzigt, worden na de commit als event
+gepubliceerd voor het bedrijf. De stream (`event_stream`, view `live_events`) stuurt
+de events van het eigen bedrijf door naar de browser, die de pagina ter plaatse
+bijwerkt in plaats van ze te herladen. De stream houdt een verbinding open en werkt
+daarom enkel onder ASGI (zie Dockerfile).
+
+Publiceren en abonneren gaan via een broker (settings: LIVE_EVENTS_BACKEND):
+
+- memory: in het geheugen van het proces. Enkel correct met één proces: events uit
+  een andere worker komen niet aan.
+- postgres: NOTIFY op kanaal `CHANNEL`. Elk proces houdt één LISTEN-verbinding open
+  en verdeelt de meldingen over zijn eigen abonnees; zo komen events van alle
+  workers en nodes (en van de django-q worker) aan.
+
+Een trage browser die zijn wachtrij niet leegt, verliest events; hij krijgt de
+volledige stand terug bij de volgende paginalading.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from functools import cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import TimeRegistry, Todo
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "eventaflow_live"
+
+# Aantal events dat per abonnee kan wachten
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Hoe lang de browser wacht voor hij opnieuw verbindt (ms)
+RETRY_MILLISECONDS = 5000
+
+
+def _offer(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.debug("[LIVE] Wachtrij van een abonnee vol; event overgeslagen")
+
+
+class InProcessBroker:
+    """Pub/sub binnen één proces; elke abonnee is een asyncio-queue op zijn event loop."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, company_id, event):
+        self.dispatch(company_id, event)
+
+    def dispatch(self, company_id, event):
+        """Geeft een event aan de abonnees van het bedrijf in dit proces (thread-safe)."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(company_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # De event loop van deze abonnee is intussen gestopt
+                continue
+
+    @asynccontextmanager
+    async def subscribe(self, company_id):
+        """Async context manager met een queue die de events van het bedrijf ontvangt."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.setdefault(company_id, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(company_id, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(company_id, None)
+
+
+class PostgresBroker(InProcessBroker):
+    """Pub/sub over PostgreSQL LISTEN/NOTIFY, voor meerdere processen en nodes."""
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, company_id, event):
+        payload = json.dumps({"company_id": company_id, "event": event}, cls=DjangoJSONEncoder)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+
+    @asynccontextmanager
+    async def subscribe(self, company_id):
+        # Eén LISTEN-verbinding per proces, gestart door de eerste abonnee
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        async with super().subscribe(company_id) as queue:
+            yield queue
+
+    async def _listen(self):
+        import psycopg
+        from psycopg import sql
+
+        while True:
+            try:
+                aconn = await psycopg.AsyncConnection.connect(
+                    **_listen_connection_params(), autocommit=True
+                )
+                async with aconn:
+                    await aconn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+                    async for notify in aconn.notifies():
+                        self._dispatch_notify(notify)
+            except psycopg.Error as e:
+                logger.warning(f"[LIVE] LISTEN-verbinding verbroken, opnieuw over 5s: {e}")
+                await asyncio.sleep(5)
+            except Exception:
+                # De listener mag niet stilvallen: alle streams van het proces hangen ervan af
+                logger.exception("[LIVE] LISTEN-verbinding mislukt, opnieuw over 5s")
+                await asyncio.sleep(5)
+
+    def _dispatch_notify(self, notify):
+        try:
+            message = json.loads(notify.payload)
+            self.dispatch(message["company_id"], message["event"])
+        except Exception:
+            # Eén foute melding mag de volgende niet tegenhouden
+            logger.exception(f"[LIVE] Melding niet verwerkt: {notify.payload[:200]}")
+
+
+def _listen_connection_params():
+    """De verbindingsparameters van Django (met OPTIONS, bv. sslmode) voor psycopg."""
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    # De cursorklasse van Django is synchroon; de LISTEN-verbinding is async
+    params.pop("cursor_factory", None)
+    return params
+
+
+@cache
+def get_broker():
+    return import_string(settings.LIVE_EVENTS_BACKENDS[settings.LIVE_EVENTS_BACKEND])()
+
+
+def publish_on_commit(company_id, event):
+    """Publiceert een event voor een bedrijf zodra de huidige transactie gecommit is."""
+
+    def publish():
+        try:
+            get_broker().publish(company_id, event)
+        except Exception as e:
+            # Live-updates zijn een extraatje: de wijziging zelf is al bewaard
+            logger.warning(f"[LIVE] Event {event['type']} niet gepubliceerd: {e}")
+
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    """Een event in het SSE-formaat (`event:` en `data:` regels)."""
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(company_id):
+    """Async iterator met de SSE-tekst voor een bedrijf, met af en toe een keepalive."""
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    async with get_broker().subscribe(company_id) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=settings.LIVE_EVENTS_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # Commentaarregel: houdt proxies (Traefik) en de browser wakker
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+
+
+def todo_event(todo_id, is_completed, user_id=None):
+    """Event voor een gewijzigde taak; `user_id` is None als de toewijzing niet gekend is."""
+    return {
+        "type": "todo.changed",
+        "id": todo_id,
+        "is_completed": is_completed,
+        "user_id": user_id,
+    }
+
+
+def _timer_event(event_type, entry):
+    return {
+        "type": event_type,
+        "id": entry.pk,
+        "user_id": entry.user_id,
+        "project_id": entry.project_id,
+        "start_time": entry.start_time,
+        "end_time": entry.end_time,
+    }
+
+
+# --- SIGNALS ---
+@receiver(post_save, sender=TimeRegistry)
+def publish_timer_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.previous_state()
+    was_running = bool(previous) and previous["end_time"] is None
+    is_running = instance.end_time is None
+    if is_running and not was_running:
+        publish_on_commit(instance.company_id, _timer_event("timer.started", instance))
+    elif was_running and not is_running:
+        publish_on_commit(instance.company_id, _timer_event("timer.stopped", instance))
+
+
+@receiver(post_delete, sender=TimeRegistry)
+def publish_timer_delete(sender, instance, **kwargs):
+    if instance.end_time is None:
+        publish_on_commit(instance.company_id, _timer_event("timer.stopped", instance))
+
+
+@receiver(post_save, sender=Todo)
+def publish_todo_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        publish_on_commit(
+            instance.company_id, todo_event(instance.pk, instance.is_completed, instance.user_id)
+        )
+
+
+@receiver(post_delete, sender=Todo)
+def publish_todo_delete(sender, instance, **kwargs):
+    publish_on_commit(instance.company_id, {"type": "todo.deleted", "id": instance.pk})
@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from time_reg_web.models import TimeRegistry
+from time_reg_web.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Herberekent de dagtotalen (DailyTimeRollup) voor een periode uit de "
+        "tijdregistraties. Zonder periode worden alle registraties herberekend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start", type=date.fromisoformat, help="Eerste dag (YYYY-MM-DD), inclusief."
+        )
+        parser.add_argument(
+            "--end", type=date.fromisoformat, help="Laatste dag (YYYY-MM-DD), inclusief."
+        )
+        parser.add_argument(
+            "--company_id", type=int, help="Enkel de rollups van dit bedrijf herberekenen."
+        )
+
+    def handle(self, *args, **options):
+        start_date = options["start"]
+        end_date = options["end"]
+        company_id = options["company_id"]
+
+        if not start_date or not end_date:
+            entries = TimeRegistry.unscoped.all()
+            if company_id:
+                entries = entries.filter(company_id=company_id)
+            first = entries.order_by("start_time").values_list("start_time", flat=True).first()
+            if first is None:
+                self.stdout.write(self.style.WARNING("[!] Geen tijdregistraties gevonden."))
+                return
+            start_date = start_date or timezone.localdate(first)
+            end_date = end_date or timezone.localdate()
+
+        if start_date > end_date:
+            raise CommandError("--start moet voor --end liggen.")
+
+        self.stdout.write(f"[*] Rollups herberekenen van {start_date} t.e.m. {end_date}...")
+        created = rebuild_rollups(start_date, end_date, company_id=company_id)
+        self.stdout.write(self.style.SUCCESS(f"[+] {created} rollup-rijen aangemaakt."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from time_reg_web.models import Company
+from time_reg_web.overlaps import enforce_overlap_constraints, find_overlaps
+
+
+class Command(BaseCommand):
+    help = (
+        "Toont overlappende tijdregistraties per gebruiker en voegt de overlap-constraints "
+        "toe aan de partities die er (nog) geen hebben."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "enforce"])
+        parser.add_argument("--company", type=int, help="Enkel dit bedrijf (id) tonen.")
+
+    def handle(self, *args, **options):
+        if options["action"] == "list":
+            company = None
+            if options["company"]:
+                company = Company.objects.filter(pk=options["company"]).first()
+                if company is None:
+                    raise CommandError(f"Bedrijf {options['company']} bestaat niet.")
+
+            overlaps = find_overlaps(company=company)
+            for overlap in overlaps:
+                self.stdout.write(
+                    f"gebruiker {overlap.user_id}: #{overlap.first_id} "
+                    f"({overlap.first_start} - {overlap.first_end}) overlapt met "
+                    f"#{overlap.second_id} ({overlap.second_start} - {overlap.second_end})"
+                )
+            self.stdout.write(f"{len(overlaps)} overlappingen gevonden.")
+            return
+
+        if connection.vendor != "postgresql":
+            raise CommandError("De overlap-constraints bestaan enkel op PostgreSQL.")
+        skipped = enforce_overlap_constraints()
+        if skipped:
+            raise CommandError(
+                f"Nog overlappingen in {', '.join(skipped)}; ruim die eerst op (zie 'list')."
+            )
+        self.stdout.write(self.style.SUCCESS("[+] Alle partities hebben een overlap-constraint."))
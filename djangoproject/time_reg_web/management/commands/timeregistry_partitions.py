@@ -0,0 +1,65 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from time_reg_web.partitions import (
+    attach_partition,
+    detach_partition,
+    ensure_future_partitions,
+    is_partitioned,
+    list_partitions,
+)
+
+
+def parse_month(value):
+    """Maand als YYYY-MM."""
+    return date.fromisoformat(f"{value}-01")
+
+
+class Command(BaseCommand):
+    help = (
+        "Beheert de maandpartities van de tijdregistraties: tonen, vooraf aanmaken, "
+        "loskoppelen (archiveren) en terug aanhangen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "ensure", "detach", "attach"])
+        parser.add_argument(
+            "--month", type=parse_month, help="Maand (YYYY-MM) voor detach en attach."
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            help="Aantal maanden vooruit voor ensure (standaard uit de settings).",
+        )
+        parser.add_argument(
+            "--archive-schema",
+            help="Schema waar een losgekoppelde partitie naartoe gaat (of vandaan komt).",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("De tabel met tijdregistraties is niet gepartitioneerd.")
+
+        action = options["action"]
+        if action == "list":
+            for name, bounds in list_partitions():
+                self.stdout.write(f"{name}: {bounds}")
+            return
+
+        if action == "ensure":
+            created = ensure_future_partitions(options["months_ahead"])
+            self.stdout.write(self.style.SUCCESS(f"[+] {len(created)} partities aangemaakt."))
+            return
+
+        if not options["month"]:
+            raise CommandError(f"--month is verplicht voor {action}.")
+
+        try:
+            if action == "detach":
+                name = detach_partition(options["month"], options["archive_schema"])
+                self.stdout.write(self.style.SUCCESS(f"[+] Partitie {name} losgekoppeld."))
+            else:
+                name = attach_partition(options["month"], options["archive_schema"])
+                self.stdout.write(self.style.SUCCESS(f"[+] Partitie {name} aangehangen."))
+        except ValueError as e:
+            raise CommandError(str(e))
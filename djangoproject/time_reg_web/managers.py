@@ -0,0 +1,54 @@
+"""Managers die de queries van een model beperken tot het bedrijf van de request.
+
+De modellen van een bedrijf (klanten, projecten, registraties, ...) hebben twee
+managers:
+
+- `objects` (`TenantManager`): elke query begint met `company_id = <bedrijf>`,
+  het bedrijf uit de tenant-context. Als eerste predicaat past dat op de indexen die
+  met company beginnen. Een request zonder actief bedrijf ziet niets.
+- `unscoped`: geen beperking. Enkel voor code die bewust over bedrijven heen werkt
+  (beheer, taken over alle bedrijven, de API met een projecttoken).
+
+De tenant-context is een contextvar, gezet door `TenantMiddleware` voor de duur van
+de request, of met `tenant_context(company_id)`. Hij volgt de request ook naar
+threads van sync_to_async (zie `concurrency`).
+
+Zonder context (een request zonder actief bedrijf, maar ook django-q taken,
+management commands en de shell) geeft `objects` niets terug: een vergeten context
+levert een lege lijst op, nooit de rijen van alle bedrijven. Code buiten een request
+kiest dus expliciet: `tenant_context(company_id)` voor het werk van één bedrijf, of
+`unscoped`. Ook `dumpdata` gebruikt `objects`; gebruik daar `--all`.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models
+
+_current_company_id = ContextVar("current_company_id", default=None)
+
+
+@contextmanager
+def tenant_context(company_id):
+    """Beperkt `objects` tot `company_id` binnen het blok (None: niets zichtbaar)."""
+    token = _current_company_id.set(company_id)
+    try:
+        yield
+    finally:
+        _current_company_id.reset(token)
+
+
+class TenantQuerySet(models.QuerySet):
+    def for_company(self, company_id):
+        return self.filter(company_id=company_id)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    """Manager die elke query beperkt tot het bedrijf uit de tenant-context."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        company_id = _current_company_id.get()
+        if company_id is None:
+            return queryset.none()
+        return queryset.for_company(company_id)
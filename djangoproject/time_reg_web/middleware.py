@@ -0,0 +1,87 @@
+"""Middleware die per request het actieve bedrijf (tenant) bepaalt.
+
+`TenantMiddleware` laadt na de authenticatie het profiel en het actieve bedrijf van
+de gebruiker in één query en zet het resultaat als `request.tenant`, een
+onveranderlijke `Tenant`. Views, mixins en templates lezen het bedrijf daar
+(`request.tenant.company`) in plaats van via `request.user.profile.company`, wat
+telkens het profiel en het bedrijf apart ophaalt.
+
+Voor de duur van de request is het bedrijf ook de tenant-context van de modellen
+(zie `managers`): hun `objects` geeft enkel rijen van dit bedrijf.
+
+Het actieve bedrijf uit het profiel telt enkel als de gebruiker er (nog) lid van is.
+Die controle wordt per bedrijf en gebruiker gecachet (zie `caching`); een wijziging
+aan de leden van het bedrijf verhoogt de generatie van `Company` (zie `reference`).
+"""
+
+from collections import namedtuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .caching import cached_for_tenant
+from .managers import tenant_context
+from .models import Company, UserProfile
+
+
+class Tenant(namedtuple("Tenant", ["user", "profile", "company", "is_admin"])):
+    """Gebruiker, profiel en actief bedrijf van een request; `profile` en `company`
+    zijn None als de gebruiker (nog) geen profiel of bedrijf heeft."""
+
+    __slots__ = ()
+
+    @property
+    def company_id(self):
+        return self.company.pk if self.company is not None else None
+
+
+def is_member(company, user):
+    """Of de gebruiker lid is van het bedrijf, uit de cache indien mogelijk."""
+    return cached_for_tenant(
+        company.pk,
+        "membership",
+        (Company,),
+        lambda: company.members.filter(pk=user.pk).exists(),
+        params={"user": user.pk},
+    )
+
+
+def resolve_tenant(request):
+    user = request.user
+    if not user.is_authenticated:
+        return Tenant(user, None, None, False)
+
+    profile = UserProfile.objects.select_related("company").filter(user=user).first()
+    if profile is None:
+        return Tenant(user, None, None, user.is_superuser)
+
+    # Zet ook user.profile, zodat code die het profiel nog zo leest geen query doet
+    profile.user = user
+    company = profile.company
+    if company is not None and not is_member(company, user):
+        company = None
+    return Tenant(user, profile, company, profile.is_company_admin or user.is_superuser)
+
+
+class TenantMiddleware:
+    """Zet `request.tenant` en de tenant-context; hoort na AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.tenant = resolve_tenant(request)
+        with tenant_context(request.tenant.company_id):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.tenant = await sync_to_async(resolve_tenant)(request)
+        # De context geldt ook in de threads van sync_to_async (ze krijgen een kopie)
+        with tenant_context(request.tenant.company_id):
+            return await self.get_response(request)
@@ -0,0 +1,80 @@
+# Generated by Django 6.1.2 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("time_reg_web", "0015_schedule_purge_export_jobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTimeRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("entry_count", models.IntegerField(default=0)),
+                ("raw_seconds", models.BigIntegerField(default=0)),
+                ("rounded_seconds", models.BigIntegerField(default=0)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="time_reg_web.company",
+                    ),
+                ),
+                (
+                    "divisie",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="time_reg_web.divisies",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="time_reg_web.project",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["company", "day"], name="rollup_company_day_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("company", "user", "project", "divisie", "day"),
+                        name="unique_daily_time_rollup",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY kan niet binnen een transactie draaien. Zo blijft de
+    # tabel tijdens de deploy beschikbaar voor lezen en schrijven. Op PostgreSQL zet 0018
+    # de tabel om naar partities en bouwt deze indexen daar opnieuw, ook zonder lock.
+    atomic = False
+
+    dependencies = [
+        ("time_reg_web", "0016_dailytimerollup"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="timeregistry",
+            index=models.Index(
+                condition=models.Q(("end_time__isnull", True)),
+                fields=["user"],
+                name="timereg_open_timer_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="timeregistry",
+            index=models.Index(fields=["company", "start_time"], name="timereg_company_start_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="timeregistry",
+            index=models.Index(
+                fields=["project", "-start_time"], name="timereg_project_start_idx"
+            ),
+        ),
+    ]
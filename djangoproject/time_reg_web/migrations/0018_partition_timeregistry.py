@@ -0,0 +1,181 @@
+"""Zet time_reg_web_timeregistry om naar een tabel met maandelijkse range-partities.
+
+De bestaande tabel wordt hernoemd, de gepartitioneerde tabel wordt met dezelfde
+kolommen aangemaakt, de gegevens worden gekopieerd en de oude tabel wordt verwijderd.
+Dit gebeurt in één transactie: de tabel is tijdens de kopie vergrendeld, plan de
+migratie dus in een onderhoudsvenster.
+
+De indexen worden pas na die transactie gebouwd, zonder de tabel te vergrendelen:
+eerst een (nog ongeldige) index op enkel de hoofdtabel, dan per partitie een index
+met CREATE INDEX CONCURRENTLY die aan de hoofdindex gekoppeld wordt. Tot alle indexen
+klaar zijn is de tabel bruikbaar, maar zijn de queries erop trager. Loopt die stap
+mis, dan voert een nieuwe `migrate` enkel de ontbrekende indexen uit.
+
+PostgreSQL vereist dat de partitiesleutel in de primaire sleutel zit, daarom is die
+nu (id, start_time). De id's blijven uniek omdat ze uit één sequence komen.
+"""
+
+from datetime import date, datetime, time
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = "time_reg_web_timeregistry"
+OLD_TABLE = "time_reg_web_timeregistry_unpartitioned"
+SEQUENCE = "time_reg_web_timeregistry_id_seq"
+
+# Partities vooraf aanmaken voor de komende maanden (zie ook de geplande taak)
+MONTHS_AHEAD = 3
+
+CREATE_PARTITIONED_TABLE = [
+    f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"',
+    # De index van de primaire sleutel behoudt zijn naam bij het hernoemen van de tabel;
+    # die naam is nodig voor de primaire sleutel van de nieuwe tabel
+    f'ALTER INDEX "{TABLE}_pkey" RENAME TO "{OLD_TABLE}_pkey"',
+    # Kolommen en defaults overnemen; de identity (en haar sequence) niet
+    f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}" INCLUDING DEFAULTS) '
+    f"PARTITION BY RANGE (start_time)",
+    f'ALTER TABLE "{OLD_TABLE}" ALTER COLUMN id DROP IDENTITY',
+    f'CREATE SEQUENCE "{SEQUENCE}" OWNED BY "{TABLE}".id',
+    f'ALTER TABLE "{TABLE}" ALTER COLUMN id SET DEFAULT nextval(\'"{SEQUENCE}"\')',
+    f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY (id, start_time)',
+    f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT',
+]
+
+COPY_DATA = [
+    f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"',
+    f"SELECT setval('\"{SEQUENCE}\"', COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+    f'FROM "{TABLE}"',
+    f'DROP TABLE "{OLD_TABLE}"',
+]
+
+FOREIGN_KEYS = [
+    ("company_id", "time_reg_web_company"),
+    ("user_id", "auth_user"),
+    ("project_id", "time_reg_web_project"),
+    ("divisie_id", "time_reg_web_divisies"),
+    ("Todo_id", "time_reg_web_todo"),
+]
+
+CREATE_CONSTRAINTS = [
+    f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_{column.lower()}_fk" '
+    f'FOREIGN KEY ("{column}") REFERENCES "{target}" (id) DEFERRABLE INITIALLY DEFERRED'
+    for column, target in FOREIGN_KEYS
+]
+
+# (naam, definitie); met dezelfde namen als de indexen van de modellen (zie 0017)
+INDEXES = [
+    *((f"{TABLE}_{column.lower()}_idx", f'("{column}")') for column, _ in FOREIGN_KEYS),
+    ("timereg_open_timer_idx", "(user_id) WHERE end_time IS NULL"),
+    ("timereg_company_start_idx", "(company_id, start_time)"),
+    ("timereg_project_start_idx", "(project_id, start_time DESC)"),
+]
+
+
+# De partities worden hier zelf aangemaakt en niet via time_reg_web.partitions: een
+# latere wijziging aan die module mag niet veranderen wat deze migratie doet
+def month_start(day):
+    if isinstance(day, datetime):
+        day = timezone.localtime(day).date()
+    return day.replace(day=1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partition(cursor, month):
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(datetime.combine(add_months(month, 1), time.min))
+    cursor.execute(
+        f'CREATE TABLE "{TABLE}_{month:%Y%m}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+    return cursor.fetchone() is not None
+
+
+def partition_timeregistry(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        # Partitionering bestaat enkel op PostgreSQL; andere databases blijven ongewijzigd
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            # Al omgezet bij een eerdere poging die bij de indexen afbrak
+            return
+
+        for statement in CREATE_PARTITIONED_TABLE:
+            cursor.execute(statement)
+
+        # Eén partitie per maand vanaf de oudste registratie, plus de komende maanden
+        cursor.execute(f'SELECT MIN(start_time) FROM "{OLD_TABLE}"')
+        first = cursor.fetchone()[0]
+        this_month = month_start(timezone.now())
+        month = month_start(first) if first else this_month
+        while month <= add_months(this_month, MONTHS_AHEAD):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        for statement in COPY_DATA + CREATE_CONSTRAINTS:
+            cursor.execute(statement)
+
+
+def partitions(cursor):
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname",
+        [TABLE],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def index_state(cursor, name):
+    """None als de index niet bestaat, anders of hij geldig is."""
+    cursor.execute(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [f'"{name}"']
+    )
+    row = cursor.fetchone()
+    return row and row[0]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        tables = partitions(cursor)
+        for name, definition in INDEXES:
+            # Nieuwe partities krijgen deze index vanzelf (zie time_reg_web.partitions)
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON ONLY "{TABLE}" {definition}')
+            for table in tables:
+                child = f"{name}_{table.removeprefix(f'{TABLE}_')}"
+                if index_state(cursor, child) is False:
+                    # Overblijfsel van een afgebroken CREATE INDEX CONCURRENTLY
+                    cursor.execute(f'DROP INDEX CONCURRENTLY "{child}"')
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{child}" ON "{table}" {definition}'
+                )
+                # Eens elke partitie gekoppeld is, wordt de index op de hoofdtabel geldig
+                cursor.execute(f'ALTER INDEX "{name}" ATTACH PARTITION "{child}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY kan niet binnen een transactie draaien; de omzetting
+    # zelf loopt wel in één transactie
+    atomic = False
+
+    dependencies = [
+        ("time_reg_web", "0017_timeregistry_indexes"),
+    ]
+
+    operations = [
+        # Niet omkeerbaar: terug naar een gewone tabel gaat via een dump en restore
+        migrations.RunPython(partition_timeregistry, atomic=True),
+        migrations.RunPython(create_indexes, atomic=False),
+    ]
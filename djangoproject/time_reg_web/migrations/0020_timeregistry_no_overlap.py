@@ -0,0 +1,80 @@
+"""Exclusion constraint tegen overlappende registraties per gebruiker (zie `overlaps`).
+
+Elke partitie krijgt haar eigen constraint. Een partitie die al overlappende
+registraties bevat wordt overgeslagen (met een waarschuwing); ruim die op en voeg de
+constraint nadien toe met `manage.py timeregistry_overlaps enforce`.
+
+Het aanmaken bouwt per partitie een GiST-index en vergrendelt die partitie tot het
+einde van de migratie.
+"""
+
+import logging
+
+from django.db import DatabaseError, migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+TABLE = "time_reg_web_timeregistry"
+
+# De DDL staat hier zelf en niet via time_reg_web.overlaps: een latere wijziging aan
+# die module mag niet veranderen wat deze migratie doet
+ADD_CONSTRAINT = (
+    'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_no_overlap" '
+    "EXCLUDE USING gist (user_id WITH =, tstzrange(start_time, end_time) WITH &&) "
+    "WHERE (end_time IS NOT NULL AND end_time > start_time)"
+)
+DROP_CONSTRAINT = 'ALTER TABLE "{table}" DROP CONSTRAINT IF EXISTS "{table}_no_overlap"'
+
+
+def partitions(cursor):
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " WHERE pg_inherits.inhparent = to_regclass(%s) ORDER BY child.relname",
+        [TABLE],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def add_overlap_constraints(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    skipped = []
+    with connection.cursor() as cursor:
+        # btree_gist: gelijkheid op user_id binnen een GiST-index
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        for table in partitions(cursor):
+            try:
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute(ADD_CONSTRAINT.format(table=table))
+            except DatabaseError:
+                skipped.append(table)
+
+    if skipped:
+        logger.warning(
+            f"[OVERLAPS] Geen overlap-constraint op {', '.join(skipped)}: er zijn "
+            f"overlappende registraties. Zie 'manage.py timeregistry_overlaps list'."
+        )
+
+
+def remove_overlap_constraints(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        for table in partitions(cursor):
+            cursor.execute(DROP_CONSTRAINT.format(table=table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("time_reg_web", "0019_schedule_create_future_partitions"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_constraints, remove_overlap_constraints),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 6.1.2 on 2026-10-18 07:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_rounded_to_billed(apps, schema_editor):
+    # Zonder facturatieregels is er geen daglimiet: gefactureerd = afgerond
+    DailyTimeRollup = apps.get_model("time_reg_web", "DailyTimeRollup")
+    DailyTimeRollup.objects.update(billed_seconds=F("rounded_seconds"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("time_reg_web", "0020_timeregistry_no_overlap"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailytimerollup",
+            name="billed_seconds",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_rounded_to_billed, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="BillingPolicy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "rounding",
+                    models.CharField(
+                        choices=[
+                            ("nearest", "Naar dichtstbijzijnde"),
+                            ("up", "Naar boven"),
+                            ("down", "Naar beneden"),
+                        ],
+                        default="nearest",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "increment_minutes",
+                    models.PositiveSmallIntegerField(
+                        default=5,
+                        help_text="Afronden op een veelvoud van zoveel minuten",
+                    ),
+                ),
+                (
+                    "minimum_minutes",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Elke registratie telt minstens zoveel minuten",
+                    ),
+                ),
+                (
+                    "daily_cap_hours",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        help_text="Maximum aantal uren per gebruiker per dag voor deze klant",
+                        max_digits=4,
+                        null=True,
+                    ),
+                ),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="billing_policies",
+                        to="time_reg_web.company",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="billing_policies",
+                        to="time_reg_web.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Facturatieregel",
+                "verbose_name_plural": "Facturatieregels",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("company", "customer"),
+                        name="unique_billing_policy",
+                        nulls_distinct=False,
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(("increment_minutes__gt", 0)),
+                        name="billing_increment_positive",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("time_reg_web", "0021_billing_policies"),
+    ]
+
+    operations = [
+        # Bestaande registraties krijgen het tijdstip van de migratie als laatste wijziging
+        migrations.AddField(
+            model_name="timeregistry",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Een gewone (niet-concurrente) index: op de gepartitioneerde hoofdtabel kan
+        # PostgreSQL geen CREATE INDEX CONCURRENTLY; elke partitie krijgt haar eigen index
+        migrations.AddIndex(
+            model_name="timeregistry",
+            index=models.Index(
+                fields=["project", "updated_at"], name="timereg_project_updated_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="TimeRegistryTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("entry_id", models.BigIntegerField()),
+                ("company_id", models.BigIntegerField()),
+                ("project_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["project_id", "deleted_at"],
+                        name="tombstone_project_deleted_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.1.2 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("time_reg_web", "0023_schedule_purge_tombstones"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="budget_hours",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Gebudgetteerde uren voor het hele project (leeg = geen budget)",
+                max_digits=8,
+                null=True,
+            ),
+        ),
+    ]
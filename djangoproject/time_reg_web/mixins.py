@@ -6,12 +6,28 @@ from django.shortcuts import redirect
 
 class TenantObjectMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
+        response = self._tenant_redirect(request)
+        if response is None:
+            return super().dispatch(request, *args, **kwargs)
+        if self.view_is_async:
+            # Een async view moet ook een omleiding als coroutine teruggeven
+            async def func():
+                return response
+
+            return func()
+        return response
+
+    def _tenant_redirect(self, request):
+        """Response als de gebruiker de view niet mag zien (of eerst een bedrijf moet kiezen).
+
+        Doet geen queries: `request.tenant` is al opgehaald door de middleware.
+        """
         # 1. Is user ingelogd? (LoginRequiredMixin doet dit al, maar dubbelcheck voor flow)
         if not request.user.is_authenticated:
             return self.handle_no_permission()
 
         # 2. Heeft de user een actief bedrijf in zijn profiel?
-        if not hasattr(request.user, "profile") or not request.user.profile.company:
+        if request.tenant.company is None:
             # GEEN bedrijf? -> Forceer naar selectie/aanmaak pagina
             # Voorkom redirect loop als we al op de selectie pagina zitten
             if request.resolver_match.url_name not in [
@@ -20,11 +36,10 @@ class TenantObjectMixin(LoginRequiredMixin):
                 "switch_company",
             ]:
                 return redirect("eventaflow:select_company")
-
-        return super().dispatch(request, *args, **kwargs)
+        return None
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        if not hasattr(self.request.user, "profile") or not self.request.user.profile.company:
+        if self.request.tenant.company is None:
             return queryset.none()
-        return queryset.filter(company=self.request.user.profile.company)
+        return queryset.filter(company=self.request.tenant.company)
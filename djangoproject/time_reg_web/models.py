@@ -7,17 +7,32 @@ users, customers, projects, and time entries.
 import json
 import logging
 import os
+from datetime import datetime, time, timedelta
 
 # We gebruiken de cryptography bibliotheek voor veilige opslag van de API credentials
 from cryptography.fernet import Fernet
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Max
-from django.db.models.signals import post_save
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.db import connections, models
+from django.db.models import BigIntegerField, F, FloatField, Func, Sum
+from django.db.models.functions import Cast, Floor
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .managers import TenantManager, TenantQuerySet
+from .sequences import CompanySequenceManager
 
 logger = logging.getLogger(__name__)
 
+# Standaard afronding zonder facturatieregel: op 5 minuten (300 seconden), zie billing
+ROUNDING_SECONDS = 300
+
+
+def day_start(day):
+    """Begin van een dag (00:00) in de huidige tijdzone, als aware datetime."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
 
 # Helper-klasse voor encryptie van gevoelige API credentials in de database
 class CredentialEncryptor:
@@ -137,6 +152,24 @@ class UserProfile(models.Model):
         return f"Profiel van {self.user.username}"
 
 
+class CompanySequence(models.Model):
+    """Laatst uitgegeven nummer van een reeks (bv. klantnummers) binnen een bedrijf"""
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="sequences")
+    name = models.CharField(max_length=100)
+    last_value = models.BigIntegerField(default=0)
+
+    objects = CompanySequenceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["company", "name"], name="unique_company_sequence")
+        ]
+
+    def __str__(self):
+        return f"{self.company} - {self.name}: {self.last_value}"
+
+
 class Customer(models.Model):
     """Model voor klanten binnen een bedrijf"""
 
@@ -145,15 +178,17 @@ class Customer(models.Model):
     customer_name = models.CharField(max_length=255)
     customer_email = models.EmailField()
 
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
+
     class Meta:
         unique_together = ("company", "customer_id")
 
     def save(self, *args, **kwargs):
         if not self.customer_id:
-            last_id = Customer.objects.filter(company=self.company).aggregate(Max("customer_id"))[
-                "customer_id__max"
-            ]
-            self.customer_id = (last_id or 0) + 1
+            self.customer_id = CompanySequence.objects.next_value(
+                Customer, "customer_id", self.company_id
+            )
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -170,15 +205,17 @@ class Divisies(models.Model):
         max_length=255, blank=True, null=True, help_text="Google Drive map ID voor deze divisie"
     )
 
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
+
     class Meta:
         unique_together = ("company", "divisie_id")
 
     def save(self, *args, **kwargs):
         if not self.divisie_id:
-            last_id = Divisies.objects.filter(company=self.company).aggregate(Max("divisie_id"))[
-                "divisie_id__max"
-            ]
-            self.divisie_id = (last_id or 0) + 1
+            self.divisie_id = CompanySequence.objects.next_value(
+                Divisies, "divisie_id", self.company_id
+            )
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -196,22 +233,162 @@ class Project(models.Model):
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    budget_hours = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Gebudgetteerde uren voor het hele project (leeg = geen budget)",
+    )
+
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
 
     class Meta:
         unique_together = ("company", "project_id")
 
     def save(self, *args, **kwargs):
         if not self.project_id:
-            last_id = Project.objects.filter(company=self.company).aggregate(Max("project_id"))[
-                "project_id__max"
-            ]
-            self.project_id = (last_id or 0) + 1
+            self.project_id = CompanySequence.objects.next_value(
+                Project, "project_id", self.company_id
+            )
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.project_name
 
 
+class BillingPolicy(models.Model):
+    """Facturatieregels van een bedrijf (zonder klant) of van één klant van dat bedrijf.
+
+    Een klant zonder eigen regels volgt die van het bedrijf; een bedrijf zonder regels
+    de standaard (afronden op 5 minuten). De regels worden toegepast door `billing`.
+    """
+
+    ROUND_NEAREST = "nearest"
+    ROUND_UP = "up"
+    ROUND_DOWN = "down"
+
+    ROUNDING_CHOICES = (
+        (ROUND_NEAREST, "Naar dichtstbijzijnde"),
+        (ROUND_UP, "Naar boven"),
+        (ROUND_DOWN, "Naar beneden"),
+    )
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="billing_policies")
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="billing_policies",
+    )
+    rounding = models.CharField(max_length=10, choices=ROUNDING_CHOICES, default=ROUND_NEAREST)
+    increment_minutes = models.PositiveSmallIntegerField(
+        default=ROUNDING_SECONDS // 60, help_text="Afronden op een veelvoud van zoveel minuten"
+    )
+    minimum_minutes = models.PositiveSmallIntegerField(
+        default=0, help_text="Elke registratie telt minstens zoveel minuten"
+    )
+    daily_cap_hours = models.DecimalField(
+        max_digits=4,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Maximum aantal uren per gebruiker per dag voor deze klant",
+    )
+
+    class Meta:
+        verbose_name = "Facturatieregel"
+        verbose_name_plural = "Facturatieregels"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "customer"],
+                name="unique_billing_policy",
+                nulls_distinct=False,
+            ),
+            models.CheckConstraint(
+                condition=models.Q(increment_minutes__gt=0), name="billing_increment_positive"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.customer or self.company} - {self.get_rounding_display()}"
+
+
+class DurationSeconds(Func):
+    """Lengte van een interval (bv. F("end_time") - F("start_time")) in seconden.
+
+    PostgreSQL rekent met een interval; backends zonder interval-type stellen een
+    DurationField voor als een aantal microseconden.
+    """
+
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        extra_context.setdefault("template", "((%(expressions)s) / 1000000.0)")
+        return super().as_sql(compiler, connection, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="EXTRACT(EPOCH FROM %(expressions)s)::double precision",
+            **extra_context,
+        )
+
+
+class TsTzRange(Func):
+    """tstzrange(start, end): de periode van een registratie als PostgreSQL-range."""
+
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+class TimeRegistryQuerySet(TenantQuerySet):
+    """Gedeelde berekeningen op tijdregistraties, volledig in de database.
+
+    Dit is de enige plek waar de afrondingsregel in SQL staat. Exports, totalen en
+    rapporten gebruiken deze methodes in plaats van zelf in Python te rekenen.
+    """
+
+    def in_period(self, start_date=None, end_date=None):
+        """Registraties die starten op een dag van start_date t.e.m. end_date.
+
+        Filtert op een bereik van start_time (en niet op `start_time__date`), zodat
+        de database de index op (company, start_time) kan gebruiken.
+        """
+        if start_date:
+            self = self.filter(start_time__gte=day_start(start_date))
+        if end_date:
+            self = self.filter(start_time__lt=day_start(end_date + timedelta(days=1)))
+        return self
+
+    def overlapping(self, user_id, start_time, end_time):
+        """Afgesloten registraties van een gebruiker die [start_time, end_time) overlappen.
+
+        Op PostgreSQL is de filter dezelfde expressie als de exclusion constraint (zie
+        `overlaps`), zodat de GiST-index van elke partitie gebruikt wordt.
+        """
+        entries = self.filter(
+            user_id=user_id, end_time__isnull=False, end_time__gt=F("start_time")
+        )
+        if connections[self.db].vendor == "postgresql":
+            return entries.alias(period=TsTzRange("start_time", "end_time")).filter(
+                period__overlap=(start_time, end_time)
+            )
+        return entries.filter(start_time__lt=end_time, end_time__gt=start_time)
+
+    def with_durations(self):
+        """Annoteert per registratie de werkelijke duur in hele seconden (duration_seconds).
+
+        Voor lopende timers is die NULL. Afronding en facturatie gebeuren op basis van
+        deze waarde met de regels van het bedrijf (zie `billing.BillingEngine`).
+        """
+        seconds = DurationSeconds(F("end_time") - F("start_time"))
+        return self.annotate(duration_seconds=Cast(Floor(seconds), BigIntegerField()))
+
+
 class TimeRegistry(models.Model):
     """Model voor tijdregistraties binnen een bedrijf"""
 
@@ -227,10 +404,116 @@ class TimeRegistry(models.Model):
     Todo = models.ForeignKey(
         "Todo", on_delete=models.SET_NULL, null=True, blank=True, related_name="time_registrys"
     )
+    # Laatste wijziging, voor de wijzigingsfeed (zie changes.py); bulk_update zet hem zelf
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TenantManager.from_queryset(TimeRegistryQuerySet)()
+    unscoped = TimeRegistryQuerySet.as_manager()
+
+    # De velden van de opgeslagen versie die `previous_state` teruggeeft
+    PREVIOUS_STATE_FIELDS = (
+        "company_id",
+        "user_id",
+        "project_id",
+        "divisie_id",
+        "start_time",
+        "end_time",
+    )
+
+    class Meta:
+        indexes = [
+            # Lopende timer van een gebruiker (dashboard, start_timer)
+            models.Index(
+                fields=["user"],
+                condition=models.Q(end_time__isnull=True),
+                name="timereg_open_timer_idx",
+            ),
+            # Periodefilters per bedrijf, gesorteerd op start (export, rapporten)
+            models.Index(fields=["company", "start_time"], name="timereg_company_start_idx"),
+            # Laatste registraties van een project (api_project_status)
+            models.Index(fields=["project", "-start_time"], name="timereg_project_start_idx"),
+            # Gewijzigde registraties van een project (api_time_entry_changes)
+            models.Index(fields=["project", "updated_at"], name="timereg_project_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.project.project_name} - {self.start_time}"
 
+    def previous_state(self):
+        """De opgeslagen versie van vóór de huidige save, als dict (PREVIOUS_STATE_FIELDS).
+
+        None voor een nieuwe registratie. Wordt opgehaald in pre_save
+        (`remember_previous_state`), dus te gebruiken in de post_save-signalen.
+        """
+        return getattr(self, "_previous_state", None)
+
+
+class TimeRegistryTombstone(models.Model):
+    """Een verwijderde tijdregistratie, zodat de wijzigingsfeed ook verwijderingen meldt.
+
+    Bedrijf en project zijn gewone kolommen en geen foreign keys: de grafsteen wordt
+    aangemaakt terwijl een project of bedrijf (met al zijn registraties) verwijderd
+    wordt, en moet dat overleven. Oude grafstenen ruimt `tasks.purge_tombstones` op.
+    """
+
+    entry_id = models.BigIntegerField()
+    company_id = models.BigIntegerField()
+    project_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project_id", "deleted_at"], name="tombstone_project_deleted_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} - project {self.project_id} - {self.deleted_at}"
+
+
+class DailyTimeRollupQuerySet(models.QuerySet):
+    def total_hours(self):
+        """Totaal van de gefactureerde uren over de geselecteerde rollup-rijen."""
+        seconds = self.aggregate(seconds=Sum("billed_seconds"))["seconds"] or 0
+        return round(seconds / 3600, 2)
+
+
+class DailyTimeRollup(models.Model):
+    """Geregistreerde tijd per bedrijf, gebruiker, project, divisie en dag.
+
+    Wordt incrementeel bijgewerkt wanneer een tijdregistratie afgesloten, gewijzigd of
+    verwijderd wordt (zie rollups.py), zodat totalen niet telkens uit alle
+    registraties herberekend moeten worden. Lopende timers tellen niet mee.
+    """
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="daily_rollups")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_rollups")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="daily_rollups")
+    divisie = models.ForeignKey(
+        Divisies, on_delete=models.CASCADE, null=True, blank=True, related_name="daily_rollups"
+    )
+    day = models.DateField()
+    entry_count = models.IntegerField(default=0)
+    raw_seconds = models.BigIntegerField(default=0)
+    # Per registratie afgerond volgens de facturatieregels (zie billing)
+    rounded_seconds = models.BigIntegerField(default=0)
+    # Idem, na de daglimiet per gebruiker en klant: wat gefactureerd wordt
+    billed_seconds = models.BigIntegerField(default=0)
+
+    objects = DailyTimeRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "user", "project", "divisie", "day"],
+                name="unique_daily_time_rollup",
+                nulls_distinct=False,
+            )
+        ]
+        indexes = [models.Index(fields=["company", "day"], name="rollup_company_day_idx")]
+
+    def __str__(self):
+        return f"{self.day} - project {self.project_id} - {self.rounded_seconds}s"
+
 
 class Milstones(models.Model):
     """Model voor mijlpalen binnen een bedrijf"""
@@ -246,6 +529,9 @@ class Milstones(models.Model):
     is_completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -270,6 +556,9 @@ class Todo(models.Model):
         Milstones, on_delete=models.SET_NULL, null=True, blank=True, related_name="todos"
     )
 
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -292,6 +581,9 @@ class GoogleDocument(models.Model):
     file_type = models.CharField(max_length=20, choices=FILE_TYPES, default="document")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantManager()
+    unscoped = TenantQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} ({self.get_file_type_display()})"
 
@@ -339,7 +631,73 @@ class APITokenUsage(models.Model):
         return f"Usage of {self.token.key} at {self.used_at.isoformat()}"
 
 
+class ExportJob(models.Model):
+    """Achtergrondtaak voor een uren-export.
+
+    De export wordt door een django-q worker gegenereerd en als bestand bewaard.
+    Het bestand kan één keer gedownload worden en verloopt na `EXPORT_JOB_TTL_HOURS`.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_DOWNLOADED = "downloaded"
+    STATUS_EXPIRED = "expired"
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "In wachtrij"),
+        (STATUS_RUNNING, "Bezig"),
+        (STATUS_DONE, "Klaar"),
+        (STATUS_FAILED, "Mislukt"),
+        (STATUS_DOWNLOADED, "Gedownload"),
+        (STATUS_EXPIRED, "Verlopen"),
+    )
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="export_jobs")
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="export_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # Dezelfde filters als het exportformulier: start_date, end_date, customer, project
+    params = models.JSONField(default=dict, blank=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to="exports/", blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    downloaded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Exporttaak"
+        verbose_name_plural = "Exporttaken"
+
+    def __str__(self):
+        return f"Export {self.pk} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Voortgang in procent (0-100)."""
+        if self.status in (self.STATUS_DONE, self.STATUS_DOWNLOADED):
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
+
 # --- SIGNALS ---
+@receiver(pre_save, sender=TimeRegistry)
+def remember_previous_state(sender, instance, **kwargs):
+    """Eén query per save voor alle post_save-signalen (dagtotalen, live, wijzigingsfeed)."""
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (
+            TimeRegistry.unscoped.filter(pk=instance.pk)
+            .values(*TimeRegistry.PREVIOUS_STATE_FIELDS)
+            .first()
+        )
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -0,0 +1,159 @@
+"""Overlappende tijdregistraties: afdwingen in PostgreSQL en opsporen.
+
+Twee afgesloten registraties van dezelfde gebruiker mogen elkaar niet overlappen.
+Op PostgreSQL dwingt een exclusion constraint (btree_gist) dat af:
+
+    EXCLUDE USING gist (user_id WITH =, tstzrange(start_time, end_time) WITH &&)
+
+De tabel is gepartitioneerd en PostgreSQL 15 laat geen exclusion constraint op de
+hoofdtabel toe, dus elke partitie krijgt haar eigen constraint (ook nieuwe partities,
+zie `partitions.create_partition`). Een overlap over een maandgrens heen wordt
+daardoor niet door de database tegengehouden; de controles in de applicatie
+(`TimeRegistryQuerySet.overlapping`) vangen die wel op.
+
+Lopende timers (end_time NULL) vallen buiten de constraint. Een partitie met
+bestaande overlappingen krijgt de constraint pas nadat die opgekuist zijn:
+`manage.py timeregistry_overlaps list` toont ze, `... enforce` voegt de
+ontbrekende constraints toe.
+"""
+
+import logging
+from collections import namedtuple
+
+from django.db import DatabaseError, connection, transaction
+
+from .models import TimeRegistry
+
+logger = logging.getLogger(__name__)
+
+TABLE = TimeRegistry._meta.db_table
+
+# Zelfde voorwaarde als in TimeRegistryQuerySet.overlapping, zodat de index bruikbaar is
+CONSTRAINT_PREDICATE = "end_time IS NOT NULL AND end_time > start_time"
+
+Overlap = namedtuple(
+    "Overlap",
+    ["user_id", "first_id", "first_start", "first_end", "second_id", "second_start", "second_end"],
+)
+
+
+# SQLSTATE van een geschonden exclusion constraint
+EXCLUSION_VIOLATION = "23P01"
+
+
+def is_overlap_violation(error):
+    """Of een IntegrityError van de overlap-constraint komt (psycopg 3 of psycopg2)."""
+    cause = error.__cause__
+    codes = (getattr(cause, "sqlstate", None), getattr(cause, "pgcode", None))
+    return EXCLUSION_VIOLATION in codes
+
+
+def constraint_name(table):
+    return f"{table}_no_overlap"
+
+
+def has_overlap_constraint(table, using=connection):
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s",
+            [table, constraint_name(table)],
+        )
+        return cursor.fetchone() is not None
+
+
+def add_overlap_constraint(table, using=connection):
+    """Voegt de exclusion constraint toe aan één tabel (partitie).
+
+    Geeft False als de tabel al overlappende registraties bevat; de constraint wordt
+    dan niet aangemaakt en de rest van de transactie loopt gewoon verder.
+    """
+    if has_overlap_constraint(table, using=using):
+        return True
+    qn = using.ops.quote_name
+    try:
+        with transaction.atomic(using=using.alias), using.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(constraint_name(table))} "
+                f"EXCLUDE USING gist (user_id WITH =, tstzrange(start_time, end_time) WITH &&) "
+                f"WHERE ({CONSTRAINT_PREDICATE})"
+            )
+    except DatabaseError as e:
+        logger.warning(f"[OVERLAPS] Geen constraint op {table}: {e}")
+        return False
+    logger.info(f"[OVERLAPS] Constraint op {table} aangemaakt")
+    return True
+
+
+def constraint_tables(using=connection):
+    """De tabellen die een constraint krijgen: alle partities, of de tabel zelf."""
+    # Hier geïmporteerd: partitions gebruikt add_overlap_constraint voor nieuwe partities
+    from .partitions import is_partitioned, list_partitions
+
+    if is_partitioned(using):
+        return [name for name, _ in list_partitions(using)]
+    return [TABLE]
+
+
+def enforce_overlap_constraints(using=connection):
+    """Voegt de ontbrekende constraints toe; geeft de tabellen zonder constraint terug."""
+    return [
+        table
+        for table in constraint_tables(using)
+        if not add_overlap_constraint(table, using=using)
+    ]
+
+
+def find_overlaps(company=None, user=None, using=connection):
+    """Alle paren van overlappende afgesloten registraties, per gebruiker en op start.
+
+    Op PostgreSQL gebruikt de join de GiST-index van de constraint; elke registratie
+    wordt enkel vergeleken met de registraties die haar periode raken.
+    """
+    if using.vendor == "postgresql":
+        overlaps = "tstzrange(a.start_time, a.end_time) && tstzrange(b.start_time, b.end_time)"
+    else:
+        overlaps = "a.start_time < b.end_time AND b.start_time < a.end_time"
+
+    filters, params = [], []
+    if company is not None:
+        filters.append("a.company_id = %s")
+        params.append(company.pk)
+    if user is not None:
+        filters.append("a.user_id = %s")
+        params.append(user.pk)
+    where = "".join(f" AND {condition}" for condition in filters)
+
+    qn = using.ops.quote_name
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT a.user_id, a.id, a.start_time, a.end_time, b.id, b.start_time, b.end_time
+            FROM {qn(TABLE)} a
+            JOIN {qn(TABLE)} b
+              ON b.user_id = a.user_id AND {overlaps}
+             AND (b.start_time, b.id) > (a.start_time, a.id)
+             AND b.end_time IS NOT NULL AND b.end_time > b.start_time
+            WHERE a.end_time IS NOT NULL AND a.end_time > a.start_time{where}
+            ORDER BY a.user_id, a.start_time, a.id, b.start_time, b.id
+            """,
+            params,
+        )
+        return [Overlap(*row) for row in cursor.fetchall()]
+
+
+def find_overlapping_pairs(entries):
+    """Overlappingen binnen een lijst (nog niet opgeslagen) registraties.
+
+    Sorteert per gebruiker op start en vergelijkt elke registratie met het tot dan
+    toe laatste einde: O(n log n) in plaats van alle paren. Geeft (eerdere, latere)
+    tuples terug.
+    """
+    pairs = []
+    latest = {}
+    for entry in sorted(entries, key=lambda entry: (entry.user_id, entry.start_time)):
+        previous = latest.get(entry.user_id)
+        if previous is not None and entry.start_time < previous.end_time:
+            pairs.append((previous, entry))
+        if previous is None or entry.end_time > previous.end_time:
+            latest[entry.user_id] = entry
+    return pairs
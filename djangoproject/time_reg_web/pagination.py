@@ -0,0 +1,66 @@
+"""Keyset (cursor) paginatie van tijdregistraties op (start_time, id).
+
+In plaats van OFFSET te gebruiken, onthoudt de cursor de (start_time, id) van de
+laatste rij van de vorige pagina; de volgende pagina begint net daarna. Elke pagina
+kost dus evenveel, hoe diep je ook bladert, en nieuwe registraties doen de rijen
+niet verschuiven. De cursor is ondertekend zodat hij ondoorzichtig en niet te
+vervalsen is.
+"""
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = "time_reg_web.pagination.cursor"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """De cursor is ongeldig of gemanipuleerd."""
+
+
+def encode_cursor(entry):
+    """Ondoorzichtige cursor die naar de positie van `entry` wijst."""
+    return signing.dumps([entry.start_time.isoformat(), entry.pk], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    """Geeft (start_time, id) terug van een cursor uit `encode_cursor`."""
+    try:
+        start_time, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        start_time = parse_datetime(start_time)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor("Ongeldige cursor")
+    if start_time is None or not isinstance(pk, int):
+        raise InvalidCursor("Ongeldige cursor")
+    return start_time, pk
+
+
+def page_size_from(value):
+    """Paginagrootte uit een request-parameter, begrensd op MAX_PAGE_SIZE."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(entries, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Eén pagina registraties, nieuwste eerst, na de positie van `cursor`.
+
+    Geeft (rijen, volgende cursor) terug; de volgende cursor is None op de laatste
+    pagina. Er wordt één rij extra opgehaald om dat te weten, zonder COUNT.
+    """
+    entries = entries.order_by("-start_time", "-id")
+    if cursor:
+        start_time, pk = decode_cursor(cursor)
+        # De extra start_time__lte laat de database de index op start_time gebruiken
+        entries = entries.filter(start_time__lte=start_time).filter(
+            Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=pk)
+        )
+
+    rows = list(entries[: page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,196 @@
+"""Maandelijkse range-partities van de tijdregistraties (PostgreSQL).
+
+De tabel `time_reg_web_timeregistry` is gepartitioneerd op `start_time`, met één
+partitie per kalendermaand (in de tijdzone van het project) en een default-partitie
+voor registraties buiten de aangemaakte maanden. Queries met een periodefilter op
+start_time (zoals `TimeRegistryQuerySet.in_period`) lezen enkel de betrokken partities.
+
+- `ensure_future_partitions` maakt de partities voor de komende maanden vooraf aan
+  (geplande taak, zie `tasks.create_future_partitions`).
+- `detach_partition` koppelt een oude maand los, optioneel naar een archiefschema;
+  `attach_partition` hangt ze terug aan.
+
+Alle functies zijn ook beschikbaar via `manage.py timeregistry_partitions`.
+"""
+
+import logging
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TimeRegistry
+from .overlaps import add_overlap_constraint
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = TimeRegistry._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+
+def month_start(day):
+    """Eerste dag van de maand van `day` (een date of datetime)."""
+    if isinstance(day, datetime):
+        day = timezone.localtime(day).date()
+    return day.replace(day=1)
+
+
+def add_months(month, months):
+    """Eerste dag van de maand `months` maanden na (of voor) `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_{month:%Y%m}"
+
+
+def partition_bounds(month):
+    """Begin (inclusief) en einde (exclusief) van de maand als aware datetimes."""
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(datetime.combine(add_months(month, 1), time.min))
+    return start, end
+
+
+def is_partitioned(using=connection):
+    """Geeft True als de tijdregistraties-tabel in deze database gepartitioneerd is."""
+    if using.vendor != "postgresql":
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(using=connection):
+    """De huidige partities als lijst van (naam, grenzen) tuples, gesorteerd op naam."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            ORDER BY child.relname
+            """,
+            [PARENT_TABLE],
+        )
+        return cursor.fetchall()
+
+
+def _table_exists(cursor, name, schema="public"):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [f'"{schema}"."{name}"'])
+    return cursor.fetchone()[0]
+
+
+def create_partition(month, using=connection):
+    """Maakt de partitie voor de maand van `month` aan, als die nog niet bestaat.
+
+    Registraties uit die maand die al in de default-partitie staan, worden eerst naar
+    de nieuwe tabel verplaatst; anders weigert PostgreSQL de partitie aan te hangen.
+    De partitie krijgt de exclusion constraint uit `overlaps`.
+    Geeft True als de partitie nieuw is.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    start, end = partition_bounds(month)
+    qn = using.ops.quote_name
+
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        if _table_exists(cursor, name):
+            return False
+
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} "
+            f"(LIKE {qn(PARENT_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        if _table_exists(cursor, DEFAULT_PARTITION):
+            cursor.execute(
+                f"WITH moved AS ("
+                f"  DELETE FROM {qn(DEFAULT_PARTITION)}"
+                f"  WHERE start_time >= %s AND start_time < %s RETURNING *"
+                f") INSERT INTO {qn(name)} SELECT * FROM moved",
+                [start, end],
+            )
+            if cursor.rowcount:
+                logger.info(f"[PARTITIONS] {cursor.rowcount} rijen uit default naar {name}")
+        # De exclusion constraint kan niet op de hoofdtabel en wordt dus per partitie gezet
+        add_overlap_constraint(name, using=using)
+        # De indexen van de hoofdtabel worden bij het aanhangen automatisch aangemaakt
+        cursor.execute(
+            f"ALTER TABLE {qn(PARENT_TABLE)} ATTACH PARTITION {qn(name)} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    logger.info(f"[PARTITIONS] Partitie {name} aangemaakt")
+    return True
+
+
+def ensure_partitions(first_month, last_month, using=connection):
+    """Maakt alle ontbrekende partities van first_month t.e.m. last_month aan."""
+    created = []
+    month = month_start(first_month)
+    last_month = month_start(last_month)
+    while month <= last_month:
+        if create_partition(month, using=using):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(months_ahead=None, using=connection):
+    """Zorgt dat de partities voor deze maand en de komende `months_ahead` maanden bestaan."""
+    if months_ahead is None:
+        months_ahead = settings.TIMEREGISTRY_PARTITION_MONTHS_AHEAD
+    if not is_partitioned(using):
+        logger.warning("[PARTITIONS] Tabel is niet gepartitioneerd, niets te doen")
+        return []
+    this_month = month_start(timezone.localdate())
+    return ensure_partitions(this_month, add_months(this_month, months_ahead), using=using)
+
+
+def detach_partition(month, archive_schema=None, using=connection):
+    """Koppelt de partitie van een maand los van de tijdregistraties.
+
+    De tabel blijft bestaan (bv. voor pg_dump of als archief) maar de registraties
+    zijn niet meer zichtbaar in de applicatie. Met `archive_schema` wordt de tabel
+    naar dat schema verplaatst. De dagtotalen blijven behouden; herbereken die
+    periode dus niet zolang de partitie losgekoppeld is.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    qn = using.ops.quote_name
+
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        if name not in {partition for partition, _ in list_partitions(using)}:
+            raise ValueError(f"Partitie {name} is niet aangehangen")
+        cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} DETACH PARTITION {qn(name)}")
+        if archive_schema:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {qn(archive_schema)}")
+            cursor.execute(f"ALTER TABLE {qn(name)} SET SCHEMA {qn(archive_schema)}")
+    logger.info(f"[PARTITIONS] Partitie {name} losgekoppeld")
+    return name
+
+
+def attach_partition(month, archive_schema=None, using=connection):
+    """Hangt een eerder losgekoppelde maand terug aan (eventueel uit `archive_schema`)."""
+    month = month_start(month)
+    name = partition_name(month)
+    start, end = partition_bounds(month)
+    qn = using.ops.quote_name
+
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        if archive_schema:
+            if not _table_exists(cursor, name, schema=archive_schema):
+                raise ValueError(f"Tabel {archive_schema}.{name} bestaat niet")
+            cursor.execute(f"ALTER TABLE {qn(archive_schema)}.{qn(name)} SET SCHEMA public")
+        elif not _table_exists(cursor, name):
+            raise ValueError(f"Tabel {name} bestaat niet")
+        cursor.execute(
+            f"ALTER TABLE {qn(PARENT_TABLE)} ATTACH PARTITION {qn(name)} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    logger.info(f"[PARTITIONS] Partitie {name} aangehangen")
+    return name
@@ -0,0 +1,143 @@
+"""Querybudget per view: telt de queries van elke request en meldt N+1-patronen.
+
+`QueryBudgetMiddleware` telt het aantal queries en de databasetijd van een request,
+ook die van de threads van sync_to_async (zie `concurrency`). Een request die meer
+queries doet dan het budget van zijn view, of dezelfde query (zonder parameters)
+minstens QUERY_BUDGET_REPEAT_LIMIT keer herhaalt, wordt gelogd met de naam van de
+view. Met QUERY_BUDGET_RAISE faalt de request met `QueryBudgetExceeded`, zodat een
+test met de test client een regressie opvangt.
+
+Het budget staat bij de view: `query_budget = n` op een class-based view, of de
+decorator `@query_budget(n)` op een functie. Views zonder budget krijgen
+QUERY_BUDGET_DEFAULT. Het budget geldt voor een koude cache: de eerste request na een
+wijziging haalt de gecachte gegevens (zie `caching`) opnieuw op. Met de db-cache
+(CACHE_BACKEND=db) tellen de cache-lookups mee; de budgetten gaan uit van locmem of
+file. Queries tijdens het streamen van een response (exports, live-updates) vallen
+buiten de request en tellen niet mee.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# (sql, duur in seconden) van de queries van de huidige request
+_current_queries = ContextVar("current_queries", default=None)
+
+_IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Decorator voor een functie-view: het maximale aantal queries per request."""
+
+    def decorator(view):
+        view.query_budget = limit
+        return view
+
+    return decorator
+
+
+def fingerprint(sql):
+    """De SQL zonder getallen of lengte van IN-lijsten, om herhaalde queries te herkennen."""
+    sql = _IN_LIST.sub("(%s, ...)", sql)
+    return _WHITESPACE.sub(" ", _NUMBER.sub("?", sql)).strip()
+
+
+def _record(execute, sql, params, many, context):
+    queries = _current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # list.append is thread-safe; de loaders van een async view schrijven mee
+        queries.append((sql, time.perf_counter() - start))
+
+
+def _install(connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+def check_budget(request, queries):
+    """Logt (of weigert met QUERY_BUDGET_RAISE) een request boven het budget of met N+1."""
+    match = request.resolver_match
+    if match is None:
+        return
+    view = getattr(match.func, "view_class", match.func)
+    budget = getattr(view, "query_budget", settings.QUERY_BUDGET_DEFAULT)
+    duration_ms = sum(duration for _, duration in queries) * 1000
+
+    problems = []
+    if len(queries) > budget:
+        problems.append(f"budget {budget} overschreden")
+    repeated = Counter(fingerprint(sql) for sql, _ in queries)
+    for sql, count in repeated.most_common():
+        if count < settings.QUERY_BUDGET_REPEAT_LIMIT:
+            break
+        problems.append(f"{count}x dezelfde query: {sql[:300]}")
+
+    summary = f"[QUERIES] {match.view_name}: {len(queries)} queries in {duration_ms:.1f} ms"
+    if not problems:
+        logger.debug(summary)
+        return
+    message = f"{summary}; " + "; ".join(problems)
+    if settings.QUERY_BUDGET_RAISE:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMiddleware:
+    """Telt de queries per request; hoort vóór de middleware die queries doet (sessie)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Elke verbinding (ook die van andere threads) krijgt de teller
+        connection_created.connect(_install, dispatch_uid="query-budget")
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = []
+        token = _current_queries.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_queries.reset(token)
+        check_budget(request, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = []
+        token = _current_queries.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_queries.reset(token)
+        check_budget(request, queries)
+        return response
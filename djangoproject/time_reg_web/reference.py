@@ -0,0 +1,87 @@
+"""Referentiegegevens van een bedrijf voor de keuzelijsten in de schermen.
+
+Dashboard, to-do's, milestones, export, weekoverzicht en de klant- en
+projectformulieren tonen dezelfde lijsten (klanten, projecten, divisies, milestones,
+leden). Die worden één keer per bedrijf opgehaald als compacte `Choice`-tuples en
+gecachet (zie `caching`); een wijziging aan één van de modellen in `DEPENDS_ON`
+laat ze opnieuw ophalen. Wijzigingen aan de leden van een bedrijf (of de naam van
+een lid) verhogen de generatie van `Company`.
+"""
+
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from .caching import bump_generation_on_commit, cached_for_tenant
+from .models import Company, Customer, Divisies, Milstones, Project
+
+# `detail` is het e-mailadres van een klant of de klantnaam van een project
+Choice = namedtuple("Choice", ["id", "label", "detail", "active"], defaults=(None, True))
+
+ReferenceData = namedtuple(
+    "ReferenceData", ["customers", "projects", "divisies", "milestones", "members"]
+)
+
+DEPENDS_ON = (Customer, Project, Divisies, Milstones, Company)
+
+
+def _load(company):
+    customers = Customer.objects.filter(company=company).order_by("customer_name")
+    projects = Project.objects.filter(company=company).order_by("project_name")
+    divisies = Divisies.objects.filter(company=company).order_by("divisie_name")
+    milestones = Milstones.objects.filter(company=company).order_by("title")
+    return ReferenceData(
+        customers=[
+            Choice(*row)
+            for row in customers.values_list("id", "customer_name", "customer_email")
+        ],
+        projects=[
+            Choice(*row)
+            for row in projects.values_list(
+                "id", "project_name", "customer__customer_name", "is_active"
+            )
+        ],
+        divisies=[Choice(*row) for row in divisies.values_list("id", "divisie_name")],
+        milestones=[Choice(*row) for row in milestones.values_list("id", "title")],
+        members=[
+            Choice(*row)
+            for row in company.members.order_by("username").values_list("id", "username")
+        ],
+    )
+
+
+def tenant_reference_data(company):
+    """De keuzelijsten van een bedrijf als `ReferenceData`, uit de cache indien mogelijk."""
+    return cached_for_tenant(company.pk, "reference-data", DEPENDS_ON, lambda: _load(company))
+
+
+def active_projects(reference):
+    return [project for project in reference.projects if project.active]
+
+
+# --- SIGNALS ---
+@receiver(m2m_changed, sender=Company.members.through)
+def invalidate_members(sender, instance, action, reverse, pk_set, **kwargs):
+    # Bij clear() zijn de bedrijven van een gebruiker enkel vooraf nog te kennen
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    # Vanaf de gebruiker (user.companies.add(...)) zijn de bedrijven de pk_set
+    if not reverse:
+        company_ids = [instance.pk]
+    elif pk_set is not None:
+        company_ids = pk_set
+    else:
+        company_ids = list(instance.companies.values_list("id", flat=True))
+    for company_id in company_ids:
+        bump_generation_on_commit(company_id, Company)
+
+
+@receiver(post_save, sender=User)
+def invalidate_member_name(sender, instance, created, update_fields=None, **kwargs):
+    # Het opslaan van last_login bij elke login verandert de lijsten niet
+    if created or (update_fields and "username" not in update_fields):
+        return
+    for company_id in instance.companies.values_list("id", flat=True):
+        bump_generation_on_commit(company_id, Company)
@@ -0,0 +1,350 @@
+"""Incrementeel bijgehouden dagtotalen (DailyTimeRollup) voor tijdregistraties.
+
+Elke afgesloten tijdregistratie telt mee in precies één rollup-rij, met als sleutel
+(bedrijf, gebruiker, project, divisie, dag). Bij het afsluiten, wijzigen of
+verwijderen van een registratie wordt enkel het verschil op die rij(en) toegepast.
+Met `rebuild_rollups` (of `manage.py rebuild_time_rollups`) worden de rollups voor
+een periode volledig opnieuw berekend.
+
+De afgeronde en gefactureerde seconden volgen de facturatieregels van het bedrijf
+(zie `billing`): in beide gevallen wordt de afronding voor alle betrokken
+registraties in één keer berekend. Wijzigt een regel, dan worden de rollups van
+dat bedrijf op de achtergrond herberekend (`tasks.recalculate_billing`).
+"""
+
+import logging
+from collections import defaultdict
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from .billing import PolicySet, apply_daily_caps, group_index
+from .burndown import invalidate_burndown, refresh_burndown
+from .caching import bump_generation, bump_generation_on_commit
+from .models import BillingPolicy, Company, DailyTimeRollup, Divisies, Project, TimeRegistry
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_ENTRY_FIELDS = (
+    "company_id",
+    "user_id",
+    "project_id",
+    "divisie_id",
+    "start_time",
+    "end_time",
+)
+
+
+class RollupDeltas:
+    """Verzamelt wijzigingen per rollup-sleutel zodat ze in één keer toegepast worden.
+
+    Wordt zowel door de signalen (één registratie) als door bulk-bewerkingen (veel
+    registraties) gebruikt. De registraties worden eerst enkel onthouden; de
+    afronding gebeurt pas bij `items`/`apply`, voor alle registraties tegelijk.
+    """
+
+    def __init__(self):
+        # (sleutel, seconden, sign) per opgetelde of afgetrokken registratie
+        self._pending = []
+        self._policies = {}
+        self._deltas = None
+
+    def add(self, company_id, user_id, project_id, divisie_id, start_time, end_time, sign=1):
+        """Telt een registratie op (sign=1) of af (sign=-1). Lopende timers tellen niet mee."""
+        if not end_time:
+            return
+        key = (company_id, user_id, project_id, divisie_id, timezone.localdate(start_time))
+        self._pending.append((key, int((end_time - start_time).total_seconds()), sign))
+        self._deltas = None
+
+    def add_entry(self, entry, sign=1):
+        """Zelfde als `add`, voor een TimeRegistry instantie."""
+        self.add(*(getattr(entry, field) for field in ROLLUP_ENTRY_FIELDS), sign=sign)
+
+    def policies(self, company_id):
+        if company_id not in self._policies:
+            self._policies[company_id] = PolicySet.for_company(company_id)
+        return self._policies[company_id]
+
+    def _evaluate(self):
+        # sleutel -> [entry_count, raw_seconds, rounded_seconds]
+        deltas = defaultdict(lambda: [0, 0, 0])
+        if not self._pending:
+            return deltas
+
+        keys, seconds, signs = zip(*self._pending)
+        projects = Project.unscoped.filter(pk__in={key[2] for key in keys})
+        customers = dict(projects.values_list("id", "customer_id"))
+        company_ids = np.array([key[0] for key in keys], dtype=np.int64)
+        customer_ids = np.array([customers.get(key[2], 0) for key in keys], dtype=np.int64)
+        seconds_array = np.array(seconds, dtype=np.int64)
+        rounded = np.zeros(len(keys), dtype=np.int64)
+        for company_id in np.unique(company_ids).tolist():
+            mask = company_ids == company_id
+            rounded[mask] = self.policies(company_id).round(
+                seconds_array[mask], customer_ids[mask]
+            )
+
+        for key, raw, sign, value in zip(keys, seconds, signs, rounded.tolist()):
+            delta = deltas[key]
+            delta[0] += sign
+            delta[1] += sign * raw
+            delta[2] += sign * value
+        return deltas
+
+    def __bool__(self):
+        return bool(self._pending)
+
+    def items(self):
+        if self._deltas is None:
+            self._deltas = self._evaluate()
+        for key, delta in self._deltas.items():
+            if any(delta):
+                yield key, delta
+
+    def as_rollups(self):
+        """De verzamelde waarden als (nog niet opgeslagen) DailyTimeRollup objecten."""
+        for (company_id, user_id, project_id, divisie_id, day), delta in self.items():
+            yield DailyTimeRollup(
+                company_id=company_id,
+                user_id=user_id,
+                project_id=project_id,
+                divisie_id=divisie_id,
+                day=day,
+                entry_count=delta[0],
+                raw_seconds=delta[1],
+                rounded_seconds=delta[2],
+                billed_seconds=delta[2],
+            )
+
+    def apply(self):
+        """Past de verschillen toe op de rollup-tabel (één UPDATE per gewijzigde sleutel)."""
+        with transaction.atomic():
+            for rollup in self.as_rollups():
+                _apply_delta(rollup)
+
+            # Rijen waar geen enkele registratie meer in zit, ruimen we op
+            emptied = {key[0] for key, delta in self.items() if delta[0] < 0}
+            if emptied:
+                DailyTimeRollup.objects.filter(company_id__in=emptied, entry_count__lte=0).delete()
+
+            # Per project de vroegste gewijzigde dag, voor de burn-down
+            since = {}
+
+            def changed(project_id, day):
+                since[project_id] = min(day, since.get(project_id, day))
+
+            # Met een daglimiet hangt het gefactureerde deel af van de hele dag
+            affected = defaultdict(lambda: (set(), set()))
+            for company_id, user_id, project_id, _, day in (key for key, _ in self.items()):
+                affected[company_id][0].add(day)
+                affected[company_id][1].add(user_id)
+                changed(project_id, day)
+            for company_id, (days, user_ids) in affected.items():
+                bump_generation_on_commit(company_id, DailyTimeRollup)
+                policies = self.policies(company_id)
+                if policies.has_caps:
+                    apply_daily_caps(company_id, policies, days=days, user_ids=user_ids)
+                    # De limiet kan ook andere projecten van die dagen verlagen
+                    for project_id, day in DailyTimeRollup.objects.filter(
+                        company_id=company_id, day__in=days, user_id__in=user_ids
+                    ).values_list("project_id", "day"):
+                        changed(project_id, day)
+
+            transaction.on_commit(
+                lambda: [refresh_burndown(project_id, day) for project_id, day in since.items()]
+            )
+
+
+def _apply_delta(rollup):
+    lookup = {
+        "company_id": rollup.company_id,
+        "user_id": rollup.user_id,
+        "project_id": rollup.project_id,
+        "divisie_id": rollup.divisie_id,
+        "day": rollup.day,
+    }
+    changes = {
+        "entry_count": F("entry_count") + rollup.entry_count,
+        "raw_seconds": F("raw_seconds") + rollup.raw_seconds,
+        "rounded_seconds": F("rounded_seconds") + rollup.rounded_seconds,
+        "billed_seconds": F("billed_seconds") + rollup.billed_seconds,
+    }
+    if DailyTimeRollup.objects.filter(**lookup).update(**changes):
+        return
+    if rollup.entry_count <= 0:
+        # Niets af te trekken van een rij die (bv. door een cascade delete) al weg is
+        return
+    try:
+        with transaction.atomic():
+            rollup.save(force_insert=True)
+    except IntegrityError:
+        # Een gelijktijdige transactie heeft de rij net aangemaakt
+        DailyTimeRollup.objects.filter(**lookup).update(**changes)
+
+
+def _rollup_totals(entries, chunk_size=50000):
+    """Totalen per rollup-sleutel, per brok registraties berekend met NumPy."""
+    fields = ("company_id", "user_id", "project_id", "divisie_id", "start_time", "end_time")
+    rows = entries.values_list(*fields, "project__customer_id").order_by()
+    iterator = rows.iterator(chunk_size=chunk_size)
+    policies = {}
+    totals = defaultdict(lambda: [0, 0, 0])
+
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), iterator)]
+        if not chunk:
+            return totals
+        companies, users, projects, divisies, starts, ends, customers = zip(*chunk)
+        days = [timezone.localdate(start) for start in starts]
+        company_ids = np.array(companies, dtype=np.int64)
+        seconds = np.array(
+            [int((end - start).total_seconds()) for start, end in zip(starts, ends)],
+            dtype=np.int64,
+        )
+
+        rounded = np.zeros(len(chunk), dtype=np.int64)
+        for company_id in np.unique(company_ids).tolist():
+            if company_id not in policies:
+                policies[company_id] = PolicySet.for_company(company_id)
+            mask = company_ids == company_id
+            rounded[mask] = policies[company_id].round(
+                seconds[mask], np.array(customers, dtype=np.int64)[mask]
+            )
+
+        # Eén optelling per sleutel in plaats van per registratie
+        divisie_ids = [divisie or 0 for divisie in divisies]
+        group = group_index(companies, users, projects, divisie_ids, [d.toordinal() for d in days])
+        counts = np.bincount(group)
+        raw = np.bincount(group, weights=seconds)
+        rounded = np.bincount(group, weights=rounded)
+        first = np.unique(group, return_index=True)[1]
+        for index, position in enumerate(first.tolist()):
+            key = (
+                companies[position],
+                users[position],
+                projects[position],
+                divisies[position],
+                days[position],
+            )
+            total = totals[key]
+            total[0] += int(counts[index])
+            total[1] += int(raw[index])
+            total[2] += int(rounded[index])
+
+
+def rebuild_rollups(start_date, end_date, company_id=None):
+    """Herberekent de rollups voor alle dagen van start_date t.e.m. end_date.
+
+    Geeft het aantal aangemaakte rollup-rijen terug.
+    """
+    with transaction.atomic():
+        rollups = DailyTimeRollup.objects.filter(day__gte=start_date, day__lte=end_date)
+        entries = TimeRegistry.unscoped.in_period(start_date, end_date).filter(
+            end_time__isnull=False
+        )
+        if company_id:
+            rollups = rollups.filter(company_id=company_id)
+            entries = entries.filter(company_id=company_id)
+
+        rollups.delete()
+
+        totals = _rollup_totals(entries)
+        created = DailyTimeRollup.objects.bulk_create(
+            (
+                DailyTimeRollup(
+                    company_id=key[0],
+                    user_id=key[1],
+                    project_id=key[2],
+                    divisie_id=key[3],
+                    day=key[4],
+                    entry_count=total[0],
+                    raw_seconds=total[1],
+                    rounded_seconds=total[2],
+                    billed_seconds=total[2],
+                )
+                for key, total in totals.items()
+            ),
+            batch_size=1000,
+        )
+
+        for pk in {key[0] for key in totals}:
+            policies = PolicySet.for_company(pk)
+            if policies.has_caps:
+                apply_daily_caps(pk, policies, start_date=start_date, end_date=end_date)
+
+    # Samenvattingen, exports en burn-downs komen uit de rollups; die van de bedrijven vervallen
+    company_ids = [company_id] if company_id else Company.objects.values_list("id", flat=True)
+    for pk in company_ids:
+        bump_generation(pk, DailyTimeRollup)
+    projects = Project.unscoped.filter(company_id=company_id) if company_id else Project.unscoped
+    invalidate_burndown(projects.values_list("id", flat=True))
+    return len(created)
+
+
+def project_hours_subquery():
+    """Gefactureerde uren per project uit de rollups, te gebruiken als annotatie op Project."""
+    seconds = (
+        DailyTimeRollup.objects.filter(project=OuterRef("pk"))
+        .values("project")
+        .annotate(seconds=Sum("billed_seconds"))
+        .values("seconds")
+    )
+    return Coalesce(Subquery(seconds), 0) / Value(3600.0, output_field=FloatField())
+
+
+# --- SIGNALS ---
+@receiver(post_save, sender=TimeRegistry)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = RollupDeltas()
+    previous = instance.previous_state()
+    if previous:
+        deltas.add(**previous, sign=-1)
+    deltas.add_entry(instance)
+    if deltas:
+        deltas.apply()
+
+
+@receiver(post_delete, sender=TimeRegistry)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    deltas = RollupDeltas()
+    deltas.add_entry(instance, sign=-1)
+    if deltas:
+        deltas.apply()
+
+
+@receiver(pre_delete, sender=Divisies)
+def remember_divisie_rollup_days(sender, instance, **kwargs):
+    """Bij het verwijderen van een divisie vallen de registraties terug op 'geen divisie'."""
+    instance._rollup_days = list(
+        DailyTimeRollup.objects.filter(divisie=instance).values_list("day", flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Divisies)
+def rebuild_rollups_for_divisie(sender, instance, **kwargs):
+    days = getattr(instance, "_rollup_days", None)
+    if days:
+        rebuild_rollups(min(days), max(days), company_id=instance.company_id)
+
+
+@receiver(post_save, sender=BillingPolicy)
+@receiver(post_delete, sender=BillingPolicy)
+def recalculate_billing_on_policy_change(sender, instance, **kwargs):
+    """Andere regels: alle rollups van het bedrijf opnieuw afronden (op de achtergrond)."""
+    company_id = instance.company_id
+    transaction.on_commit(
+        lambda: async_task(
+            "time_reg_web.tasks.recalculate_billing",
+            company_id,
+            task_name=f"billing-{company_id}",
+        )
+    )
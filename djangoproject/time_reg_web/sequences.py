@@ -0,0 +1,72 @@
+"""Doorlopende nummers per bedrijf (klantnummer, projectnummer, divisienummer).
+
+Elk bedrijf heeft per reeks één rij in `CompanySequence` met het laatst uitgegeven
+nummer. `reserve` verhoogt die rij met één atomische `UPDATE ... RETURNING` en geeft
+de gereserveerde nummers terug; de rij blijft tot het einde van de transactie
+vergrendeld, dus gelijktijdige aanmaken krijgen elk een eigen nummer in plaats van
+op de unique-constraint te botsen. Een reeks van n nummers (voor bulk_create, zie
+`CompanySequenceManager.assign`) kost dezelfde ene query.
+
+De eerste keer dat een reeks voor een bedrijf gebruikt wordt, is er nog geen rij: die
+wordt dan aangemaakt vanaf het hoogste nummer dat al in de tabel staat, met
+`INSERT ... ON CONFLICT DO UPDATE`, zodat ook twee gelijktijdige eerste aanmaken
+correct na elkaar nummeren.
+"""
+
+from collections import defaultdict
+
+from django.db import connections, models
+
+
+def sequence_name(model, field):
+    return f"{model._meta.label_lower}.{field}"
+
+
+class CompanySequenceManager(models.Manager):
+    def reserve(self, model, field, company_id, count=1):
+        """Reserveert `count` opeenvolgende nummers van `model.field` voor het bedrijf.
+
+        Geeft een range met de nummers terug.
+        """
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        name = sequence_name(model, field)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET last_value = last_value + %s"
+                " WHERE company_id = %s AND name = %s RETURNING last_value",
+                [count, company_id, name],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                column = qn(model._meta.get_field(field).column)
+                cursor.execute(
+                    f"INSERT INTO {table} (company_id, name, last_value)"
+                    f" VALUES (%s, %s, (SELECT COALESCE(MAX({column}), 0)"
+                    f" FROM {qn(model._meta.db_table)} WHERE company_id = %s) + %s)"
+                    f" ON CONFLICT (company_id, name)"
+                    f" DO UPDATE SET last_value = {table}.last_value + %s RETURNING last_value",
+                    [company_id, name, company_id, count, count],
+                )
+                row = cursor.fetchone()
+        last = row[0]
+        return range(last - count + 1, last + 1)
+
+    def next_value(self, model, field, company_id):
+        return self.reserve(model, field, company_id)[0]
+
+    def assign(self, instances, field):
+        """Geeft de objecten zonder `field` een nummer, met één reservering per bedrijf.
+
+        Voor objecten die met bulk_create aangemaakt worden (dat roept `save` niet aan).
+        """
+        missing = defaultdict(list)
+        for instance in instances:
+            if not getattr(instance, field):
+                missing[(type(instance), instance.company_id)].append(instance)
+        for (model, company_id), group in missing.items():
+            numbers = self.reserve(model, field, company_id, len(group))
+            for instance, number in zip(group, numbers):
+                setattr(instance, field, number)
@@ -0,0 +1,85 @@
+"""Downloads die onder WSGI én ASGI met constant geheugen streamen.
+
+Onder ASGI leest Django een `StreamingHttpResponse` of `FileResponse` met een sync
+iterator eerst volledig in (`sync_to_async(list)`) voor de eerste byte vertrekt; een
+export van een miljoen rijen staat dan in zijn geheel in het geheugen. Onder ASGI
+krijgen deze responses daarom een async iterator die de sync iterator blok per blok
+leest via sync_to_async. Die draait in de sync-thread van de request, dus een
+databasecursor (zoals die van `ExportRows`) blijft op dezelfde verbinding.
+
+Onder WSGI blijft het een gewone sync iterator: een async iterator zou daar net
+volledig ingelezen worden.
+"""
+
+import os
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+# Grootte van de blokken die naar de client gaan; één sprong naar de sync-thread per blok
+BLOCK_SIZE = 64 * 1024
+
+_END = object()
+
+
+def _blocks(chunks, size=BLOCK_SIZE):
+    """Voegt kleine stukken (bv. één CSV-regel) samen tot blokken van ongeveer `size`."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _file_blocks(fileobj, size=BLOCK_SIZE):
+    with fileobj:
+        while block := fileobj.read(size):
+            yield block
+
+
+async def aiter_sync(iterable):
+    """Async iterator over een sync iterator; elk item wordt in de sync-thread gelezen.
+
+    Een afgebroken download sluit ook de sync iterator, zodat die kan opruimen.
+    """
+    iterator = iter(iterable)
+    get_next = sync_to_async(next)
+    try:
+        while (item := await get_next(iterator, _END)) is not _END:
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def streaming_response(request, chunks, content_type, filename=None):
+    """StreamingHttpResponse over `chunks` (bytes), als bijlage `filename` indien gegeven."""
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_sync(_blocks(chunks))
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if filename:
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
+
+
+def file_response(request, fileobj, filename, content_type):
+    """Download van een geopend binair bestand als bijlage; het bestand wordt gesloten."""
+    if not isinstance(request, ASGIRequest):
+        return FileResponse(
+            fileobj, as_attachment=True, filename=filename, content_type=content_type
+        )
+    response = StreamingHttpResponse(aiter_sync(_file_blocks(fileobj)), content_type=content_type)
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    try:
+        response["Content-Length"] = os.fstat(fileobj.fileno()).st_size
+    except (AttributeError, OSError):
+        # Geen bestand op schijf (bv. een andere storage): zonder lengte
+        pass
+    return response
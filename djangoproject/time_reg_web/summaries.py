@@ -0,0 +1,236 @@
+"""Samenvatting van de geregistreerde uren, gegroepeerd op één of meer dimensies.
+
+Zolang er niet op todo gegroepeerd of gefilterd wordt, gebeurt de aggregatie in SQL
+op de gefactureerde seconden van de dagtotalen (DailyTimeRollup). Anders worden de
+tijdregistraties zelf opgehaald en met dezelfde facturatieregels (zie `billing`)
+geëvalueerd en gegroepeerd. Resultaten worden per bedrijf en filterset gecachet en
+vervallen zodra de generatie van één van `DEPENDS_ON` wijzigt (zie `caching`).
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils.dateparse import parse_date
+
+from .billing import BillingEngine
+from .caching import cached_for_tenant
+from .models import (
+    BillingPolicy,
+    Customer,
+    DailyTimeRollup,
+    Divisies,
+    Project,
+    TimeRegistry,
+    Todo,
+)
+
+# Registraties, dagtotalen en facturatieregels bepalen de cijfers; de andere modellen de labels
+DEPENDS_ON = (TimeRegistry, DailyTimeRollup, BillingPolicy, Customer, Project, Divisies, Todo)
+
+# Een dimensie levert een id en een label; voor datums is het label de datum zelf
+Dimension = namedtuple("Dimension", ["id", "label"])
+
+DIMENSIONS = {
+    "customer": Dimension("project__customer_id", "project__customer__customer_name"),
+    "project": Dimension("project_id", "project__project_name"),
+    "user": Dimension("user_id", "user__username"),
+    "divisie": Dimension("divisie_id", "divisie__divisie_name"),
+    "todo": Dimension("Todo_id", "Todo__title"),
+    "day": Dimension("day", None),
+    "week": Dimension("week", None),
+    "month": Dimension("month", None),
+}
+
+# Filters op id, met het bijbehorende veld (zelfde naam in rollups en registraties)
+ID_FILTERS = {
+    "customer": "project__customer_id",
+    "project": "project_id",
+    "user": "user_id",
+    "divisie": "divisie_id",
+    "todo": "Todo_id",
+}
+
+
+class SummaryError(ValueError):
+    """Ongeldige parameters voor een samenvatting."""
+
+
+def summary_params(data):
+    """Valideert de GET-parameters en geeft een genormaliseerde dict terug.
+
+    group_by mag komma-gescheiden of herhaald meegegeven worden, bv.
+    `?group_by=customer,month` of `?group_by=customer&group_by=month`.
+    """
+    group_by = []
+    for value in data.getlist("group_by") if hasattr(data, "getlist") else [data.get("group_by")]:
+        for dimension in (value or "").split(","):
+            dimension = dimension.strip()
+            if not dimension:
+                continue
+            if dimension not in DIMENSIONS:
+                raise SummaryError(f"Onbekende dimensie: {dimension}")
+            if dimension not in group_by:
+                group_by.append(dimension)
+
+    params = {"group_by": group_by}
+    for field in ("start_date", "end_date"):
+        value = data.get(field) or None
+        if value:
+            try:
+                value = parse_date(value)
+            except ValueError:
+                value = None
+            if value is None:
+                raise SummaryError(f"Ongeldige datum voor {field}")
+            value = value.isoformat()
+        params[field] = value
+    for field in ID_FILTERS:
+        value = data.get(field) or None
+        if value is not None and not str(value).isdigit():
+            raise SummaryError(f"Ongeldige waarde voor {field}")
+        params[field] = int(value) if value is not None else None
+    return params
+
+
+def _uses_entries(params):
+    # De dagtotalen kennen geen todo; daarvoor gaan we naar de registraties zelf
+    return "todo" in params["group_by"] or params["todo"] is not None
+
+
+def _source(company, params):
+    """Queryset met een `day` kolom en de te sommeren velden, gefilterd op params.
+
+    Voor registraties zijn er geen SQL-totalen (None): die worden per registratie
+    berekend in `_group_entries`.
+    """
+    start_date = params["start_date"] and parse_date(params["start_date"])
+    end_date = params["end_date"] and parse_date(params["end_date"])
+
+    if _uses_entries(params):
+        rows = (
+            TimeRegistry.objects.filter(company=company, end_time__isnull=False)
+            .in_period(start_date, end_date)
+            .with_durations()
+            .annotate(day=TruncDate("start_time"))
+        )
+        totals = None
+    else:
+        rows = DailyTimeRollup.objects.filter(company=company)
+        if start_date:
+            rows = rows.filter(day__gte=start_date)
+        if end_date:
+            rows = rows.filter(day__lte=end_date)
+        totals = {"seconds": Sum("billed_seconds"), "entries": Sum("entry_count")}
+
+    for field, lookup in ID_FILTERS.items():
+        if params[field] is not None:
+            rows = rows.filter(**{lookup: params[field]})
+    return rows, totals
+
+
+def _group_entries(rows, fields, group_by):
+    """Groepeert registraties in Python, met de gefactureerde duur per registratie.
+
+    Levert dezelfde rijen (en sortering) als de SQL-aggregatie op de dagtotalen.
+    """
+    billing_fields = ["company_id", "user_id", "project__customer_id", "day", "duration_seconds"]
+    entries = list(
+        rows.order_by().values(*fields, *(name for name in billing_fields if name not in fields))
+    )
+    billed = BillingEngine().billed_seconds(
+        *([entry[name] for entry in entries] for name in billing_fields)
+    )
+
+    groups = {}
+    for entry, seconds in zip(entries, billed.tolist()):
+        key = tuple(entry[field] for field in fields)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {field: entry[field] for field in fields}
+            group["seconds"] = group["entries"] = 0
+        group["seconds"] += seconds
+        group["entries"] += 1
+
+    if not fields:
+        return [groups.get((), {"seconds": 0, "entries": 0})]
+
+    # Zelfde volgorde als in SQL: op het label (of de datum), de lege groep eerst
+    labels = [DIMENSIONS[name].label or DIMENSIONS[name].id for name in group_by]
+    return sorted(
+        groups.values(),
+        key=lambda group: tuple((group[label] is not None, group[label]) for label in labels),
+    )
+
+
+def build_summary(company, params):
+    """Berekent de samenvatting (zonder cache) als JSON-serialiseerbare dict."""
+    rows, totals = _source(company, params)
+    group_by = params["group_by"]
+
+    if "week" in group_by:
+        rows = rows.annotate(week=TruncWeek("day"))
+    if "month" in group_by:
+        rows = rows.annotate(month=TruncMonth("day"))
+
+    fields = []
+    for name in group_by:
+        dimension = DIMENSIONS[name]
+        fields.append(dimension.id)
+        if dimension.label:
+            fields.append(dimension.label)
+
+    if totals is None:
+        grouped = _group_entries(rows, fields, group_by)
+    elif fields:
+        # Sorteren op het label (of de datum), met de lege groep (bv. geen divisie) eerst
+        ordering = [F(DIMENSIONS[name].label or DIMENSIONS[name].id) for name in group_by]
+        grouped = (
+            rows.order_by()
+            .values(*fields)
+            .annotate(**totals)
+            .order_by(*(field.asc(nulls_first=True) for field in ordering))
+        )
+    else:
+        # Zonder dimensies: één rij met het totaal
+        grouped = [rows.order_by().aggregate(**totals)]
+
+    result_rows = []
+    total_seconds = 0
+    total_entries = 0
+    for row in grouped:
+        seconds = row["seconds"] or 0
+        total_seconds += seconds
+        total_entries += row["entries"] or 0
+        item = {}
+        for name in group_by:
+            dimension = DIMENSIONS[name]
+            value = row[dimension.id]
+            if dimension.label:
+                item[name] = {"id": value, "name": row[dimension.label]}
+            else:
+                item[name] = value.isoformat() if value else None
+        item["hours"] = round(seconds / 3600, 2)
+        item["entries"] = row["entries"] or 0
+        result_rows.append(item)
+
+    return {
+        "group_by": group_by,
+        "filters": {key: value for key, value in params.items() if key != "group_by"},
+        "rows": result_rows,
+        "total_hours": round(total_seconds / 3600, 2),
+        "total_entries": total_entries,
+    }
+
+
+def get_summary(company, params):
+    """Zelfde als `build_summary`, maar gecachet per bedrijf en filterset."""
+    return cached_for_tenant(
+        company.pk,
+        "summary",
+        DEPENDS_ON,
+        lambda: build_summary(company, params),
+        params=params,
+        timeout=settings.SUMMARY_CACHE_TIMEOUT,
+    )
@@ -1,16 +1,35 @@
+"""Achtergrondtaken, uitgevoerd door de django-q cluster (`python manage.py qcluster`)."""
+
 import logging
+from datetime import timedelta
 
-from celery import shared_task
 from django.conf import settings
+from django.core.files import File
 from django.core.mail import send_mail
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .changes import purge_tombstones as purge_expired_tombstones
+from .export_cache import cache_path, cache_writer, purge_export_cache
+from .exports import (
+    EXPORT_FORMATS,
+    ExportRows,
+    export_entries_for_params,
+    export_filename,
+    export_params,
+    write_export,
+)
+from .managers import tenant_context
+from .models import DailyTimeRollup, ExportJob
+from .partitions import ensure_future_partitions
+from .rollups import rebuild_rollups
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
 def send_reset_code_email(email, code):
     """
-    Verstuurt de email asynchroon via Celery.
+    Verstuurt de email asynchroon via django-q (`async_task`).
     """
     logger.info(f"[EMAIL] Sending reset code to {email}")
     logger.info(f"[EMAIL] DEBUG mode: {settings.DEBUG}")
@@ -27,10 +46,106 @@ def send_reset_code_email(email, code):
             message,
             settings.DEFAULT_FROM_EMAIL,
             [email],
-            fail_silently=False,  # Zet op False om fouten in Celery logs te zien
+            fail_silently=False,  # Zet op False om fouten in de worker logs te zien
         )
         logger.info(f"[EMAIL] Code successfully sent to {email}")
         return f"Code verzonden naar {email}"
     except Exception as e:
         logger.error(f"[EMAIL] Failed to send email: {e}")
         raise
+
+
+def run_export_job(job_id):
+    """Genereert het exportbestand van een ExportJob en houdt de voortgang bij."""
+    job = ExportJob.objects.select_related("company").get(pk=job_id)
+    if job.status != ExportJob.STATUS_PENDING:
+        logger.warning(f"[EXPORT] Job {job_id} heeft status '{job.status}', wordt overgeslagen")
+        return
+
+    jobs = ExportJob.objects.filter(pk=job.pk)
+    params = export_params(job.params)
+    export_format = EXPORT_FORMATS[params["format"]]
+    # Buiten een request is er geen tenant-context: de export is die van het bedrijf van de job
+    with tenant_context(job.company_id):
+        entries = export_entries_for_params(job.company, params)
+    total_rows = entries.count()
+    jobs.update(status=ExportJob.STATUS_RUNNING, total_rows=total_rows)
+
+    def on_progress(processed_rows):
+        # Enkel de teller bijwerken; de rest van het record laten we ongemoeid
+        jobs.update(processed_rows=processed_rows)
+
+    try:
+        # Zelfde export al eens gemaakt (en de gegevens ongewijzigd): het bestand kopiëren
+        path = cache_path(job.company_id, params)
+        if path.exists():
+            on_progress(total_rows)
+        else:
+            with cache_writer(path) as fileobj:
+                write_export(export_format, ExportRows(entries, on_progress=on_progress), fileobj)
+
+        with open(path, "rb") as cached:
+            job.refresh_from_db()
+            filename = f"{job.pk}_{export_filename(export_format, timezone.now())}"
+            job.file.save(filename, File(cached), save=False)
+
+        now = timezone.now()
+        job.status = ExportJob.STATUS_DONE
+        job.finished_at = now
+        job.expires_at = now + timedelta(hours=settings.EXPORT_JOB_TTL_HOURS)
+        job.save(update_fields=["file", "status", "finished_at", "expires_at"])
+        logger.info(f"[EXPORT] Job {job_id} klaar ({job.processed_rows} rijen)")
+    except Exception as e:
+        logger.exception(f"[EXPORT] Job {job_id} mislukt")
+        jobs.update(status=ExportJob.STATUS_FAILED, error=str(e), finished_at=timezone.now())
+        raise
+
+
+def purge_export_jobs():
+    """Verwijdert de bestanden van gedownloade en verlopen exports (geplande taak)."""
+    now = timezone.now()
+    ExportJob.objects.filter(status=ExportJob.STATUS_DONE, expires_at__lt=now).update(
+        status=ExportJob.STATUS_EXPIRED
+    )
+
+    purged = 0
+    stale_jobs = ExportJob.objects.filter(
+        Q(status=ExportJob.STATUS_DOWNLOADED) | Q(status=ExportJob.STATUS_EXPIRED)
+    ).exclude(file="")
+    for job in stale_jobs.iterator():
+        job.file.delete(save=False)
+        job.save(update_fields=["file"])
+        purged += 1
+
+    logger.info(f"[EXPORT] {purged} exportbestanden opgeruimd")
+
+    # De exportcache hangt aan dezelfde geplande taak
+    cached = purge_export_cache()
+    logger.info(f"[EXPORT] {cached} bestanden uit de exportcache opgeruimd")
+    return purged
+
+
+def create_future_partitions():
+    """Maakt de maandpartities van de tijdregistraties vooraf aan (geplande taak)."""
+    created = ensure_future_partitions()
+    logger.info(f"[PARTITIONS] {len(created)} nieuwe partities aangemaakt")
+    return created
+
+
+def purge_tombstones():
+    """Ruimt de grafstenen van de wijzigingsfeed op na de bewaartermijn (geplande taak)."""
+    purged = purge_expired_tombstones()
+    logger.info(f"[CHANGES] {purged} grafstenen opgeruimd")
+    return purged
+
+
+def recalculate_billing(company_id):
+    """Herberekent de dagtotalen van een bedrijf na een gewijzigde facturatieregel."""
+    days = DailyTimeRollup.objects.filter(company_id=company_id).aggregate(
+        first=Min("day"), last=Max("day")
+    )
+    if days["first"] is None:
+        return 0
+    created = rebuild_rollups(days["first"], days["last"], company_id=company_id)
+    logger.info(f"[BILLING] {created} dagtotalen van bedrijf {company_id} herberekend")
+    return created
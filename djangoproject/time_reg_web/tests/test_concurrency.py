@@ -0,0 +1,97 @@
+"""Laden de async views hun gegevens met een connection pool gelijktijdig en correct?"""
+
+import re
+from datetime import date
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from time_reg_web import concurrency
+from time_reg_web.models import Company, Customer, Milstones, Project, Todo
+
+# Het CSRF-token verschilt per response
+_CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+
+PAGES = ["eventaflow:dashboard", "eventaflow:todo_list", "eventaflow:milestone_list"]
+
+
+# De laders draaien in eigen threads met een eigen verbinding: ze zien enkel
+# gecommitte gegevens, dus geen TestCase (die elke test in een transactie draait)
+@skipUnless(connection.vendor == "postgresql", "Connection pool enkel op PostgreSQL")
+@override_settings(
+    QUERY_BUDGET_ENABLED=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class PooledLoaderTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice")
+        company = Company.objects.create(name="Acme")
+        company.members.add(self.user)
+        self.user.profile.company = company
+        self.user.profile.save()
+
+        customer = Customer.unscoped.create(
+            company=company, customer_name="Klant", customer_email="k@example.com"
+        )
+        for i in range(5):
+            project = Project.unscoped.create(
+                company=company,
+                customer=customer,
+                project_name=f"Project {i}",
+                start_date=date(2026, 1, 1),
+            )
+            Todo.unscoped.create(
+                company=company,
+                user=self.user,
+                customer_id=customer,
+                project_id=project,
+                title=f"Taak {i}",
+            )
+            Milstones.unscoped.create(company=company, project=project, title=f"Mijlpaal {i}")
+
+        self.client.force_login(self.user)
+
+    def set_pool(self, pool):
+        """Zet de pool van de verbinding aan (opties) of uit (None) voor de rest van de test."""
+        options = connection.settings_dict["OPTIONS"]
+        if not hasattr(self, "_original_pool"):
+            self._original_pool = options.get("pool")
+            self.addCleanup(self.set_pool, self._original_pool)
+        connection.close()
+        connection.close_pool()
+        if pool is None:
+            options.pop("pool", None)
+        else:
+            options["pool"] = pool
+
+    def render(self, name):
+        """De HTML van een pagina (zonder CSRF-token) en het aantal getelde queries."""
+        cache.clear()
+        with self.assertLogs("time_reg_web.query_budget", "DEBUG") as logs:
+            response = self.client.get(reverse(name), secure=True)
+        self.assertEqual(response.status_code, 200)
+        count = int(re.search(r": (\d+) queries", logs.output[-1]).group(1))
+        return _CSRF_TOKEN.sub("", response.content.decode()), count
+
+    def test_pages_render_the_same_with_a_pool(self):
+        self.set_pool(None)
+        sequential = {name: self.render(name) for name in PAGES}
+        self.set_pool({"min_size": 1, "max_size": 4})
+        self.assertTrue(concurrency.uses_pool())
+        for name in PAGES:
+            with (
+                self.subTest(page=name),
+                mock.patch.object(
+                    concurrency, "_in_own_connection", wraps=concurrency._in_own_connection
+                ) as in_own_connection,
+            ):
+                html, count = self.render(name)
+                # Elke lader in een eigen thread, met een verbinding uit de pool
+                self.assertGreater(in_own_connection.call_count, 1)
+                self.assertEqual(html, sequential[name][0])
+                # Ook de queries uit de threads van de laders tellen mee in het budget
+                self.assertEqual(count, sequential[name][1])
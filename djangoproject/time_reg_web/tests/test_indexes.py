@@ -0,0 +1,86 @@
+"""Gebruiken de queries van de tijdregistraties de indexen uit 0017 (PostgreSQL)?"""
+
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from time_reg_web.models import Company, Customer, Project, TimeRegistry
+
+
+@skipUnless(connection.vendor == "postgresql", "Queryplannen enkel op PostgreSQL")
+class TimeRegistryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice")
+        other = User.objects.create_user("bob")
+        cls.company = Company.objects.create(name="Acme")
+        other_company = Company.objects.create(name="Andere")
+
+        entries = []
+        start = timezone.now() - timedelta(days=20)
+        for company, user in ((cls.company, cls.user), (other_company, other)):
+            customer = Customer.unscoped.create(
+                company=company, customer_name="Klant", customer_email="k@example.com"
+            )
+            project = Project.unscoped.create(
+                company=company, customer=customer, project_name="Proj", start_date=start.date()
+            )
+            if company == cls.company:
+                cls.project = project
+            entries += [
+                TimeRegistry(
+                    company=company,
+                    user=user,
+                    project=project,
+                    start_time=start + timedelta(hours=3 * i),
+                    end_time=start + timedelta(hours=3 * i, minutes=45),
+                )
+                for i in range(150)
+            ]
+        TimeRegistry.unscoped.bulk_create(entries)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE "{TimeRegistry._meta.db_table}"')
+
+    def setUp(self):
+        # Met een handvol rijen is een sequentiële scan altijd goedkoper; zonder die
+        # optie kiest de planner de beste index, en dat moet de nieuwe zijn
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def index_names(self, name):
+        """De index en, op een gepartitioneerde tabel, de indexen van de partities."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+                " WHERE i.inhparent = %s::regclass",
+                [name],
+            )
+            return {name, *(row[0] for row in cursor.fetchall())}
+
+    def assertUsesIndex(self, queryset, name):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(index in plan for index in self.index_names(name)),
+            f"{name} niet gebruikt:\n{plan}",
+        )
+
+    def test_open_timer_uses_partial_index(self):
+        queryset = TimeRegistry.unscoped.filter(user=self.user, end_time__isnull=True)
+        self.assertUsesIndex(queryset, "timereg_open_timer_idx")
+
+    def test_company_period_uses_company_start_index(self):
+        today = timezone.localdate()
+        queryset = (
+            TimeRegistry.unscoped.filter(company=self.company)
+            .in_period(today - timedelta(days=10), today)
+            .order_by("start_time")
+        )
+        self.assertUsesIndex(queryset, "timereg_company_start_idx")
+
+    def test_latest_project_entries_use_project_start_index(self):
+        queryset = TimeRegistry.unscoped.filter(project=self.project).order_by("-start_time")[:10]
+        self.assertUsesIndex(queryset, "timereg_project_start_idx")
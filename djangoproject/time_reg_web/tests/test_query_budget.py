@@ -0,0 +1,112 @@
+"""Meldt de querybudget-middleware te veel queries en N+1-patronen, en enkel die?"""
+
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+
+from time_reg_web.models import Company, Customer, Project, Todo
+from time_reg_web.query_budget import QueryBudgetExceeded, fingerprint, query_budget
+
+
+@query_budget(2)
+def over_budget_view(request):
+    # Drie verschillende queries tegen een budget van twee
+    User.objects.count()
+    Company.objects.count()
+    Customer.unscoped.count()
+    return HttpResponse()
+
+
+@query_budget(50)
+def repeated_query_view(request):
+    # Binnen het budget, maar per rij dezelfde query (N+1)
+    for pk in range(1, 7):
+        Company.objects.filter(pk=pk).exists()
+    return HttpResponse()
+
+
+urlpatterns = [
+    path("over-budget/", over_budget_view),
+    path("repeated/", repeated_query_view),
+    path("", include("djangoproject.urls")),
+]
+
+
+@override_settings(
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGET_RAISE=True,
+    QUERY_BUDGET_REPEAT_LIMIT=5,
+    ROOT_URLCONF=__name__,
+    # Met de db-cache tellen de cache-lookups mee; de budgetten gaan uit van locmem
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class QueryBudgetMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="pw12345678!")
+        company = Company.objects.create(name="Acme")
+        company.members.add(cls.user)
+        cls.user.profile.company = company
+        cls.user.profile.save()
+
+        # Genoeg projecten en taken dat een query per rij als N+1 opvalt
+        customer = Customer.unscoped.create(
+            company=company, customer_name="Klant", customer_email="k@example.com"
+        )
+        for i in range(8):
+            project = Project.unscoped.create(
+                company=company,
+                customer=customer,
+                project_name=f"Project {i}",
+                start_date=date(2026, 1, 1),
+            )
+            Todo.unscoped.create(
+                company=company,
+                user=cls.user,
+                customer_id=customer,
+                project_id=project,
+                title=f"Taak {i}",
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_over_budget_view_is_flagged(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "budget 2 overschreden"):
+            self.client.get("/over-budget/", secure=True)
+
+    def test_repeated_query_is_flagged(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "6x dezelfde query"):
+            self.client.get("/repeated/", secure=True)
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_flagged_view_is_logged_without_raise(self):
+        with self.assertLogs("time_reg_web.query_budget", "WARNING") as logs:
+            response = self.client.get("/over-budget/", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("budget 2 overschreden", logs.output[0])
+
+    def test_dashboard_is_not_flagged(self):
+        self.client.force_login(self.user)
+        with self.assertNoLogs("time_reg_web.query_budget", "WARNING"):
+            response = self.client.get(reverse("eventaflow:dashboard"), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["projects"]), 8)
+
+
+class FingerprintTests(TestCase):
+    def test_ignores_numbers_and_in_list_length(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT  *  FROM "t"\nWHERE "id" IN (%s, %s, %s) LIMIT 1'),
+        )
+
+    def test_keeps_different_queries_apart(self):
+        self.assertNotEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" = %s'),
+            fingerprint('SELECT * FROM "t" WHERE "name" = %s'),
+        )
@@ -0,0 +1,294 @@
+"""Weekoverzicht van de uren: gebruikers × projecten × dagen, in één keer te bewaren.
+
+Een cel is de som van de afgesloten registraties van één gebruiker op één project
+op één dag. Bij het bewaren worden enkel de gewijzigde cellen verwerkt:
+
+- 0 uur: alle registraties van de cel worden verwijderd;
+- een lege cel: er wordt één registratie aangemaakt, startend om `DEFAULT_START`
+  of na de laatste registratie van die gebruiker op die dag;
+- anders: de laatste registratie van de cel vangt het verschil op; bij minder
+  uren vallen eerst de laatste registraties van de dag weg.
+
+Alle wijzigingen gebeuren met bulk_create, bulk_update en één delete in één
+transactie. bulk_create en bulk_update versturen geen signalen, dus de dagtotalen
+en de caches van de samenvattingen en exports worden hier zelf bijgewerkt, net als
+updated_at van gewijzigde registraties (wijzigingsfeed). Een verlengde
+registratie mag geen andere registratie van die gebruiker overlappen (zie `overlaps`).
+"""
+
+import logging
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .caching import bump_generation_on_commit
+from .models import Project, TimeRegistry
+from .overlaps import is_overlap_violation
+from .rollups import RollupDeltas
+
+logger = logging.getLogger(__name__)
+
+# Starttijd van een registratie die vanuit het weekoverzicht aangemaakt wordt
+DEFAULT_START = time(9, 0)
+
+# Omschrijving van zo'n registratie
+DEFAULT_DESCRIPTION = "Via weekoverzicht"
+
+CellKey = namedtuple("CellKey", ["user_id", "project_id", "day"])
+
+
+class TimesheetError(ValueError):
+    """Een cel die niet bewaard kan worden."""
+
+
+def week_start(day):
+    """De maandag van de week van `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def parse_week(value):
+    """Week uit de querystring ('2026-W10' of een datum); standaard de huidige week."""
+    if value:
+        try:
+            if "-W" in value:
+                return date.fromisocalendar(int(value[:4]), int(value.split("-W")[1]), 1)
+            return week_start(date.fromisoformat(value))
+        except ValueError:
+            pass
+    return week_start(timezone.localdate())
+
+
+def week_days(monday):
+    return [monday + timedelta(days=offset) for offset in range(7)]
+
+
+def cell_name(key):
+    return f"cell-{key.user_id}-{key.project_id}-{key.day.isoformat()}"
+
+
+def parse_cell_name(name):
+    _, user_id, project_id, day = name.split("-", 3)
+    return CellKey(int(user_id), int(project_id), date.fromisoformat(day))
+
+
+def format_hours(seconds):
+    """Weergave van een cel: uren met maximaal 2 decimalen, leeg bij 0."""
+    if not seconds:
+        return ""
+    return f"{seconds / 3600:.2f}".rstrip("0").rstrip(".")
+
+
+def parse_hours(value):
+    """Aantal seconden uit de invoer van een cel ('1,5', '1.25', '' = 0)."""
+    value = (value or "").strip().replace(",", ".")
+    if not value:
+        return 0
+    try:
+        hours = Decimal(value)
+    except InvalidOperation:
+        raise TimesheetError(f"'{value}' is geen geldig aantal uren")
+    if hours < 0 or hours > 24:
+        raise TimesheetError("Het aantal uren moet tussen 0 en 24 liggen")
+    return int(hours * 3600)
+
+
+def load_week(company, monday, user_ids=None, for_update=False):
+    """Alle afgesloten registraties van de week, in één query, gegroepeerd per cel."""
+    entries = TimeRegistry.objects.filter(company=company, end_time__isnull=False).in_period(
+        monday, monday + timedelta(days=6)
+    )
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+    if for_update:
+        entries = entries.select_for_update()
+
+    cells = defaultdict(list)
+    for entry in entries.order_by("start_time", "id"):
+        day = timezone.localdate(entry.start_time)
+        cells[CellKey(entry.user_id, entry.project_id, day)].append(entry)
+    return cells
+
+
+def cell_seconds(entries):
+    return sum(int((entry.end_time - entry.start_time).total_seconds()) for entry in entries)
+
+
+def build_grid(company, monday, users, posted=None):
+    """Rijen (gebruiker, project) met 7 cellen, plus de dagtotalen van de week.
+
+    Met `posted` (de POST-data na een fout) blijven de ingevulde waarden staan.
+    """
+    days = week_days(monday)
+    cells = load_week(company, monday, user_ids=[user.pk for user in users])
+    projects = Project.objects.filter(company=company).select_related("customer").in_bulk()
+    users_by_id = {user.pk: user for user in users}
+
+    rows = []
+    day_totals = [0] * 7
+    for user_id, project_id in sorted(
+        {(key.user_id, key.project_id) for key in cells},
+        key=lambda pair: (users_by_id[pair[0]].username, projects[pair[1]].project_name),
+    ):
+        row_cells = []
+        for index, day in enumerate(days):
+            key = CellKey(user_id, project_id, day)
+            seconds = cell_seconds(cells.get(key, []))
+            day_totals[index] += seconds
+            name = cell_name(key)
+            value = format_hours(seconds)
+            row_cells.append(
+                {
+                    "name": name,
+                    "orig_name": f"orig-{name[5:]}",
+                    "orig": value,
+                    "value": posted.get(name, value) if posted else value,
+                }
+            )
+        rows.append(
+            {"user": users_by_id[user_id], "project": projects[project_id], "cells": row_cells}
+        )
+
+    return {
+        "days": days,
+        "rows": rows,
+        "day_totals": [format_hours(seconds) for seconds in day_totals],
+        "week_total": format_hours(sum(day_totals)),
+    }
+
+
+def _changed_cells(data, allowed_user_ids, project_ids, days):
+    """De gewijzigde cellen uit de POST-data als {CellKey: (oude, nieuwe seconden)}."""
+    changes = {}
+    errors = {}
+    for name, value in data.items():
+        if not name.startswith("cell-"):
+            continue
+        original = data.get(f"orig-{name[5:]}", "")
+        if value.strip() == original.strip():
+            continue
+        try:
+            key = parse_cell_name(name)
+        except ValueError:
+            continue
+        if (
+            key.user_id not in allowed_user_ids
+            or key.project_id not in project_ids
+            or key.day not in days
+        ):
+            errors[name] = "Deze cel hoort niet bij dit weekoverzicht"
+            continue
+        try:
+            changes[key] = (parse_hours(original), parse_hours(value))
+        except TimesheetError as e:
+            errors[name] = str(e)
+    return changes, errors
+
+
+def save_week(company, monday, data, allowed_user_ids):
+    """Bewaart de gewijzigde cellen van een weekoverzicht in één transactie.
+
+    Geeft een dict {celnaam: fout} terug; bij fouten wordt er niets bewaard.
+    """
+    days = set(week_days(monday))
+    project_ids = set(Project.objects.filter(company=company).values_list("id", flat=True))
+    changes, errors = _changed_cells(data, set(allowed_user_ids), project_ids, days)
+    if errors or not changes:
+        return errors
+
+    tz = timezone.get_current_timezone()
+    try:
+        with transaction.atomic():
+            return _save_changes(company, monday, changes, tz)
+    except IntegrityError as e:
+        if is_overlap_violation(e):
+            # De overlap-constraint van de database (bv. met een registratie van de volgende week)
+            return {"week": "Een registratie zou een andere registratie overlappen"}
+        logger.error(f"Weekoverzicht {monday} van bedrijf {company.pk} bewaren mislukt: {e}")
+        return {"week": "Het weekoverzicht kon niet bewaard worden"}
+
+
+def _save_changes(company, monday, changes, tz):
+    errors = {}
+    cells = load_week(company, monday, user_ids={key.user_id for key in changes}, for_update=True)
+    to_create, to_update, to_delete = [], [], []
+    deltas = RollupDeltas()
+
+    # Alle registraties per gebruiker en dag (over de projecten heen), voor de overlapcontrole
+    busy = defaultdict(list)
+    for key, entries in cells.items():
+        busy[(key.user_id, key.day)].extend(entries)
+
+    def others(entry, day):
+        return [
+            other
+            for other in busy[(entry.user_id, day)]
+            if other is not entry and other not in to_delete
+        ]
+
+    for key, (original, seconds) in changes.items():
+        entries = cells.get(key, [])
+        current = cell_seconds(entries)
+        name = cell_name(key)
+        if format_hours(current) != format_hours(original):
+            errors[name] = "Deze cel werd intussen gewijzigd; herlaad het weekoverzicht"
+            continue
+
+        if seconds == 0:
+            # delete() verstuurt wel signalen; de dagtotalen volgen dus vanzelf
+            to_delete.extend(entries)
+        elif not entries:
+            entry = TimeRegistry(
+                company=company,
+                user_id=key.user_id,
+                project_id=key.project_id,
+                description=DEFAULT_DESCRIPTION,
+            )
+            # Na de andere registraties van die dag, zodat ze elkaar niet overlappen
+            entry.start_time = max(
+                [timezone.make_aware(datetime.combine(key.day, DEFAULT_START), tz)]
+                + [other.end_time for other in others(entry, key.day)]
+            )
+            entry.end_time = entry.start_time + timedelta(seconds=seconds)
+            if timezone.localdate(entry.end_time - timedelta(microseconds=1)) != key.day:
+                errors[name] = "Deze uren passen niet meer op die dag"
+                continue
+            busy[(key.user_id, key.day)].append(entry)
+            to_create.append(entry)
+            deltas.add_entry(entry)
+        else:
+            # Bij minder uren vallen de laatste registraties van de dag eerst weg
+            kept = list(entries)
+            while len(kept) > 1 and cell_seconds(kept[:-1]) >= seconds:
+                to_delete.append(kept.pop())
+            last = kept[-1]
+            end_time = last.start_time + timedelta(seconds=seconds - cell_seconds(kept[:-1]))
+            if any(
+                other.start_time < end_time and last.start_time < other.end_time
+                for other in others(last, key.day)
+            ):
+                errors[name] = "Deze uren overlappen een andere registratie van die dag"
+                continue
+            deltas.add_entry(last, sign=-1)
+            last.end_time = end_time
+            deltas.add_entry(last)
+            to_update.append(last)
+
+    if errors:
+        transaction.set_rollback(True)
+        return errors
+
+    TimeRegistry.objects.bulk_create(to_create, batch_size=1000)
+    # bulk_update zet auto_now-velden niet; de wijzigingsfeed heeft updated_at nodig
+    now = timezone.now()
+    for entry in to_update:
+        entry.updated_at = now
+    TimeRegistry.objects.bulk_update(to_update, ["end_time", "updated_at"], batch_size=1000)
+    if to_delete:
+        TimeRegistry.objects.filter(pk__in=[entry.pk for entry in to_delete]).delete()
+    deltas.apply()
+    # bulk_update verstuurt geen post_save
+    bump_generation_on_commit(company.pk, TimeRegistry)
+    return {}
@@ -18,11 +18,30 @@ urlpatterns = [
     path("project/<int:pk>/edit/", views.ProjectUpdateView.as_view(), name="project_edit"),
     path("timer/start/", views.start_timer, name="start_timer"),
     path("timer/stop/<int:timer_id>/", views.stop_timer, name="stop_timer"),
+    path("entries/", views.TimeEntryListView.as_view(), name="time_entries"),
+    path("timesheet/week/", views.WeekTimesheetView.as_view(), name="week_timesheet"),
     path("export/", views.ExportView.as_view(), name="export"),
+    path("import/", views.ImportView.as_view(), name="import"),
+    path("export/jobs/", views.create_export_job, name="export_job_create"),
+    path("export/jobs/<int:job_id>/", views.export_job_status, name="export_job_status"),
+    path(
+        "export/jobs/<int:job_id>/download/",
+        views.download_export_job,
+        name="export_job_download",
+    ),
     path("todos/", views.TodoListView.as_view(), name="todo_list"),
     path("todos/<int:todo_id>/toggle/", views.toggle_todo, name="todo_toggle"),
+    path(
+        "todos/<int:todo_id>/completion/", views.set_todo_completion, name="todo_completion"
+    ),
+    path("live/events/", views.live_events, name="live_events"),
     path("milestones/", views.MilestonesView.as_view(), name="milestone_list"),
     path("milestones/<int:milestone_id>/toggle/", views.toggle_milestone, name="milestone_toggle"),
+    path(
+        "milestones/<int:milestone_id>/completion/",
+        views.set_milestone_completion,
+        name="milestone_completion",
+    ),
     path("google_docs/", views.google_docs_view, name="google_docs"),
     path("google/settings/", views.google_settings_view, name="google_settings"),
     path("google/authorize/", views.google_authorize_start, name="google_authorize"),
@@ -33,6 +52,13 @@ urlpatterns = [
         name="generate_project_api_token",
     ),
     path("api/project_status/", views.api_project_status, name="api_project_status"),
+    path("api/time_entries/", views.api_time_entries, name="api_time_entries"),
+    path(
+        "api/time_entries/changes/",
+        views.api_time_entry_changes,
+        name="api_time_entry_changes",
+    ),
+    path("api/summary/", views.TimesheetSummaryView.as_view(), name="api_summary"),
     path(
         "api/generate_project_api_token/<int:project_id>/",
         views.generate_project_api_token_api,
@@ -3,9 +3,11 @@
 import logging
 import secrets
 import urllib.parse
+from datetime import timedelta
+from functools import wraps
 
-import openpyxl
 import requests
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib import messages
@@ -16,15 +18,19 @@ from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import EmailMultiAlternatives
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Case, Count, IntegerField, Sum, Value, When
 from django.http import (
+    Http404,
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
+    HttpResponseGone,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
@@ -34,16 +40,41 @@ from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import CreateView, ListView, UpdateView
 from django.views.generic.base import RedirectView
-
+from django_q.tasks import async_task
+
+from .billing import BillingEngine
+from .burndown import project_burn
+from .caching import bump_generation_on_commit
+from .changes import CursorExpired, changes_page
+from .concurrency import gather_loaders, run_loaders
+from .export_cache import cached_export_response
+from .exports import (
+    EXPORT_FORMATS,
+    EXPORT_HEADERS,
+    export_filename,
+    export_params,
+)
 from .forms import MilestoneForm, TodoForm
 from .google_drive_service import GoogleDriveService
+from .imports import import_time_entries, read_rows
+from .live import event_stream, publish_on_commit, todo_event
+from .managers import tenant_context
 from .mixins import TenantObjectMixin
+from .overlaps import is_overlap_violation
+from .pagination import InvalidCursor, keyset_page, page_size_from
+from .query_budget import query_budget
+from .reference import Choice, active_projects, tenant_reference_data
+from .rollups import project_hours_subquery
+from .streaming import file_response
+from .summaries import SummaryError, get_summary, summary_params
+from .timesheets import build_grid, parse_week, save_week
 from .models import (
     APIToken,
     APITokenUsage,
     Company,
     Customer,
     Divisies,
+    ExportJob,
     GoogleDocument,
     Milstones,
     Project,
@@ -60,25 +91,26 @@ class DashboardView(TenantObjectMixin, View):
     """View voor het dashboard (index) met projectoverzicht en interactieve to-do lijst."""
 
     template_name = "dashboard/index.html"
+    query_budget = 15
 
-    def get_context_data(self, request):
-        company = request.user.profile.company
-        today = timezone.now().date()
+    def get_loaders(self, request):
+        """De onafhankelijke queries van het dashboard, als laders (zie `concurrency`)."""
+        company = request.tenant.company
 
-        # Projecten ophalen
-        projects = Project.objects.filter(company=company).order_by("project_name")
+        # Projecten ophalen, met de geregistreerde uren uit de dagtotalen
+        projects = (
+            Project.objects.select_related("customer")
+            .annotate(total_hours=project_hours_subquery())
+            .order_by("project_name")
+        )
 
-        # Actieve timer ophalen
-        active_timer = TimeRegistry.objects.filter(
+        # Actieve timer ophalen; één per gebruiker, ook als hij bij een ander bedrijf hoort
+        active_timer = TimeRegistry.unscoped.filter(
             user=request.user, end_time__isnull=True
-        ).first()
-
-        # Klanten voor de filters
-        customers = Customer.objects.filter(company=company)
-        divisies = Divisies.objects.filter(company=company)
+        ).select_related("project")
 
         # TO-DO LOGICA
-        todos = Todo.objects.filter(company=company, user=request.user).select_related(
+        todos = Todo.objects.filter(user=request.user).select_related(
             "project_id", "customer_id", "user"
         )
 
@@ -106,54 +138,57 @@ class DashboardView(TenantObjectMixin, View):
         todos = todos.order_by("due_date", "priority", "-created_at")
 
         return {
-            "projects": projects,
-            "active_timer": active_timer,
-            "customers": customers,
-            "divisies": divisies,
-            "todos": todos,
-            "today": today,  # Nodig voor de kleurcodes in de template
+            "projects": lambda: list(projects),
+            "active_timer": active_timer.first,
+            # Keuzelijsten voor de timer en de filters
+            "reference": lambda: tenant_reference_data(company),
+            "todos": lambda: list(todos),
         }
 
-    def get(self, request):
-        context = self.get_context_data(request)
-        return render(request, self.template_name, context)
+    async def get(self, request):
+        # De queries lopen gelijktijdig; de template daarna in een gewone thread
+        context = await gather_loaders(self.get_loaders(request))
+        context["today"] = timezone.now().date()  # Nodig voor de kleurcodes in de template
+        return await sync_to_async(render)(request, self.template_name, context)
 
 
 # 2. Klanten Beheer (Aanmaken) - Aangepast om handmatig company te koppelen
-class CustomerCreateView(LoginRequiredMixin, CreateView):
+class CustomerCreateView(TenantObjectMixin, CreateView):
     model = Customer
     fields = ["customer_name", "customer_email"]
     template_name = "dashboard/customer_form.html"
     success_url = reverse_lazy("eventaflow:dashboard")
+    query_budget = 12
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["customers"] = Customer.objects.filter(company=self.request.user.profile.company)
+        context["reference"] = tenant_reference_data(self.request.tenant.company)
         return context
 
     def form_valid(self, form):
         try:
             with transaction.atomic():
                 # Koppel de klant aan het bedrijf van de huidige gebruiker
-                form.instance.company = self.request.user.profile.company
+                form.instance.company = self.request.tenant.company
                 return super().form_valid(form)
         except Exception as e:
             form.add_error(None, f"Fout bij aanmaken klant: {e}")
             return self.form_invalid(form)
 
 
-class CustomerUpdateView(LoginRequiredMixin, UpdateView):
+class CustomerUpdateView(TenantObjectMixin, UpdateView):
     model = Customer
     fields = ["customer_name", "customer_email"]
     template_name = "dashboard/customer_form.html"
     success_url = reverse_lazy("eventaflow:dashboard")
+    query_budget = 13
 
     def get_queryset(self):
-        return Customer.objects.filter(company=self.request.user.profile.company)
+        return Customer.objects.all()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["customers"] = Customer.objects.filter(company=self.request.user.profile.company)
+        context["reference"] = tenant_reference_data(self.request.tenant.company)
         return context
 
 
@@ -162,9 +197,14 @@ class ProjectFormMixin:
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
         if self.request.user.is_authenticated:
-            form.fields["customer"].queryset = Customer.objects.filter(
-                company=self.request.user.profile.company
-            )
+            company = self.request.tenant.company
+            customer_field = form.fields["customer"]
+            # De queryset dient enkel nog voor de validatie; de opties komen uit de cache
+            customer_field.queryset = Customer.objects.all()
+            customer_field.widget.choices = [("", customer_field.empty_label)] + [
+                (customer.id, customer.label)
+                for customer in tenant_reference_data(company).customers
+            ]
 
         field_widget_attrs = {
             "customer": {
@@ -188,6 +228,12 @@ class ProjectFormMixin:
                 "shadow-sm focus:ring-2 focus:ring-green-500 focus:border-green-500 "
                 "transition-all outline-none",
             },
+            "budget_hours": {
+                "class": "block w-full px-4 py-3 border border-gray-300 rounded-xl "
+                "shadow-sm focus:ring-2 focus:ring-green-500 focus:border-green-500 "
+                "transition-all outline-none",
+                "placeholder": "Bijv. 120",
+            },
             "project_description": {
                 "class": "block w-full px-4 py-3 border border-gray-300 rounded-xl "
                 "shadow-sm focus:ring-2 focus:ring-green-500 focus:border-green-500 "
@@ -208,13 +254,15 @@ class ProjectFormMixin:
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["projects"] = Project.objects.filter(
-            company=self.request.user.profile.company
-        ).order_by("project_name")
+        context["projects"] = (
+            Project.objects.all()
+            .select_related("customer")
+            .order_by("project_name")
+        )
         return context
 
 
-class ProjectCreateView(ProjectFormMixin, LoginRequiredMixin, CreateView):
+class ProjectCreateView(ProjectFormMixin, TenantObjectMixin, CreateView):
     model = Project
     fields = [
         "customer",
@@ -222,23 +270,25 @@ class ProjectCreateView(ProjectFormMixin, LoginRequiredMixin, CreateView):
         "project_description",
         "start_date",
         "end_date",
+        "budget_hours",
         "is_active",
     ]
     template_name = "dashboard/project_form.html"
     success_url = reverse_lazy("eventaflow:dashboard")
+    query_budget = 17
 
     def form_valid(self, form):
         try:
             with transaction.atomic():
                 # Koppel het project aan het bedrijf van de huidige gebruiker
-                form.instance.company = self.request.user.profile.company
+                form.instance.company = self.request.tenant.company
                 return super().form_valid(form)
         except Exception as e:
             form.add_error(None, f"Fout bij aanmaken project: {e}")
             return self.form_invalid(form)
 
 
-class ProjectUpdateView(ProjectFormMixin, LoginRequiredMixin, UpdateView):
+class ProjectUpdateView(ProjectFormMixin, TenantObjectMixin, UpdateView):
     model = Project
     fields = [
         "customer",
@@ -246,111 +296,285 @@ class ProjectUpdateView(ProjectFormMixin, LoginRequiredMixin, UpdateView):
         "project_description",
         "start_date",
         "end_date",
+        "budget_hours",
         "is_active",
     ]
     template_name = "dashboard/project_form.html"
     success_url = reverse_lazy("eventaflow:dashboard")
+    query_budget = 16
 
     def get_queryset(self):
-        return Project.objects.filter(company=self.request.user.profile.company)
+        return Project.objects.all()
 
     def form_valid(self, form):
-        form.instance.company = self.request.user.profile.company
+        form.instance.company = self.request.tenant.company
         return super().form_valid(form)
 
 
-# 4. Export View (Directe Download naar Excel met 5-minuten afronding en totaaltelling)
+# 4. Export View (Excel/CSV/NDJSON/Parquet met de facturatieregels en totaaltelling)
 class ExportView(TenantObjectMixin, View):
     template_name = "dashboard/export.html"
+    query_budget = 12
+
+    def get(self, request):
+        return render(
+            request,
+            self.template_name,
+            {
+                "reference": tenant_reference_data(request.tenant.company),
+                "formats": EXPORT_FORMATS.values(),
+            },
+        )
+
+    def post(self, request):
+        company = request.tenant.company
+
+        params = export_params(request.POST)
+
+        # Export uit de cache, of genereren: de rijen worden in brokken gelezen en
+        # gestreamd naar de download (en mee bewaard voor een volgende keer)
+        export_format = EXPORT_FORMATS[params["format"]]
+        filename = export_filename(export_format, timezone.now())
+        return cached_export_response(request, company, params, filename)
+
+
+# 4.4 Bulk-import van historische uren (zelfde kolommen als de export)
+class ImportView(TenantObjectMixin, View):
+    template_name = "dashboard/import.html"
+    query_budget = 15
+
+    def _can_import_for_others(self, request):
+        return request.tenant.is_admin
+
+    def _render(self, request, **context):
+        context.update(
+            headers=EXPORT_HEADERS, can_import_for_others=self._can_import_for_others(request)
+        )
+        return render(request, self.template_name, context)
 
     def get(self, request):
-        company = request.user.profile.company
-        customers = Customer.objects.filter(company=company)
-        projects = Project.objects.filter(company=company)
+        return self._render(request)
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if not upload:
+            messages.error(request, "Kies een bestand om te importeren.")
+            return self._render(request)
+
+        try:
+            rows = read_rows(upload.file, upload.name)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return self._render(request)
+
+        dry_run = request.POST.get("dry_run") == "1"
+        result = import_time_entries(
+            request.tenant.company,
+            rows,
+            allowed_user=None if self._can_import_for_others(request) else request.user,
+            dry_run=dry_run,
+        )
+        logger.info(
+            f"[IMPORT] {request.user.username}: {result.imported} rijen "
+            f"{'gecontroleerd' if dry_run else 'geïmporteerd'}, {result.error_count} fouten"
+        )
+        return self._render(request, result=result, dry_run=dry_run)
+
+
+# 4.5 Weekoverzicht: alle uren van een week bekijken en in één keer corrigeren
+class WeekTimesheetView(TenantObjectMixin, View):
+    template_name = "dashboard/week_grid.html"
+    query_budget = 16
+
+    def _users(self, request):
+        """Beheerders zien alle leden (of één gekozen lid), anderen enkel zichzelf."""
+        company = request.tenant.company
+        if not request.tenant.is_admin:
+            return [request.user], False
+        members = company.members.order_by("username")
+        selected = request.GET.get("user", "")
+        if selected.isdigit():
+            members = members.filter(pk=selected)
+        return list(members), True
+
+    def _render(self, request, monday, users, can_choose_user, errors=None, posted=None):
+        company = request.tenant.company
+        reference = tenant_reference_data(company)
+        context = build_grid(company, monday, users, posted=posted)
+        context.update(
+            {
+                "monday": monday,
+                "week": f"{monday.isocalendar().year}-W{monday.isocalendar().week:02d}",
+                "previous_week": (monday - timedelta(days=7)).isoformat(),
+                "next_week": (monday + timedelta(days=7)).isoformat(),
+                "errors": errors or {},
+                "can_choose_user": can_choose_user,
+                "members": (
+                    reference.members
+                    if can_choose_user
+                    else [Choice(user.pk, user.username) for user in users]
+                ),
+                "selected_user": request.GET.get("user", ""),
+                "projects": active_projects(reference),
+            }
+        )
+        return render(request, self.template_name, context)
 
-        return render(request, self.template_name, {"customers": customers, "projects": projects})
+    def get(self, request):
+        users, can_choose_user = self._users(request)
+        return self._render(request, parse_week(request.GET.get("week")), users, can_choose_user)
 
     def post(self, request):
-        company = request.user.profile.company
-
-        # Filters ophalen
-        start_date = request.POST.get("start_date")
-        end_date = request.POST.get("end_date")
-        customer_id = request.POST.get("customer")
-        project_id = request.POST.get("project")
-
-        # Queryset filteren
-        entries = TimeRegistry.objects.filter(company=company).order_by("start_time")
-        if start_date:
-            entries = entries.filter(start_time__date__gte=start_date)
-        if end_date:
-            entries = entries.filter(start_time__date__lte=end_date)
-        if customer_id:
-            entries = entries.filter(project__customer_id=customer_id)
-        if project_id:
-            entries = entries.filter(project_id=project_id)
-
-        # Excel genereren
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Uren Export"
-
-        headers = [
-            "Datum",
-            "Klant",
-            "Project",
-            "Gebruiker",
-            "Start",
-            "Eind",
-            "Duur (u)",
-            "Omschrijving",
-        ]
-        ws.append(headers)
-
-        total_duration = 0  # Variabele voor de totaaltelling
-
-        for entry in entries:
-            duration = 0
-            if entry.end_time:
-                # Bereken verschil in seconden
-                total_seconds = (entry.end_time - entry.start_time).total_seconds()
-
-                # Afronden op 5 minuten (300 seconden)
-                rounded_seconds = round(total_seconds / 300) * 300
-
-                # Omzetten naar uren voor de kolom
-                duration = round(rounded_seconds / 3600, 2)
-                total_duration += duration  # Voeg toe aan totaal
-
-            ws.append(
-                [
-                    entry.start_time.strftime("%d-%m-%Y") if entry.start_time else "",
-                    entry.project.customer.customer_name,
-                    entry.project.project_name,
-                    entry.user.username,
-                    entry.start_time.strftime("%H:%M") if entry.start_time else "",
-                    entry.end_time.strftime("%H:%M") if entry.end_time else "Lopend",
-                    duration,
-                    entry.description,
-                ]
+        users, can_choose_user = self._users(request)
+        monday = parse_week(request.POST.get("week"))
+        errors = save_week(
+            request.tenant.company, monday, request.POST, [user.pk for user in users]
+        )
+        if errors:
+            return self._render(
+                request, monday, users, can_choose_user, errors=errors, posted=request.POST
             )
 
-        # Voeg een lege regel toe voor de overzichtelijkheid
-        ws.append([])
+        messages.success(request, "Het weekoverzicht is bewaard.")
+        return redirect(request.get_full_path())
+
 
-        # Voeg de totaalregel toe
-        # We plaatsen 'TOTAAL' in de kolom van de medewerker/eindtijd en de som in de duur-kolom
-        ws.append(["", "", "", "", "", "TOTAAL:", round(total_duration, 2), ""])
+# 4.1 Export als achtergrondtaak (grote exports lopen anders tegen de gunicorn timeout aan)
+@login_required
+@query_budget(9)
+def create_export_job(request):
+    """Plant een export in als django-q taak; de exportpagina volgt daarna de voortgang."""
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+
+    company = request.tenant.company
+    if not company:
+        return HttpResponseBadRequest("Geen bedrijf gekoppeld.")
+
+    job = ExportJob.objects.create(
+        company=company, created_by=request.user, params=export_params(request.POST)
+    )
+    async_task("time_reg_web.tasks.run_export_job", job.pk, task_name=f"export-{job.pk}")
+
+    return JsonResponse(
+        {"id": job.pk, "status_url": reverse("eventaflow:export_job_status", args=[job.pk])},
+        status=202,
+    )
+
+
+@login_required
+@query_budget(8)
+def export_job_status(request, job_id):
+    """Geeft de voortgang van een exporttaak terug als JSON (wordt gepolld door export.html)."""
+    job = get_object_or_404(
+        ExportJob, id=job_id, company=request.tenant.company, created_by=request.user
+    )
 
-        # Response voor download
-        filename = f"urenexport_{timezone.now().strftime('%Y%m%d_%H%M')}.xlsx"
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    if job.status == ExportJob.STATUS_DONE and job.expires_at and job.expires_at < timezone.now():
+        job.status = ExportJob.STATUS_EXPIRED
+        job.save(update_fields=["status"])
+
+    payload = {
+        "id": job.pk,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "progress": job.progress,
+        "processed_rows": job.processed_rows,
+        "total_rows": job.total_rows,
+        "error": job.error,
+        "download_url": None,
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        payload["download_url"] = reverse("eventaflow:export_job_download", args=[job.pk])
+    return JsonResponse(payload)
+
+
+@login_required
+@query_budget(8)
+def download_export_job(request, job_id):
+    """Download van een afgewerkte export. Het bestand kan maar één keer opgehaald worden."""
+    job = get_object_or_404(
+        ExportJob, id=job_id, company=request.tenant.company, created_by=request.user
+    )
+
+    # Claim de download atomair zodat een tweede (gelijktijdige) download niets meer krijgt
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(
+        pk=job.pk, status=ExportJob.STATUS_DONE, expires_at__gt=now
+    ).update(status=ExportJob.STATUS_DOWNLOADED, downloaded_at=now)
+    if not claimed or not job.file:
+        return HttpResponseGone("Deze export is al gedownload of verlopen.")
+
+    export_format = EXPORT_FORMATS[export_params(job.params)["format"]]
+    file_name = job.file.name
+    response = file_response(
+        request,
+        job.file.open("rb"),
+        export_filename(export_format, job.created_at),
+        export_format.content_type,
+    )
+
+    # Het open bestand blijft leesbaar; het verdwijnt van schijf zodra de download klaar is
+    job.file.storage.delete(file_name)
+    ExportJob.objects.filter(pk=job.pk).update(file="")
+    return response
+
+
+# 4.2 Samenvatting van de uren als JSON (voor dashboards en BI-tools)
+class TimesheetSummaryView(TenantObjectMixin, View):
+    """Uren gegroepeerd op klant, project, gebruiker, divisie, todo, dag, week of maand.
+
+    Voorbeeld: /api/summary/?group_by=customer,month&start_date=2026-01-01
+    """
+
+    query_budget = 8
+
+    def get(self, request):
+        try:
+            params = summary_params(request.GET)
+        except SummaryError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(get_summary(request.tenant.company, params))
+
+
+# 4.3 Overzicht van de tijdregistraties, met keyset paginatie
+class TimeEntryListView(TenantObjectMixin, View):
+    template_name = "dashboard/time_entries.html"
+    query_budget = 14
+
+    def get(self, request):
+        company = request.tenant.company
+        filters = {field: request.GET.get(field, "") for field in ("project", "user", "page_size")}
+
+        entries = TimeRegistry.objects.select_related(
+            "user", "project", "project__customer"
         )
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        wb.save(response)
+        if filters["project"].isdigit():
+            entries = entries.filter(project_id=filters["project"])
+        if filters["user"].isdigit():
+            entries = entries.filter(user_id=filters["user"])
 
-        return response
+        cursor = request.GET.get("cursor")
+        try:
+            page, next_cursor = keyset_page(entries, cursor, page_size_from(filters["page_size"]))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Ongeldige cursor")
+        BillingEngine().annotate(page)
+
+        query = {field: value for field, value in filters.items() if value}
+        next_page_query = urllib.parse.urlencode({**query, "cursor": next_cursor})
+        return render(
+            request,
+            self.template_name,
+            {
+                "entries": page,
+                "cursor": cursor,
+                "filters": filters,
+                "reference": tenant_reference_data(company),
+                "first_page_query": urllib.parse.urlencode(query),
+                "next_page_query": next_page_query if next_cursor else None,
+            },
+        )
 
 
 # 5. NIEUW: Aparte View voor Gebruiker Registratie
@@ -358,6 +582,7 @@ class RegisterUserView(View):
     """Maakt alleen een User en UserProfile aan, logt in en stuurt door."""
 
     template_name = "registration/login.html"
+    query_budget = 18
 
     def post(self, request):
         # Haal data uit de rechterkolom van login.html
@@ -406,18 +631,19 @@ class CompanySelectionView(LoginRequiredMixin, ListView):
     model = Company
     template_name = "companies/select_company.html"
     context_object_name = "companies"
+    query_budget = 8
 
     def get_queryset(self):
         return self.request.user.companies.all()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        profile = getattr(self.request.user, "profile", None)
-        context["active_company"] = getattr(profile, "company", None) if profile else None
+        context["active_company"] = self.request.tenant.company
         return context
 
 
 @login_required
+@query_budget(8)
 def switch_company(request, company_id):
     # Check of het bedrijf bestaat EN of de user lid is (members)
     # Dit is belangrijk voor de beveiliging!
@@ -439,6 +665,7 @@ class CompanyCreateView(LoginRequiredMixin, CreateView):
     fields = ["name"]
     template_name = "companies/create_company.html"
     success_url = reverse_lazy("eventaflow:dashboard")
+    query_budget = 13
 
     def form_valid(self, form):
         try:
@@ -475,32 +702,33 @@ class CompanyCreateView(LoginRequiredMixin, CreateView):
 
 class CompanyDetailView(LoginRequiredMixin, View):
     template_name = "companies/company_detail.html"
+    query_budget = 15
 
     def get_context_data(self, company):
         """Helper-methode om de context op te bouwen voor de template."""
         return {
             "company": company,
             "company_employees": UserProfile.objects.filter(company=company),
-            "divisies": Divisies.objects.filter(company=company),
+            "divisies": Divisies.objects.all(),
             "google_configured": bool(company.google_client_id and company.google_client_secret),
             "google_authorized": bool(company.google_oauth_token),
         }
 
     def get(self, request):
-        company = request.user.profile.company
+        company = request.tenant.company
         if not company:
             messages.error(request, "Je bent niet gekoppeld aan een bedrijf.")
             return redirect("eventaflow:dashboard")
         return render(request, self.template_name, self.get_context_data(company))
 
     def post(self, request):
-        company = request.user.profile.company
+        company = request.tenant.company
         if not company:
             messages.error(request, "Je bent niet gekoppeld aan een bedrijf.")
             return redirect("eventaflow:dashboard")
 
         # Controleer of de gebruiker superuser is OF de rol van company admin heeft
-        is_admin = request.user.profile.is_company_admin or request.user.is_superuser
+        is_admin = request.tenant.is_admin
         if not is_admin:
             messages.error(request, "Je hebt geen rechten om deze actie uit te voeren.")
             return render(request, self.template_name, self.get_context_data(company))
@@ -568,9 +796,7 @@ class CompanyDetailView(LoginRequiredMixin, View):
             else:
                 try:
                     with transaction.atomic():
-                        if Divisies.objects.filter(
-                            company=company, divisie_name__iexact=divisie_name
-                        ).exists():
+                        if Divisies.objects.filter(divisie_name__iexact=divisie_name).exists():
                             messages.warning(request, f"Divisie '{divisie_name}' bestaat al.")
                         else:
                             Divisies.objects.create(divisie_name=divisie_name, company=company)
@@ -582,7 +808,7 @@ class CompanyDetailView(LoginRequiredMixin, View):
         elif "remove_divisie" in request.POST:
             divisie_id = request.POST.get("remove_divisie")
             try:
-                divisie = Divisies.objects.get(id=divisie_id, company=company)
+                divisie = Divisies.objects.get(id=divisie_id)
                 divisie_name = divisie.divisie_name
                 divisie.delete()
                 messages.success(request, f"Divisie '{divisie_name}' is verwijderd.")
@@ -628,6 +854,7 @@ class CompanyDetailView(LoginRequiredMixin, View):
 # 6. Uitloggen
 class LoginView(RedirectView):
     url = reverse_lazy("login")
+    query_budget = 4
 
     def get(self, request, *args, **kwargs):
         logout(request)
@@ -642,6 +869,7 @@ class AuthLoginView(DjangoLoginView):
     users to change their password if desired.
     """
     template_name = "registration/login.html"
+    query_budget = 10
 
     def form_valid(self, form):
         user = form.get_user()
@@ -661,17 +889,16 @@ class AuthLoginView(DjangoLoginView):
 
 
 # 1.1 View om de timer te starten
+@query_budget(10)
 def start_timer(request):
     if request.method == "POST":
         # We gebruiken de database 'id' uit het <select> element
         project_pk = request.POST.get("project")
         if project_pk:
-            project = get_object_or_404(
-                Project, pk=project_pk, company=request.user.profile.company
-            )
+            project = get_object_or_404(Project, pk=project_pk)
 
-            # Voorkom dubbele actieve timers
-            active_timer = TimeRegistry.objects.filter(
+            # Voorkom dubbele actieve timers (over de bedrijven heen)
+            active_timer = TimeRegistry.unscoped.filter(
                 user=request.user, end_time__isnull=True
             ).exists()
 
@@ -679,7 +906,7 @@ def start_timer(request):
                 TimeRegistry.objects.create(
                     user=request.user,
                     project=project,
-                    company=request.user.profile.company,
+                    company=request.tenant.company,
                     description=request.POST.get("description"),
                     start_time=timezone.now(),
                 )
@@ -687,34 +914,49 @@ def start_timer(request):
 
 
 # 1.2 View om de timer te stoppen
+@query_budget(18)
 def stop_timer(request, timer_id):
     # Alleen stoppen via POST voor de veiligheid (tegen 405 errors)
     if request.method == "POST":
-        timer = get_object_or_404(TimeRegistry, id=timer_id, user=request.user)
-        timer.end_time = timezone.now()
+        timer = get_object_or_404(TimeRegistry.unscoped, id=timer_id, user=request.user)
+        end_time = timezone.now()
+        # Eén indexquery in plaats van alle registraties van de gebruiker te overlopen
+        if TimeRegistry.unscoped.overlapping(request.user.pk, timer.start_time, end_time).exists():
+            messages.error(
+                request,
+                "De timer overlapt met een andere registratie. Pas die eerst aan.",
+            )
+            return redirect("eventaflow:dashboard")
+        timer.end_time = end_time
         timer.description = request.POST.get("description")
-        timer.save()
+        try:
+            with transaction.atomic():
+                timer.save()
+        except IntegrityError as e:
+            if is_overlap_violation(e):
+                # Een registratie die na de controle hierboven aangemaakt werd
+                messages.error(
+                    request,
+                    "De timer overlapt met een andere registratie. Pas die eerst aan.",
+                )
+            else:
+                logger.error(f"Timer {timer.pk} stoppen mislukt: {e}")
+                messages.error(request, "De timer kon niet gestopt worden.")
     return redirect("eventaflow:dashboard")
 
 
 # 5. To-Do List View
-class TodoListView(LoginRequiredMixin, View):
+class TodoListView(TenantObjectMixin, View):
     """View voor het beheren van taken (to-do's) met edit-functionaliteit via URL parameters."""
 
     template_name = "dashboard/to-do-beheer.html"
+    query_budget = 20
 
-    def get_context_data(self, request):
-        company = request.user.profile.company
-
-        # Haal basisgegevens op voor dropdowns
-        customers = Customer.objects.filter(company=company)
-        projects = Project.objects.filter(company=company)
-        divisies = Divisies.objects.filter(company=company)
-        milestone = Milstones.objects.filter(company=company)
-        company_members = company.members.all()
+    def get_loaders(self, request):
+        company = request.tenant.company
 
         # Filtering logica voor de linkerlijst
-        todos = Todo.objects.filter(company=company).select_related(
+        todos = Todo.objects.select_related(
             "user", "project_id", "customer_id"
         )
 
@@ -744,35 +986,41 @@ class TodoListView(LoginRequiredMixin, View):
         todos = todos.order_by("-created_at")
 
         # Bewerkingslogica: check of er een ?edit=ID parameter is
-        form_instance = None
         edit_id = request.GET.get("edit")
-        if edit_id:
+
+        def load_form():
             # We filteren op company om te zorgen dat gebruikers
             # geen taken van andere bedrijven kunnen editen
-            form_instance = get_object_or_404(Todo, id=edit_id, company=company)
+            form_instance = (
+                get_object_or_404(Todo, id=edit_id) if edit_id else None
+            )
+            return TodoForm(instance=form_instance)
 
         return {
-            "customers": customers,
-            "projects": projects,
-            "divisies": divisies,
-            "company_members": company_members,
-            "todos": todos,
-            "milestone": milestone,
-            "form": TodoForm(instance=form_instance),
-            "edit_id": edit_id,
+            # Keuzelijsten voor de filters en het formulier
+            "reference": lambda: tenant_reference_data(company),
+            "todos": lambda: list(todos),
+            "form": load_form,
         }
 
-    def get(self, request):
-        context = self.get_context_data(request)
-        return render(request, self.template_name, context)
+    def get_context_data(self, request):
+        return {**run_loaders(self.get_loaders(request)), "edit_id": request.GET.get("edit")}
 
-    def post(self, request):
+    async def get(self, request):
+        context = await gather_loaders(self.get_loaders(request))
+        context["edit_id"] = request.GET.get("edit")
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    async def post(self, request):
+        return await sync_to_async(self._post)(request)
+
+    def _post(self, request):
         # Check of we een bestaande taak updaten (verborgen 'id' veld in HTML)
         todo_id = request.POST.get("id")
-        company = request.user.profile.company
+        company = request.tenant.company
 
         if todo_id:
-            instance = get_object_or_404(Todo, id=todo_id, company=company)
+            instance = get_object_or_404(Todo, id=todo_id)
             form = TodoForm(request.POST, instance=instance)
         else:
             form = TodoForm(request.POST)
@@ -803,10 +1051,11 @@ class TodoListView(LoginRequiredMixin, View):
 
 # 6. Toggle Todo Completion Status
 @login_required
+@query_budget(9)
 def toggle_todo(request, todo_id):
     """Toggle de completion status van een taak"""
     if request.method == "POST":
-        todo = get_object_or_404(Todo, id=todo_id, company=request.user.profile.company)
+        todo = get_object_or_404(Todo, id=todo_id)
         todo.is_completed = not todo.is_completed
         todo.save()
         messages.success(request, "Taak status bijgewerkt!")
@@ -816,26 +1065,79 @@ def toggle_todo(request, todo_id):
     return redirect(referer)
 
 
+# 6.1 Voltooid-status zetten zonder de pagina te herladen (JSON, gebruikt door de vinkjes)
+def _set_completion(request, model, pk):
+    """Zet is_completed van één taak of milestone met één UPDATE en geeft de rij als JSON.
+
+    De pagina stuurt de nieuwe status mee (`is_completed=true|false`) in plaats van
+    om te wisselen: een dubbele klik of een herhaalde aanvraag geeft zo geen
+    verrassingen. QuerySet.update() verstuurt geen post_save; de cache-generatie
+    wordt daarom hier verhoogd.
+    """
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    value = request.POST.get("is_completed")
+    if value not in ("true", "false"):
+        return HttpResponseBadRequest("is_completed moet true of false zijn")
+
+    company_id = request.tenant.company_id
+    is_completed = value == "true"
+    if not model.objects.filter(id=pk, company_id=company_id).update(is_completed=is_completed):
+        raise Http404
+    bump_generation_on_commit(company_id, model)
+    if model is Todo:
+        publish_on_commit(company_id, todo_event(pk, is_completed))
+    return JsonResponse({"id": pk, "is_completed": is_completed})
+
+
+@login_required
+@query_budget(8)
+def set_todo_completion(request, todo_id):
+    return _set_completion(request, Todo, todo_id)
+
+
+@login_required
+@query_budget(8)
+def set_milestone_completion(request, milestone_id):
+    return _set_completion(request, Milstones, milestone_id)
+
+
+# 6.2 Live-updates (server-sent events) voor het dashboard en de takenlijst
+@login_required
+@query_budget(8)
+async def live_events(request):
+    """Stream met de timer- en taakwijzigingen van het eigen bedrijf (zie `live`)."""
+    if not isinstance(request, ASGIRequest):
+        # Onder WSGI zou de stream een worker blokkeren; 204 laat EventSource stoppen
+        return HttpResponse(status=204)
+    # request.tenant is al opgehaald door de middleware (zie `middleware`)
+    company_id = request.tenant.company_id
+    if company_id is None:
+        return HttpResponseBadRequest("Geen bedrijf gekoppeld.")
+
+    response = StreamingHttpResponse(event_stream(company_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Niet bufferen in een proxy, anders komen events pas laat aan
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 # 7. Google Docs Management View
 
 
 # 8. Milestones View (Vergelijkbaar met TodoListView maar dan voor Milestones)
-class MilestonesView(LoginRequiredMixin, View):
+class MilestonesView(TenantObjectMixin, View):
     """View voor het beheren van taken Milestones met edit-functionaliteit via URL parameters."""
 
     template_name = "dashboard/milestones.html"
+    query_budget = 15
 
-    def get(self, request):
-        company = request.user.profile.company
-
-        # Haal basisgegevens op voor dropdowns
-        projects = Project.objects.filter(company=company)
-        divisies = Divisies.objects.filter(company=company)
+    def get_loaders(self, request):
+        company = request.tenant.company
 
         # Filtering logica voor de linkerlijst
         milestones = (
-            Milstones.objects.filter(company=company)
-            .select_related("project", "divisie")
+            Milstones.objects.select_related("project", "divisie")
             .annotate(
                 total_todos=Count("todos"),
                 completed_todos=Sum(
@@ -865,30 +1167,39 @@ class MilestonesView(LoginRequiredMixin, View):
         milestones = milestones.order_by("-created_at")
 
         # Bewerkingslogica: check of er een ?edit=ID parameter is
-        form_instance = None
         edit_id = request.GET.get("edit")
-        if edit_id:
-            form_instance = get_object_or_404(Milstones, id=edit_id, company=company)
 
-        return render(
-            request,
-            self.template_name,
-            context={
-                "projects": projects,
-                "divisies": divisies,
-                "milestones": milestones,
-                "form": MilestoneForm(instance=form_instance),
-                "edit_id": edit_id,
-            },
-        )
+        def load_form():
+            form_instance = (
+                get_object_or_404(Milstones, id=edit_id) if edit_id else None
+            )
+            return MilestoneForm(instance=form_instance)
 
-    def post(self, request):
+        return {
+            # Keuzelijsten voor de filters en het formulier
+            "reference": lambda: tenant_reference_data(company),
+            "milestones": lambda: list(milestones),
+            "form": load_form,
+        }
+
+    def get_context_data(self, request):
+        return {**run_loaders(self.get_loaders(request)), "edit_id": request.GET.get("edit")}
+
+    async def get(self, request):
+        context = await gather_loaders(self.get_loaders(request))
+        context["edit_id"] = request.GET.get("edit")
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    async def post(self, request):
+        return await sync_to_async(self._post)(request)
+
+    def _post(self, request):
         # Check of we een bestaande taak updaten (verborgen 'id' veld in HTML)
         milestone_id = request.POST.get("id")
-        company = request.user.profile.company
+        company = request.tenant.company
 
         if milestone_id:
-            instance = get_object_or_404(Milstones, id=milestone_id, company=company)
+            instance = get_object_or_404(Milstones, id=milestone_id)
             form = MilestoneForm(request.POST, instance=instance)
         else:
             form = MilestoneForm(request.POST)
@@ -905,51 +1216,22 @@ class MilestonesView(LoginRequiredMixin, View):
                     return redirect("eventaflow:milestone_list")
                 else:
                     messages.error(request, "Er staan fouten in het formulier.")
-                    context = self._get_context(request)
+                    context = self.get_context_data(request)
                     context["form"] = form
                     return render(request, self.template_name, context)
         except Exception as e:
             messages.error(request, f"Technische fout: {e}")
-            context = self._get_context(request)
+            context = self.get_context_data(request)
             return render(request, self.template_name, context)
 
-    def _get_context(self, request):
-        """Helper method to get context data for rendering the template."""
-        company = request.user.profile.company
-        projects = Project.objects.filter(company=company)
-        divisies = Divisies.objects.filter(company=company)
-        milestones = (
-            Milstones.objects.filter(company=company)
-            .select_related("project", "divisie")
-            .annotate(
-                total_todos=Count("todos"),
-                completed_todos=Sum(
-                    Case(
-                        When(todos__is_completed=True, then=Value(1)),
-                        default=Value(0),
-                        output_field=IntegerField(),
-                    )
-                ),
-            )
-            .order_by("-created_at")
-        )
-
-        return {
-            "projects": projects,
-            "divisies": divisies,
-            "milestones": milestones,
-            "form": MilestoneForm(),
-        }
-
 
 # 8.1. Toggle Milestone Completion Status
 @login_required
+@query_budget(9)
 def toggle_milestone(request, milestone_id):
     """Toggle de completion status van een milestone"""
     if request.method == "POST":
-        milestone = get_object_or_404(
-            Milstones, id=milestone_id, company=request.user.profile.company
-        )
+        milestone = get_object_or_404(Milstones, id=milestone_id)
         milestone.is_completed = not milestone.is_completed
         milestone.save()
         messages.success(request, "Milestone status bijgewerkt!")
@@ -958,6 +1240,7 @@ def toggle_milestone(request, milestone_id):
 
 
 @login_required
+@query_budget(6)
 def create_doc_view(request):
     """
     View om direct een nieuw, leeg Google Doc aan te maken voor het actieve bedrijf.
@@ -988,6 +1271,7 @@ def create_doc_view(request):
 
 
 @login_required
+@query_budget(6)
 def upload_file_view(request):
     """
     View die een lokaal bestand (Word, Excel, PDF) accepteert,
@@ -1028,6 +1312,7 @@ def upload_file_view(request):
 
 
 @login_required
+@query_budget(6)
 def view_document(request, doc_id):
     """
     Toont het bestand in de template.
@@ -1071,19 +1356,20 @@ def view_document(request, doc_id):
 
 
 @login_required
+@query_budget(8)
 def google_settings_view(request):
     """
     Instellingenpagina (gebaseerd op google_settings.html) waar gebruikers met de juiste
     rechten de Google OAuth credentials kunnen beheren en autoriseren.
     """
-    company = request.user.profile.company
+    company = request.tenant.company
     if not company:
         messages.error(request, "Je bent niet gekoppeld aan een bedrijf.")
         return redirect("eventaflow:dashboard")
 
     # Beveiliging: Iedereen binnen het bedrijf mag de status zien,
     # maar alleen admins/superusers mogen POST-wijzigingen doorvoeren.
-    is_admin = request.user.profile.is_company_admin or request.user.is_superuser
+    is_admin = request.tenant.is_admin
 
     if request.method == "POST":
         if not is_admin:
@@ -1117,12 +1403,13 @@ def google_settings_view(request):
 
 
 @login_required
+@query_budget(6)
 def google_authorize_start(request):
     """
     Genereert de autorisatie-URL voor Google en start de flow.
     We voegen hier een cryptografisch veilige 'state' parameter toe om CSRF-aanvallen te voorkomen.
     """
-    company = request.user.profile.company
+    company = request.tenant.company
     if not company:
         return HttpResponseBadRequest("Geen bedrijf gekoppeld.")
 
@@ -1156,11 +1443,12 @@ def google_authorize_start(request):
 
 
 @login_required
+@query_budget(8)
 def google_authorize_callback(request):
     """
     Callback view waar we de 'state' verifiëren en de autorisatiecode inwisselen voor tokens.
     """
-    company = request.user.profile.company
+    company = request.tenant.company
     code = request.GET.get("code")
     returned_state = request.GET.get("state")
     session_state = request.session.pop("oauth_state", None)
@@ -1213,20 +1501,21 @@ def google_authorize_callback(request):
 
 
 @login_required
+@query_budget(8)
 def generate_project_api_token(request, project_id):
     """Generate an API token for a project and email it to the provided address.
 
     POST params: `email` (recipient), `single_use` (optional)
     """
-    company = request.user.profile.company
+    company = request.tenant.company
     if not company:
         return HttpResponseBadRequest("No company")
 
     # only company admins may generate tokens
-    if not (request.user.profile.is_company_admin or request.user.is_superuser):
+    if not request.tenant.is_admin:
         return HttpResponseForbidden("Not allowed")
 
-    project = get_object_or_404(Project, id=project_id, company=company)
+    project = get_object_or_404(Project, id=project_id)
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
 
@@ -1275,41 +1564,89 @@ def _get_token_from_request(request):
     return request.GET.get("token") or request.POST.get("token")
 
 
-def api_project_status(request):
-    """Return project status as JSON when a valid token is supplied.
+def _authenticate_project_token(request):
+    """Validate the project token of an API request.
 
-    Accepts token via `Authorization: Token <key>` header or `?token=` query param.
+    Returns `(token, None)` when the token is valid for the requested `project_id`,
+    or `(None, response)` with the error response to return.
     """
     token_key = _get_token_from_request(request)
     project_id = request.GET.get("project_id") or request.POST.get("project_id")
     if not token_key or not project_id:
-        return HttpResponseForbidden("token and project_id required")
+        return None, HttpResponseForbidden("token and project_id required")
 
     try:
-        token = APIToken.objects.get(key=token_key, is_active=True)
+        token = APIToken.objects.select_related("project").get(key=token_key, is_active=True)
     except APIToken.DoesNotExist:
-        return HttpResponseForbidden("invalid token")
+        return None, HttpResponseForbidden("invalid token")
 
     # check expiry
     if token.expires_at and timezone.now() > token.expires_at:
-        return HttpResponseForbidden("token expired")
+        return None, HttpResponseForbidden("token expired")
 
     if str(token.project.id) != str(project_id):
-        return HttpResponseForbidden("project mismatch")
+        return None, HttpResponseForbidden("project mismatch")
+
+    return token, None
+
 
+def _project_token_view(view):
+    """Decorator voor de API met projecttoken: authenticeert en geeft het token mee.
+
+    De request heeft geen ingelogde gebruiker en dus geen tenant; de view loopt in
+    de tenant-context van het bedrijf van het token (zie `managers`).
+    """
+
+    @wraps(view)
+    def wrapper(request):
+        token, error = _authenticate_project_token(request)
+        if error:
+            return error
+        with tenant_context(token.company_id):
+            return view(request, token)
+
+    return wrapper
+
+
+def _record_token_usage(request, token):
+    try:
+        remote_ip = request.META.get("HTTP_X_FORWARDED_FOR", request.META.get("REMOTE_ADDR"))
+        user_agent = request.META.get("HTTP_USER_AGENT", "")
+        APITokenUsage.objects.create(token=token, remote_ip=remote_ip, user_agent=user_agent)
+    except Exception:
+        logger.exception("Failed to record token usage")
+
+
+def _time_entry_payload(entry):
+    """JSON representation of a time entry annotated by `BillingEngine.annotate()`."""
+    return {
+        "id": entry.id,
+        "user": entry.user.username,
+        "start_time": entry.start_time.isoformat(),
+        "end_time": entry.end_time.isoformat() if entry.end_time else None,
+        "duration_hours": entry.billed_hours,
+        "description": entry.description,
+        "updated_at": entry.updated_at.isoformat(),
+    }
+
+
+@_project_token_view
+@query_budget(10)
+def api_project_status(request, token):
+    """Return project status as JSON when a valid token is supplied.
+
+    Accepts token via `Authorization: Token <key>` header or `?token=` query param.
+    """
     project = token.project
 
-    # Build a simple status payload
-    time_entries = TimeRegistry.objects.filter(project=project).order_by("-start_time")[:20]
-    entries = [
-        {
-            "user": t.user.username,
-            "start_time": t.start_time.isoformat(),
-            "end_time": t.end_time.isoformat() if t.end_time else None,
-            "description": t.description,
-        }
-        for t in time_entries
-    ]
+    # Build a simple status payload; the full list is available via api_time_entries
+    time_entries, _ = keyset_page(
+        TimeRegistry.objects.filter(project=project).select_related("user", "project"),
+        page_size=20,
+    )
+    entries = [_time_entry_payload(t) for t in BillingEngine().annotate(time_entries)]
+    # Budget en verbruik uit de gecachte burn-down, niet uit de registraties
+    burn = project_burn(project)
 
     payload = {
         "project": {
@@ -1317,17 +1654,19 @@ def api_project_status(request):
             "name": project.project_name,
             "description": project.project_description,
             "is_active": project.is_active,
+            "total_hours": burn["burned_hours"],
+            "budget_hours": burn["budget_hours"],
+            "remaining_hours": burn["remaining_hours"],
+            "burned_percent": burn["burned_percent"],
         },
+        "burndown": burn["series"],
         "recent_time_entries": entries,
+        "time_entries_url": reverse("eventaflow:api_time_entries"),
+        "time_entry_changes_url": reverse("eventaflow:api_time_entry_changes"),
     }
 
     # record usage
-    try:
-        remote_ip = request.META.get("HTTP_X_FORWARDED_FOR", request.META.get("REMOTE_ADDR"))
-        user_agent = request.META.get("HTTP_USER_AGENT", "")
-        APITokenUsage.objects.create(token=token, remote_ip=remote_ip, user_agent=user_agent)
-    except Exception:
-        logger.exception("Failed to record token usage")
+    _record_token_usage(request, token)
 
     # include todos and milestones for the project
     todos_qs = Todo.objects.filter(project_id=project).order_by("-created_at")[:50]
@@ -1361,7 +1700,70 @@ def api_project_status(request):
     return JsonResponse(payload)
 
 
+@_project_token_view
+@query_budget(7)
+def api_time_entries(request, token):
+    """Return the time entries of a project, newest first, one page at a time.
+
+    Same token rules as `api_project_status`. Pass the `next_cursor` of a response as
+    `?cursor=` to get the next page; it is null on the last page. A single-use token
+    stays valid until the last page has been fetched.
+    """
+    entries = TimeRegistry.objects.filter(project=token.project).select_related("user", "project")
+    try:
+        page, next_cursor = keyset_page(
+            entries, request.GET.get("cursor"), page_size_from(request.GET.get("page_size"))
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("invalid cursor")
+
+    _record_token_usage(request, token)
+    if next_cursor is None:
+        token.mark_used()
+
+    return JsonResponse(
+        {
+            "results": [_time_entry_payload(t) for t in BillingEngine().annotate(page)],
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@_project_token_view
+@query_budget(8)
+def api_time_entry_changes(request, token):
+    """Return the time entries of a project changed or deleted since a cursor.
+
+    Same token rules as `api_project_status`. Without `?cursor=` the feed starts with
+    all entries (full sync). Keep the `next_cursor` of every response for the next
+    sync; while `has_more` is true, fetch again right away. A cursor older than the
+    tombstone retention gets 410 Gone: start over with a full sync.
+    """
+    try:
+        page = changes_page(
+            token.project, request.GET.get("cursor"), page_size_from(request.GET.get("page_size"))
+        )
+    except CursorExpired:
+        return JsonResponse({"error": "cursor expired, full sync required"}, status=410)
+    except InvalidCursor:
+        return HttpResponseBadRequest("invalid cursor")
+
+    _record_token_usage(request, token)
+    if not page.has_more:
+        token.mark_used()
+
+    return JsonResponse(
+        {
+            "changed": [_time_entry_payload(t) for t in BillingEngine().annotate(page.changed)],
+            "deleted": page.deleted,
+            "next_cursor": page.next_cursor,
+            "has_more": page.has_more,
+        }
+    )
+
+
 @csrf_exempt
+@query_budget(6)
 def generate_project_api_token_api(request, project_id):
     """Programmatic endpoint to generate an API token for a project.
 
@@ -1387,7 +1789,8 @@ def generate_project_api_token_api(request, project_id):
     if not recipient:
         return HttpResponseBadRequest("email required")
 
-    project = get_object_or_404(Project, id=project_id)
+    # De app-sleutel geeft toegang tot de projecten van alle bedrijven
+    project = get_object_or_404(Project.unscoped, id=project_id)
 
     key = APIToken.generate_key()
     token = APIToken.objects.create(
@@ -1418,14 +1821,15 @@ def generate_project_api_token_api(request, project_id):
 
 
 @login_required
+@query_budget(10)
 def google_docs_view(request):
     """
     Hoofdscherm voor documentenbeheer binnen de gekoppelde divisies en mappen.
     Vangt eventuele ingetrokken tokens (Revocation) netjes op.
     """
-    company = request.user.profile.company
-    divisies = Divisies.objects.filter(company=company)
-    docs = GoogleDocument.objects.filter(company=company)
+    company = request.tenant.company
+    divisies = Divisies.objects.all()
+    docs = GoogleDocument.objects.all()
 
     iframe_url = None
     is_configured = bool(
@@ -1555,7 +1959,7 @@ def google_docs_view(request):
 
         elif action == "create_division_folder":
             divisie_pk = request.POST.get("divisie_pk")
-            divisie = get_object_or_404(Divisies, pk=divisie_pk, company=company)
+            divisie = get_object_or_404(Divisies, pk=divisie_pk)
 
             folder_id = service.create_folder(name=divisie.divisie_name, share_with_members=True)
             if folder_id:
@@ -1576,7 +1980,7 @@ def google_docs_view(request):
 
             parent_folder_id = None
             if divisie_pk:
-                divisie = get_object_or_404(Divisies, pk=divisie_pk, company=company)
+                divisie = get_object_or_404(Divisies, pk=divisie_pk)
                 parent_folder_id = divisie.google_drive_folder_id
 
             google_file_id = service.create_empty_google_doc(
@@ -1602,7 +2006,7 @@ def google_docs_view(request):
 
             parent_folder_id = None
             if divisie_pk:
-                divisie = get_object_or_404(Divisies, pk=divisie_pk, company=company)
+                divisie = get_object_or_404(Divisies, pk=divisie_pk)
                 parent_folder_id = divisie.google_drive_folder_id
 
             google_file_id, file_type = service.upload_and_convert_file(
@@ -1627,13 +2031,13 @@ def google_docs_view(request):
 
         elif action == "open":
             doc_pk = request.POST.get("doc_pk")
-            doc = get_object_or_404(GoogleDocument, pk=doc_pk, company=company)
+            doc = get_object_or_404(GoogleDocument, pk=doc_pk)
             service.share_file_with_user(doc.google_file_id, request.user.email, role="writer")
             iframe_url = service.get_iframe_url(doc.google_file_id, doc.file_type, mode="edit")
         """
         elif action == "share":
             doc_pk = requests.request.POST.get("doc_pk")
-            doc = get_object_or_404(GoogleDocument, pk=doc_pk, company=company)
+            doc = get_object_or_404(GoogleDocument, pk=doc_pk)
             service.share_folder_with_company_members(doc.google_file_id, role='writer')
             messages.success(request, f"'{doc.title}' is gedeeld met alle collega's.")
             return redirect('eventaflow:google_docs')
@@ -1643,6 +2047,6 @@ def google_docs_view(request):
         "docs": docs,
         "iframe_url": iframe_url,
         "is_configured": is_configured,
-        "is_admin": request.user.profile.is_company_admin or request.user.is_superuser,
+        "is_admin": request.tenant.is_admin,
     }
     return render(request, "dashboard/google_docs.html", context)